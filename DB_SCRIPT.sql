@@ -208,10 +208,14 @@ CREATE TABLE "Паспорт"
   "Дата выдачи" Date NOT NULL,
   "Кем выдан" Character varying(50) NOT NULL,
   "Актуальность" Boolean NOT NULL,
-  "ID пользователя" Integer NOT NULL
+  "ID пользователя" Integer NOT NULL,
+  -- Аренда верификатором (POST /api/verifier/passports/claim)
+  "ID верификатора" Integer,
+  "Аренда до" Timestamptz
 )
 WITH (autovacuum_enabled=true);
 ALTER TABLE "Паспорт" ADD CONSTRAINT "Unique_Identifier16" PRIMARY KEY ("ID паспорта","ID пользователя");
+CREATE INDEX "IX_Паспорт_пользователь" ON "Паспорт" ("ID пользователя");
 
 CREATE OR REPLACE FUNCTION trg_validate_passport_data()
 RETURNS TRIGGER AS $$
@@ -638,11 +642,25 @@ CREATE TABLE "Предложение"
   "ID ценной бумаги" Integer NOT NULL,
   "ID брокерского счёта" Integer NOT NULL,
   "ID типа предложения" Integer NOT NULL,
-  "ID статуса предложения" Integer NOT NULL
+  "ID статуса предложения" Integer NOT NULL,
+  -- Аренда брокером (POST /api/broker/proposal/claim): до "Аренда до"
+  -- предложение не выдаётся другим брокерам; истёкшая аренда свободна
+  "ID брокера" Integer,
+  "Аренда до" Timestamptz,
+  -- Лимитная заявка: ждёт (статус "Ожидает цены"), пока цена не станет
+  -- не выше лимита для покупки или не ниже - для продажи
+  "Лимитная цена" Numeric(12,2) CHECK ("Лимитная цена" > 0)
 )
 WITH (autovacuum_enabled=true);
 CREATE INDEX "IX_Relationship20" ON "Предложение" ("ID ценной бумаги");
 CREATE INDEX "IX_Relationship36" ON "Предложение" ("ID типа предложения");
+-- Очередь брокеров: только активные предложения, в порядке поступления
+CREATE INDEX "IX_Предложение_очередь" ON "Предложение" ("ID предложения")
+    WHERE "ID статуса предложения" = 3;
+-- Срабатывание лимитных заявок при новой цене: один диапазон на сторону
+-- (activate_limit_proposals)
+CREATE INDEX "IX_Предложение_лимит" ON "Предложение" ("ID ценной бумаги", "ID типа предложения", "Лимитная цена")
+    WHERE "ID статуса предложения" = 4;
 ALTER TABLE "Предложение" ADD CONSTRAINT "Unique_Identifier11" PRIMARY KEY ("ID предложения","ID брокерского счёта");
 
 CREATE OR REPLACE FUNCTION trg_check_offer_amounts()
@@ -788,6 +806,33 @@ CREATE TABLE "Уровень прав админа" (
 )
 WITH (autovacuum_enabled=true);
 
+-- Очередь фоновых задач (db/jobs.py). "Этап" и "Курсор" - место, с которого
+-- продолжается выполнение; фиксируются вместе с каждой порцией работы.
+-- "Попытка" растёт при каждом захвате задачи воркером и защищает от записи
+-- воркером, у которого задачу уже забрали.
+CREATE TABLE "Фоновая задача" (
+    "ID задачи" Serial PRIMARY KEY,
+    "Тип" VARCHAR(50) NOT NULL,
+    "Параметры" JSONB NOT NULL DEFAULT '{}'::jsonb,
+    "Статус" VARCHAR(20) NOT NULL DEFAULT 'queued'
+        CHECK ("Статус" IN ('queued', 'running', 'done', 'failed')),
+    "Этап" VARCHAR(30),
+    "Курсор" BIGINT,
+    "Обработано" BIGINT NOT NULL DEFAULT 0,
+    "Всего" BIGINT,
+    "Попытка" INTEGER NOT NULL DEFAULT 0,
+    "Ошибка" TEXT,
+    "ID сотрудника" INTEGER REFERENCES "Персонал" ("ID сотрудника") ON DELETE SET NULL,
+    "Создана" TIMESTAMPTZ NOT NULL DEFAULT now(),
+    "Начата" TIMESTAMPTZ,
+    "Пульс" TIMESTAMPTZ,
+    "Завершена" TIMESTAMPTZ
+)
+WITH (autovacuum_enabled=true);
+-- Захват: только незавершённые задачи, в порядке постановки
+CREATE INDEX "IX_Фоновая_задача_очередь" ON "Фоновая задача" ("ID задачи")
+    WHERE "Статус" IN ('queued', 'running');
+
 ALTER TABLE "Персонал"
 ADD CONSTRAINT "Relationship56"
 FOREIGN KEY ("ID уровня прав")
@@ -809,6 +854,20 @@ REFERENCES "История операций бр. счёта"("ID операци
 ON UPDATE RESTRICT
 ON DELETE RESTRICT;
 
+ALTER TABLE "Паспорт"
+ADD CONSTRAINT "FK_Passport_Verifier"
+FOREIGN KEY ("ID верификатора")
+REFERENCES "Персонал"("ID сотрудника")
+ON UPDATE RESTRICT
+ON DELETE SET NULL;
+
+ALTER TABLE "Предложение"
+ADD CONSTRAINT "FK_Offer_Broker"
+FOREIGN KEY ("ID брокера")
+REFERENCES "Персонал"("ID сотрудника")
+ON UPDATE RESTRICT
+ON DELETE SET NULL;
+
 ALTER TABLE "Пользователь"
 ADD CONSTRAINT "Relationship55"
 FOREIGN KEY ("ID статуса блокировки")
@@ -978,6 +1037,125 @@ ADD CONSTRAINT "Relationship53"
     ON DELETE RESTRICT
     ON UPDATE RESTRICT;
 
+-- Версии справочных данных для ETag (core.versions), общие для всех
+-- воркеров: по последовательности на ключ таблицы. nextval не блокирует
+-- строк и не вызывает конфликтов сериализации у пишущих транзакций.
+CREATE SEQUENCE public.data_version_price_history;
+CREATE SEQUENCE public.data_version_security;
+CREATE SEQUENCE public.data_version_currency;
+CREATE SEQUENCE public.data_version_currency_rate;
+CREATE SEQUENCE public.data_version_bank;
+CREATE SEQUENCE public.data_version_user;
+CREATE SEQUENCE public.data_version_staff;
+
+-- Уведомления приложения об изменении справочных данных (сброс кэшей и ETag
+-- во всех воркерах). Аргумент триггера - ключ таблицы из core.config.TABLES,
+-- полезная нагрузка - "<ключ>:<новая версия>". Срабатывает один раз на
+-- оператор; NOTIFY доставляется после коммита.
+CREATE OR REPLACE FUNCTION public.trg_notify_data_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_notify(
+        'data_changes',
+        TG_ARGV[0] || ':' || nextval(format('public.%I', 'data_version_' || TG_ARGV[0]))
+    );
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER notify_price_history_change
+    AFTER INSERT OR UPDATE OR DELETE ON public."История цены"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.trg_notify_data_change('price_history');
+
+CREATE TRIGGER notify_security_change
+    AFTER INSERT OR UPDATE OR DELETE ON public."Список ценных бумаг"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.trg_notify_data_change('security');
+
+CREATE TRIGGER notify_currency_change
+    AFTER INSERT OR UPDATE OR DELETE ON public."Список валют"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.trg_notify_data_change('currency');
+
+CREATE TRIGGER notify_currency_rate_change
+    AFTER INSERT OR UPDATE OR DELETE ON public."Курсы валют"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.trg_notify_data_change('currency_rate');
+
+CREATE TRIGGER notify_bank_change
+    AFTER INSERT OR UPDATE OR DELETE ON public."Банк"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.trg_notify_data_change('bank');
+
+CREATE TRIGGER notify_user_change
+    AFTER INSERT OR UPDATE OR DELETE ON public."Пользователь"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.trg_notify_data_change('user');
+
+CREATE TRIGGER notify_staff_change
+    AFTER INSERT OR UPDATE OR DELETE ON public."Персонал"
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.trg_notify_data_change('staff');
+
+-- Push-уведомления клиентам (routers/stream_router.py): новая цена бумаги
+-- и смена статуса предложения с ID владельца для адресной доставки.
+CREATE OR REPLACE FUNCTION public.trg_notify_price_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_notify('price_changes', json_build_object(
+        'security_id', NEW."ID ценной бумаги",
+        'price', NEW."Цена",
+        'date', NEW."Дата"
+    )::text);
+    RETURN NULL;
+END;
+$$;
+
+-- Только текущие цены: загрузка истории задним числом (POST
+-- /api/admin/exchange/prices/bulk) не рассылает сотни тысяч событий
+CREATE TRIGGER notify_price_push
+    AFTER INSERT OR UPDATE ON public."История цены"
+    FOR EACH ROW
+    WHEN (NEW."Дата" >= CURRENT_DATE)
+    EXECUTE FUNCTION public.trg_notify_price_change();
+
+CREATE OR REPLACE FUNCTION public.trg_notify_proposal_status()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_user_id integer;
+    v_status varchar;
+BEGIN
+    SELECT "ID пользователя" INTO v_user_id
+    FROM public."Брокерский счёт"
+    WHERE "ID брокерского счёта" = NEW."ID брокерского счёта";
+
+    SELECT "Статус" INTO v_status
+    FROM public."Статус предложения"
+    WHERE "ID статуса" = NEW."ID статуса предложения";
+
+    PERFORM pg_notify('proposal_status_changes', json_build_object(
+        'user_id', v_user_id,
+        'proposal_id', NEW."ID предложения",
+        'status_id', NEW."ID статуса предложения",
+        'status', v_status
+    )::text);
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER notify_proposal_status_push
+    AFTER UPDATE OF "ID статуса предложения" ON public."Предложение"
+    FOR EACH ROW
+    WHEN (OLD."ID статуса предложения" IS DISTINCT FROM NEW."ID статуса предложения")
+    EXECUTE FUNCTION public.trg_notify_proposal_status();
+
 INSERT INTO "Тип операции депозитарного счёта"("Тип")
 VALUES
 ('Покупка'),
@@ -1021,7 +1199,8 @@ INSERT INTO "Статус предложения"("Статус")
 VALUES
 ('Отклонено'),
 ('Одобрено'),
-('На рассмотрении');
+('На рассмотрении'),
+('Ожидает цены');
 
 INSERT INTO "Статус трудоустройства"("Статус трудоустройства")
 VALUES
@@ -1328,8 +1507,10 @@ CREATE OR REPLACE FUNCTION public.change_brokerage_account_balance(
     p_amount numeric,
     p_brokerage_operation_type integer,
     p_staff_id integer,
+    p_user_id integer DEFAULT NULL,
     OUT p_operation_id integer,
-    OUT p_error_message text
+    OUT p_error_message text,
+    OUT p_new_balance numeric
 )
 RETURNS record
 LANGUAGE plpgsql
@@ -1340,6 +1521,7 @@ DECLARE
 BEGIN
     p_operation_id := NULL;
     p_error_message := NULL;
+    p_new_balance := NULL;
 
     PERFORM 1
     FROM public."Тип операции брокерского счёта"
@@ -1357,6 +1539,7 @@ BEGIN
     INTO v_current_balance
     FROM public."Брокерский счёт"
     WHERE "ID брокерского счёта" = p_account_id
+      AND (p_user_id IS NULL OR "ID пользователя" = p_user_id)
     FOR UPDATE;
 
     IF NOT FOUND THEN
@@ -1378,7 +1561,8 @@ BEGIN
 
     UPDATE public."Брокерский счёт"
     SET "Баланс" = "Баланс" + p_amount
-    WHERE "ID брокерского счёта" = p_account_id;
+    WHERE "ID брокерского счёта" = p_account_id
+    RETURNING "Баланс" INTO p_new_balance;
 
     INSERT INTO public."История операций бр. счёта" (
         "Сумма операции",
@@ -1479,27 +1663,38 @@ $BODY$
 LANGUAGE plpgsql VOLATILE;
 
 
+-- Верификация одного паспорта сотрудником p_staff_id. Паспорт, взятый в
+-- работу другим верификатором (аренда из claim_passports не истекла), не
+-- верифицируется - как и в пакетной verify_user_passports.
 CREATE OR REPLACE FUNCTION public.verify_user_passport(
-    p_passport_id integer
+    p_passport_id integer,
+    p_staff_id integer
 )
 RETURNS text
 LANGUAGE plpgsql
 AS $$
 DECLARE
     v_user_id INTEGER;
+    v_verifier_id INTEGER;
+    v_lease_expires_at timestamptz;
     v_deposit_account_id INTEGER;
     v_verified_status_id INTEGER := 2;
-    v_securities RECORD;
 BEGIN
-    SELECT "ID пользователя"
-    INTO v_user_id
-    FROM public."Паспорт"
-    WHERE "ID паспорта" = p_passport_id;
+    SELECT ps."ID пользователя", ps."ID верификатора", ps."Аренда до"
+    INTO v_user_id, v_verifier_id, v_lease_expires_at
+    FROM public."Паспорт" ps
+    JOIN public."Пользователь" u ON u."ID пользователя" = ps."ID пользователя"
+    WHERE ps."ID паспорта" = p_passport_id
+    FOR UPDATE OF ps, u;
 
     IF NOT FOUND THEN
         RETURN format('Паспорт с ID %s не найден', p_passport_id);
     END IF;
 
+    IF v_lease_expires_at > now() AND v_verifier_id IS DISTINCT FROM p_staff_id THEN
+        RETURN format('Паспорт с ID %s взят в работу другим верификатором', p_passport_id);
+    END IF;
+
     SELECT "ID депозитарного счёта"
     INTO v_deposit_account_id
     FROM public."Депозитарный счёт"
@@ -1524,26 +1719,22 @@ BEGIN
     RETURNING "ID депозитарного счёта"
     INTO v_deposit_account_id;
 
-    FOR v_securities IN
-        SELECT "ID ценной бумаги"
-        FROM public."Список ценных бумаг"
-    LOOP
-        INSERT INTO public."Баланс депозитарного счёта" (
-            "Сумма",
-            "ID депозитарного счёта",
-            "ID пользователя",
-            "ID ценной бумаги"
-        )
-        VALUES (
-            0.00,
-            v_deposit_account_id,
-            v_user_id,
-            v_securities."ID ценной бумаги"
-        );
-    END LOOP;
+    -- Нулевые балансы по всем торгуемым бумагам одним INSERT; у архивных
+    -- бумаг балансов нет (их удаляет архивация)
+    INSERT INTO public."Баланс депозитарного счёта" (
+        "Сумма",
+        "ID депозитарного счёта",
+        "ID пользователя",
+        "ID ценной бумаги"
+    )
+    SELECT 0.00, v_deposit_account_id, v_user_id, s."ID ценной бумаги"
+    FROM public."Список ценных бумаг" s
+    WHERE NOT s."Статус архивации";
 
     UPDATE public."Паспорт"
-    SET "Актуальность" = true
+    SET "Актуальность" = true,
+        "ID верификатора" = NULL,
+        "Аренда до" = NULL
     WHERE "ID паспорта" = p_passport_id;
 
     UPDATE public."Пользователь"
@@ -1553,12 +1744,160 @@ BEGIN
     RETURN NULL;
 
 EXCEPTION
+    WHEN serialization_failure OR deadlock_detected THEN
+        RAISE;
     WHEN OTHERS THEN
         RETURN format('Ошибка верификации паспорта: %s', SQLERRM);
 END;
 $$;
 
 
+-- Пакетная верификация (POST /api/verifier/passports/verify): депозитарные
+-- счета, нулевые балансы и статусы для всех паспортов пакета набором
+-- операций в одной транзакции. Результат по каждому ID паспорта:
+-- error_message NULL - верифицирован, иначе причина отказа.
+CREATE OR REPLACE FUNCTION public.verify_user_passports(
+    p_passport_ids integer[],
+    p_staff_id integer
+)
+RETURNS TABLE(passport_id integer, user_id integer, error_message text)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_passport_ids integer[];
+    v_user_ids integer[];
+    v_errors text[];
+
+    c_verified_status_id CONSTANT INTEGER := 2;
+    c_pending_status_id CONSTANT INTEGER := 3;
+BEGIN
+    -- Результат собирается в массивы и отдаётся только после выполнения
+    -- всех изменений: при ошибке наружу не попадут частичные строки
+    WITH requested AS (
+        SELECT DISTINCT unnest(p_passport_ids) AS passport_id
+    ),
+    -- Пользователь блокируется вместе с паспортом: статус верификации
+    -- перечитывается после блокировки, и параллельная верификация того же
+    -- пользователя (пакетная или одиночная) видна как "не ожидает верификации"
+    locked AS (
+        SELECT ps."ID паспорта" AS passport_id,
+               ps."ID пользователя" AS user_id,
+               ps."ID верификатора" AS verifier_id,
+               ps."Аренда до" AS lease_expires_at,
+               u."ID статуса верификации" AS user_status_id
+        FROM public."Паспорт" ps
+        JOIN public."Пользователь" u ON u."ID пользователя" = ps."ID пользователя"
+        WHERE ps."ID паспорта" IN (SELECT passport_id FROM requested)
+        ORDER BY ps."ID паспорта"
+        FOR UPDATE OF ps, u
+    ),
+    checked AS (
+        SELECT
+            r.passport_id,
+            l.user_id,
+            CASE
+                WHEN l.passport_id IS NULL
+                    THEN format('Паспорт с ID %s не найден', r.passport_id)
+                WHEN l.user_status_id IS DISTINCT FROM c_pending_status_id
+                    THEN format('Паспорт с ID %s не ожидает верификации', r.passport_id)
+                WHEN row_number() OVER (PARTITION BY l.user_id ORDER BY r.passport_id) > 1
+                    THEN format('Паспорт пользователя с ID %s уже есть в пакете', l.user_id)
+                WHEN l.lease_expires_at > now() AND l.verifier_id IS DISTINCT FROM p_staff_id
+                    THEN format('Паспорт с ID %s взят в работу другим верификатором', r.passport_id)
+                WHEN EXISTS (
+                    SELECT 1
+                    FROM public."Депозитарный счёт" d
+                    WHERE d."ID пользователя" = l.user_id
+                ) THEN format(
+                    'У пользователя с ID %s уже существует депозитарный счёт. Повторная верификация невозможна.',
+                    l.user_id
+                )
+            END AS error_message
+        FROM requested r
+        LEFT JOIN locked l ON l.passport_id = r.passport_id
+    ),
+    accounts AS (
+        INSERT INTO public."Депозитарный счёт" (
+            "Номер депозитарного договора",
+            "Дата открытия",
+            "ID пользователя"
+        )
+        SELECT
+            'Договор № ' || to_char(current_date, 'YYYYMMDD') || '-' || c.user_id,
+            current_date,
+            c.user_id
+        FROM checked c
+        WHERE c.error_message IS NULL
+        ORDER BY c.user_id
+        -- Счёт, открытый после снимка оператора, - отказ по этому паспорту,
+        -- а не ошибка всего пакета
+        ON CONFLICT ("ID пользователя") DO NOTHING
+        RETURNING "ID депозитарного счёта", "ID пользователя"
+    ),
+    results AS (
+        SELECT
+            c.passport_id,
+            c.user_id,
+            COALESCE(
+                c.error_message,
+                CASE WHEN a."ID пользователя" IS NULL THEN format(
+                    'У пользователя с ID %s уже существует депозитарный счёт. Повторная верификация невозможна.',
+                    c.user_id
+                ) END
+            ) AS error_message
+        FROM checked c
+        LEFT JOIN accounts a ON a."ID пользователя" = c.user_id
+    ),
+    balances AS (
+        INSERT INTO public."Баланс депозитарного счёта" (
+            "Сумма",
+            "ID депозитарного счёта",
+            "ID пользователя",
+            "ID ценной бумаги"
+        )
+        SELECT 0.00, a."ID депозитарного счёта", a."ID пользователя", s."ID ценной бумаги"
+        FROM accounts a
+        CROSS JOIN public."Список ценных бумаг" s
+        WHERE NOT s."Статус архивации"
+    ),
+    passports AS (
+        UPDATE public."Паспорт" ps
+        SET "Актуальность" = true,
+            "ID верификатора" = NULL,
+            "Аренда до" = NULL
+        FROM results res
+        WHERE ps."ID паспорта" = res.passport_id
+          AND res.error_message IS NULL
+    ),
+    users AS (
+        UPDATE public."Пользователь" u
+        SET "ID статуса верификации" = c_verified_status_id
+        FROM results res
+        WHERE u."ID пользователя" = res.user_id
+          AND res.error_message IS NULL
+    )
+    SELECT array_agg(res.passport_id ORDER BY res.passport_id),
+           array_agg(res.user_id ORDER BY res.passport_id),
+           array_agg(res.error_message ORDER BY res.passport_id)
+    INTO v_passport_ids, v_user_ids, v_errors
+    FROM results res;
+
+    RETURN QUERY
+    SELECT * FROM unnest(v_passport_ids, v_user_ids, v_errors);
+EXCEPTION
+    WHEN serialization_failure OR deadlock_detected THEN
+        RAISE;
+    WHEN OTHERS THEN
+        -- Пакет выполняется целиком или не выполняется вовсе
+        RETURN QUERY
+        SELECT DISTINCT r, NULL::integer, format('Ошибка верификации паспортов: %s', SQLERRM)
+        FROM unnest(p_passport_ids) r
+        ORDER BY 1;
+END;
+$$;
+
+
 CREATE OR REPLACE FUNCTION public.get_total_account_value(
     p_user_id integer,
     p_currency_id integer)
@@ -1712,6 +2051,8 @@ BEGIN
     RETURN NULL;
 
 EXCEPTION
+    WHEN serialization_failure OR deadlock_detected THEN
+        RAISE;
     WHEN OTHERS THEN
         RETURN SQLERRM;
 END;
@@ -1780,6 +2121,8 @@ BEGIN
         v_broker_operation_id := v_proposal.broker_operation_id;
         v_user_id := v_proposal."ID пользователя";
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := 'Ошибка при получении данных предложения: ' || SQLERRM;
             RETURN;
@@ -1796,6 +2139,8 @@ BEGIN
             RETURN;
         END IF;
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := 'Ошибка при поиске депозитарного счёта: ' || SQLERRM;
             RETURN;
@@ -1822,6 +2167,8 @@ BEGIN
             WHERE "ID предложения" = p_proposal_id;
 
         EXCEPTION
+            WHEN serialization_failure OR deadlock_detected THEN
+                RAISE;
             WHEN OTHERS THEN
                 p_error_message := 'Ошибка при одобрении предложения: ' || SQLERRM;
                 RETURN;
@@ -1872,12 +2219,16 @@ BEGIN
             WHERE "ID предложения" = p_proposal_id;
 
         EXCEPTION
+            WHEN serialization_failure OR deadlock_detected THEN
+                RAISE;
             WHEN OTHERS THEN
                 p_error_message := 'Ошибка при отклонении предложения: ' || SQLERRM;
                 RETURN;
         END;
     END IF;
 EXCEPTION
+    WHEN serialization_failure OR deadlock_detected THEN
+        RAISE;
     WHEN OTHERS THEN
         p_error_message := 'Непредвиденная ошибка: ' || SQLERRM;
         RETURN;
@@ -1944,11 +2295,355 @@ BEGIN
 
     RETURN v_error_msg;
 EXCEPTION
+    WHEN serialization_failure OR deadlock_detected THEN
+        RAISE;
+    WHEN OTHERS THEN
+        RETURN SQLERRM;
+END;
+$$;
+
+-- Отмена предложения клиентом: активное отклоняется как брокером
+-- (process_proposal), лимитная заявка в ожидании цены - здесь: по покупке
+-- возвращается резерв, по продаже размораживаются бумаги. Брокерский
+-- process_proposal ожидающие цены заявки по-прежнему не принимает.
+CREATE OR REPLACE FUNCTION public.cancel_proposal(
+    p_employee_id integer,
+    p_proposal_id integer
+)
+RETURNS text
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_proposal RECORD;
+    v_deposit_account_id INTEGER;
+    v_error_message TEXT;
+
+    c_buy_type_id CONSTANT INTEGER := 1;
+    c_sell_type_id CONSTANT INTEGER := 2;
+    c_rejected_status_id CONSTANT INTEGER := 1;
+    c_active_status_id CONSTANT INTEGER := 3;
+    c_waiting_status_id CONSTANT INTEGER := 4;
+    c_depo_unfreeze CONSTANT INTEGER := 4;
+    c_brokerage_operation_return_type_id CONSTANT INTEGER := 4;
+BEGIN
+    SELECT
+        p."ID типа предложения" AS type_id,
+        p."ID статуса предложения" AS status_id,
+        p."ID брокерского счёта" AS account_id,
+        p."ID ценной бумаги" AS security_id,
+        p."Сумма" AS quantity,
+        p."Сумма в валюте" AS cost,
+        p."ID операции бр. счёта" AS broker_operation_id,
+        ba."ID пользователя" AS user_id
+    INTO v_proposal
+    FROM public."Предложение" p
+    JOIN public."Брокерский счёт" ba ON ba."ID брокерского счёта" = p."ID брокерского счёта"
+    WHERE p."ID предложения" = p_proposal_id
+    FOR UPDATE OF p;
+
+    IF NOT FOUND THEN
+        RETURN format('Предложение с ID %s не найдено', p_proposal_id);
+    END IF;
+
+    IF v_proposal.status_id = c_active_status_id THEN
+        RETURN public.process_proposal(p_employee_id, p_proposal_id, false);
+    END IF;
+
+    IF v_proposal.status_id != c_waiting_status_id THEN
+        RETURN format(
+            'Предложение с ID %s имеет недопустимый статус (%s)',
+            p_proposal_id,
+            v_proposal.status_id
+        );
+    END IF;
+
+    IF v_proposal.type_id = c_buy_type_id THEN
+        SELECT p_error_message
+        INTO v_error_message
+        FROM public.change_brokerage_account_balance(
+            p_account_id := v_proposal.account_id,
+            p_amount := v_proposal.cost,
+            p_brokerage_operation_type := c_brokerage_operation_return_type_id,
+            p_staff_id := p_employee_id
+        );
+
+        IF v_error_message IS NOT NULL THEN
+            RETURN format('Ошибка при возврате средств: %s', v_error_message);
+        END IF;
+    ELSIF v_proposal.type_id = c_sell_type_id THEN
+        SELECT "ID депозитарного счёта"
+        INTO v_deposit_account_id
+        FROM public."Депозитарный счёт"
+        WHERE "ID пользователя" = v_proposal.user_id;
+
+        IF NOT FOUND THEN
+            RETURN format('У пользователя с ID %s не найден депозитарный счёт', v_proposal.user_id);
+        END IF;
+
+        UPDATE public."Баланс депозитарного счёта"
+        SET "Сумма" = "Сумма" + v_proposal.quantity
+        WHERE "ID депозитарного счёта" = v_deposit_account_id
+          AND "ID пользователя" = v_proposal.user_id
+          AND "ID ценной бумаги" = v_proposal.security_id;
+
+        IF NOT FOUND THEN
+            RETURN format(
+                'В балансе депозитарного счёта отсутствует запись для ценной бумаги ID %s',
+                v_proposal.security_id
+            );
+        END IF;
+
+        INSERT INTO public."История операций деп. счёта" (
+            "Сумма операции",
+            "Время",
+            "ID депозитарного счёта",
+            "ID пользователя",
+            "ID ценной бумаги",
+            "ID сотрудника",
+            "ID операции бр. счёта",
+            "ID брокерского счёта",
+            "ID типа операции деп. счёта"
+        ) VALUES (
+            v_proposal.quantity,
+            CURRENT_TIMESTAMP,
+            v_deposit_account_id,
+            v_proposal.user_id,
+            v_proposal.security_id,
+            p_employee_id,
+            v_proposal.broker_operation_id,
+            v_proposal.account_id,
+            c_depo_unfreeze
+        );
+    ELSE
+        RETURN format('Неизвестный тип предложения ID %s', v_proposal.type_id);
+    END IF;
+
+    UPDATE public."Предложение"
+    SET "ID статуса предложения" = c_rejected_status_id
+    WHERE "ID предложения" = p_proposal_id;
+
+    RETURN NULL;
+EXCEPTION
+    WHEN serialization_failure OR deadlock_detected THEN
+        RAISE;
     WHEN OTHERS THEN
         RETURN SQLERRM;
 END;
 $$;
 
+-- Отклонение всех активных предложений по бумаге одним набором операций
+-- (вместо process_proposal на каждое предложение): возврат денег по покупкам
+-- одним UPDATE на счёт, разморозка бумаг по продажам одним UPDATE на баланс,
+-- история - одним INSERT ... SELECT. p_limit - не больше стольких предложений
+-- за вызов (порции фоновой задачи archive_security), NULL - все.
+CREATE OR REPLACE FUNCTION public.reject_security_proposals(
+    p_employee_id integer,
+    p_stock_id integer,
+    p_limit integer DEFAULT NULL,
+    OUT p_rejected integer,
+    OUT p_last_proposal_id integer,
+    OUT p_error_message text
+)
+RETURNS record
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_proposal_ids integer[];
+    v_invalid_proposal_id integer;
+
+    c_buy_type_id CONSTANT INTEGER := 1;
+    c_sell_type_id CONSTANT INTEGER := 2;
+    c_active_status_id CONSTANT INTEGER := 3;
+    c_waiting_status_id CONSTANT INTEGER := 4;
+    c_rejected_status_id CONSTANT INTEGER := 1;
+    c_depo_unfreeze CONSTANT INTEGER := 4;
+    c_brokerage_operation_return_type_id CONSTANT INTEGER := 4;
+BEGIN
+    p_rejected := 0;
+    p_last_proposal_id := NULL;
+    p_error_message := NULL;
+
+    PERFORM 1
+    FROM public."Персонал"
+    WHERE "ID сотрудника" = p_employee_id;
+
+    IF NOT FOUND THEN
+        p_error_message := format('Сотрудник с ID %s не найден', p_employee_id);
+        RETURN;
+    END IF;
+
+    -- Блокируем предложения в порядке ID, как и обработка по одному
+    SELECT array_agg(locked."ID предложения" ORDER BY locked."ID предложения")
+    INTO v_proposal_ids
+    FROM (
+        SELECT p."ID предложения"
+        FROM public."Предложение" p
+        WHERE p."ID ценной бумаги" = p_stock_id
+          AND p."ID статуса предложения" IN (c_active_status_id, c_waiting_status_id)
+        ORDER BY p."ID предложения"
+        LIMIT p_limit
+        FOR UPDATE
+    ) locked;
+
+    IF v_proposal_ids IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- Те же условия, что в process_buy_proposal / process_sell_proposal:
+    -- без депозитарного счёта (и баланса по бумаге для продажи) отклонить нельзя
+    SELECT p."ID предложения"
+    INTO v_invalid_proposal_id
+    FROM public."Предложение" p
+    JOIN public."Брокерский счёт" ba
+        ON ba."ID брокерского счёта" = p."ID брокерского счёта"
+    LEFT JOIN public."Депозитарный счёт" da
+        ON da."ID пользователя" = ba."ID пользователя"
+    WHERE p."ID предложения" = ANY(v_proposal_ids)
+      AND (
+          p."ID типа предложения" NOT IN (c_buy_type_id, c_sell_type_id)
+          OR da."ID депозитарного счёта" IS NULL
+          OR (
+              p."ID типа предложения" = c_sell_type_id
+              AND NOT EXISTS (
+                  SELECT 1
+                  FROM public."Баланс депозитарного счёта" b
+                  WHERE b."ID депозитарного счёта" = da."ID депозитарного счёта"
+                    AND b."ID пользователя" = ba."ID пользователя"
+                    AND b."ID ценной бумаги" = p."ID ценной бумаги"
+              )
+          )
+      )
+    ORDER BY p."ID предложения"
+    LIMIT 1;
+
+    IF v_invalid_proposal_id IS NOT NULL THEN
+        p_error_message := format(
+            'Предложение ID %s нельзя отклонить: неизвестный тип, нет депозитарного счёта или баланса по бумаге',
+            v_invalid_proposal_id
+        );
+        RETURN;
+    END IF;
+
+    -- Покупки: возврат средств. Счета блокируем в порядке ID (без взаимных
+    -- блокировок с другими транзакциями), затем одно изменение на счёт
+    PERFORM 1
+    FROM public."Брокерский счёт"
+    WHERE "ID брокерского счёта" IN (
+        SELECT p."ID брокерского счёта"
+        FROM public."Предложение" p
+        WHERE p."ID предложения" = ANY(v_proposal_ids)
+          AND p."ID типа предложения" = c_buy_type_id
+    )
+    ORDER BY "ID брокерского счёта"
+    FOR UPDATE;
+
+    UPDATE public."Брокерский счёт" ba
+    SET "Баланс" = ba."Баланс" + refunds.amount
+    FROM (
+        SELECT p."ID брокерского счёта" AS account_id, sum(p."Сумма в валюте") AS amount
+        FROM public."Предложение" p
+        WHERE p."ID предложения" = ANY(v_proposal_ids)
+          AND p."ID типа предложения" = c_buy_type_id
+        GROUP BY p."ID брокерского счёта"
+    ) refunds
+    WHERE ba."ID брокерского счёта" = refunds.account_id;
+
+    INSERT INTO public."История операций бр. счёта" (
+        "Сумма операции",
+        "Время",
+        "ID брокерского счёта",
+        "ID сотрудника",
+        "ID типа операции бр. счёта"
+    )
+    SELECT
+        p."Сумма в валюте",
+        now(),
+        p."ID брокерского счёта",
+        p_employee_id,
+        c_brokerage_operation_return_type_id
+    FROM public."Предложение" p
+    WHERE p."ID предложения" = ANY(v_proposal_ids)
+      AND p."ID типа предложения" = c_buy_type_id
+    ORDER BY p."ID предложения";
+
+    -- Продажи: разморозка бумаг, одно изменение на баланс
+    PERFORM 1
+    FROM public."Баланс депозитарного счёта" b
+    JOIN public."Брокерский счёт" ba
+        ON ba."ID пользователя" = b."ID пользователя"
+    JOIN public."Предложение" p
+        ON p."ID брокерского счёта" = ba."ID брокерского счёта"
+    WHERE p."ID предложения" = ANY(v_proposal_ids)
+      AND p."ID типа предложения" = c_sell_type_id
+      AND b."ID ценной бумаги" = p_stock_id
+    ORDER BY b."ID баланса депозитарного счёта"
+    FOR UPDATE OF b;
+
+    UPDATE public."Баланс депозитарного счёта" b
+    SET "Сумма" = b."Сумма" + unfrozen.quantity
+    FROM (
+        SELECT da."ID депозитарного счёта" AS deposit_account_id,
+               ba."ID пользователя" AS user_id,
+               sum(p."Сумма") AS quantity
+        FROM public."Предложение" p
+        JOIN public."Брокерский счёт" ba
+            ON ba."ID брокерского счёта" = p."ID брокерского счёта"
+        JOIN public."Депозитарный счёт" da
+            ON da."ID пользователя" = ba."ID пользователя"
+        WHERE p."ID предложения" = ANY(v_proposal_ids)
+          AND p."ID типа предложения" = c_sell_type_id
+        GROUP BY da."ID депозитарного счёта", ba."ID пользователя"
+    ) unfrozen
+    WHERE b."ID депозитарного счёта" = unfrozen.deposit_account_id
+      AND b."ID пользователя" = unfrozen.user_id
+      AND b."ID ценной бумаги" = p_stock_id;
+
+    INSERT INTO public."История операций деп. счёта" (
+        "Сумма операции",
+        "Время",
+        "ID депозитарного счёта",
+        "ID пользователя",
+        "ID ценной бумаги",
+        "ID сотрудника",
+        "ID операции бр. счёта",
+        "ID брокерского счёта",
+        "ID типа операции деп. счёта"
+    )
+    SELECT
+        p."Сумма",
+        CURRENT_TIMESTAMP,
+        da."ID депозитарного счёта",
+        ba."ID пользователя",
+        p."ID ценной бумаги",
+        p_employee_id,
+        p."ID операции бр. счёта",
+        p."ID брокерского счёта",
+        c_depo_unfreeze
+    FROM public."Предложение" p
+    JOIN public."Брокерский счёт" ba
+        ON ba."ID брокерского счёта" = p."ID брокерского счёта"
+    JOIN public."Депозитарный счёт" da
+        ON da."ID пользователя" = ba."ID пользователя"
+    WHERE p."ID предложения" = ANY(v_proposal_ids)
+      AND p."ID типа предложения" = c_sell_type_id
+    ORDER BY p."ID предложения";
+
+    UPDATE public."Предложение"
+    SET "ID статуса предложения" = c_rejected_status_id
+    WHERE "ID предложения" = ANY(v_proposal_ids);
+
+    p_rejected := cardinality(v_proposal_ids);
+    p_last_proposal_id := v_proposal_ids[p_rejected];
+EXCEPTION
+    WHEN serialization_failure OR deadlock_detected THEN
+        RAISE;
+    WHEN OTHERS THEN
+        p_rejected := 0;
+        p_last_proposal_id := NULL;
+        p_error_message := format('Ошибка при отклонении предложений: %s', SQLERRM);
+END;
+$$;
+
 CREATE OR REPLACE FUNCTION public.archive_security(
     p_stock_id integer,
     p_employee_id integer
@@ -1957,8 +2652,6 @@ RETURNS text
 LANGUAGE plpgsql
 AS $$
 DECLARE
-    v_proposal_id integer;
-    v_error_msg text;
     v_stock_ticker varchar;
 BEGIN
     IF p_stock_id IS NULL OR p_stock_id <= 0 THEN
@@ -1986,40 +2679,18 @@ BEGIN
         );
     END IF;
 
-    FOR v_proposal_id IN
-        SELECT p."ID предложения"
-        FROM public."Предложение" p
-        WHERE p."ID ценной бумаги" = p_stock_id
-          AND p."ID статуса предложения" = 3
-    LOOP
-        v_error_msg := public.process_proposal(
-            p_employee_id,
-            v_proposal_id,
-            FALSE
-        );
-
-        IF v_error_msg IS NOT NULL AND trim(v_error_msg) <> '' THEN
-            RETURN format(
-                'Ошибка при отклонении предложения ID %s для бумаги "%s": %s',
-                v_proposal_id,
-                v_stock_ticker,
-                v_error_msg
-            );
-        END IF;
-    END LOOP;
-
-    DELETE FROM "Баланс депозитарного счёта"
-    WHERE "ID ценной бумаги" = p_stock_id;
-
-    DELETE FROM "История цены"
-    WHERE "ID ценной бумаги" = p_stock_id;
-
+    -- Архивная бумага недоступна для новых заявок. Активные предложения
+    -- (reject_security_proposals), балансы и историю цены порциями
+    -- обрабатывает фоновая задача archive_security (db/jobs.py), которую
+    -- ставит вызывающий код.
     UPDATE public."Список ценных бумаг"
     SET "Статус архивации" = TRUE
     WHERE "ID ценной бумаги" = p_stock_id;
 
     RETURN NULL;
 EXCEPTION
+    WHEN serialization_failure OR deadlock_detected THEN
+        RAISE;
     WHEN OTHERS THEN
         RETURN format(
             'Неожиданная ошибка при архивации: %s',
@@ -2077,6 +2748,8 @@ BEGIN
     RETURN QUERY
     SELECT staff_id, NULL::text;
 EXCEPTION
+    WHEN serialization_failure OR deadlock_detected THEN
+        RAISE;
     WHEN OTHERS THEN
         error_message := SQLERRM;
         staff_id := NULL;
@@ -2277,6 +2950,8 @@ BEGIN
     )
     RETURNING "ID пользователя" INTO p_user_id;
 EXCEPTION
+    WHEN serialization_failure OR deadlock_detected THEN
+        RAISE;
     WHEN OTHERS THEN
         p_error_message := SQLERRM;
         p_user_id := NULL;
@@ -2348,6 +3023,8 @@ BEGIN
         END IF;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := format('Ошибка при обновлении валюты: %s', SQLERRM);
             RETURN;
@@ -2367,7 +3044,6 @@ DECLARE
     v_used_in_securities BOOLEAN;
     v_accounts_count INTEGER;
     v_securities_count INTEGER;
-    v_deleted_rates_count INTEGER := 0;
 BEGIN
     p_error_message := NULL;
     SELECT EXISTS(
@@ -2425,10 +3101,9 @@ BEGIN
         RETURN;
     END IF;
 
+    -- Курсы архивной валюты порциями удаляет фоновая задача archive_currency
+    -- (db/jobs.py), которую ставит вызывающий код
     BEGIN
-        DELETE FROM public."Курсы валют"
-        WHERE "Курсы валют"."ID валюты" = p_currency_id;
-        GET DIAGNOSTICS v_deleted_rates_count = ROW_COUNT;
         UPDATE public."Список валют"
         SET "Статус архивации" = TRUE
         WHERE "ID валюты" = p_currency_id;
@@ -2438,12 +3113,12 @@ BEGIN
         END IF;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := format('Ошибка при архивации валюты: %s', SQLERRM);
             RETURN;
     END;
-    RAISE NOTICE 'Валюта с ID %s успешно архивирована. Удалено %s записей из таблицы "Курсы валют"', p_currency_id,
-    v_deleted_rates_count;
 END;
 $BODY$;
 
@@ -2477,6 +3152,8 @@ BEGIN
         p_currency_id := v_currency_id;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
             p_currency_id := NULL;
@@ -2537,6 +3214,8 @@ BEGIN
         p_passport_id := v_passport_id;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
             p_passport_id := NULL;
@@ -2573,6 +3252,8 @@ BEGIN
         WHERE "ID брокерского счёта" = p_account_id;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
     END;
@@ -2616,6 +3297,8 @@ BEGIN
         p_bank_id := v_bank_id;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
             p_bank_id := NULL;
@@ -2629,7 +3312,10 @@ CREATE OR REPLACE PROCEDURE public.add_brokerage_account(
     IN p_currency_id integer,
     IN p_inn character varying,
     OUT p_account_id integer,
-    OUT p_error_message character varying
+    OUT p_error_message character varying,
+    OUT p_bank_name character varying,
+    OUT p_bik character varying,
+    OUT p_currency_symbol character varying
 )
 LANGUAGE 'plpgsql'
 AS $BODY$
@@ -2641,8 +3327,8 @@ BEGIN
     p_error_message := NULL;
 
     BEGIN
-        SELECT "БИК"
-        INTO v_bik
+        SELECT "БИК", "Наименование"
+        INTO v_bik, p_bank_name
         FROM public."Банк"
         WHERE "ID банка" = p_bank_id;
 
@@ -2650,7 +3336,8 @@ BEGIN
             p_error_message := format('Банк с ID %s не найден', p_bank_id);
             RETURN;
         END IF;
-        PERFORM 1
+        SELECT "Символ"
+        INTO p_currency_symbol
         FROM public."Список валют"
         WHERE "ID валюты" = p_currency_id
           AND "Статус архивации" = FALSE;
@@ -2677,7 +3364,10 @@ BEGIN
         )
         RETURNING "ID брокерского счёта" INTO v_account_id;
         p_account_id := v_account_id;
+        p_bik := v_bik;
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
             p_account_id := NULL;
@@ -2689,7 +3379,10 @@ CREATE OR REPLACE PROCEDURE public.add_buy_proposal(
     p_security_id integer,
     p_brokerage_account_id integer,
     p_lot_amount_to_buy integer,
-    OUT p_error_message character varying
+    OUT p_error_message character varying,
+    OUT p_proposal_id integer,
+    OUT p_quantity numeric,
+    p_limit_price numeric DEFAULT NULL
 )
 LANGUAGE 'plpgsql'
 AS $BODY$
@@ -2701,8 +3394,10 @@ DECLARE
     v_operation_id INTEGER;
     v_proposal_id INTEGER;
     v_func_result RECORD;
+    v_status_id INTEGER;
     v_buy_type_id CONSTANT INTEGER := 1;
     v_active_status_id CONSTANT INTEGER := 3;
+    v_waiting_status_id CONSTANT INTEGER := 4;
     v_employee_id CONSTANT INTEGER := 2;
     v_stock_buy_operation_id CONSTANT INTEGER := 3;
 BEGIN
@@ -2722,6 +3417,14 @@ BEGIN
             RETURN;
         END IF;
         v_security_price := get_security_value_native(p_security_id);
+        v_status_id := v_active_status_id;
+        -- Лимитная заявка, цена выше лимита: резервируем стоимость по лимиту
+        -- и ждём цену (при срабатывании разница резерва возвращается)
+        IF p_limit_price IS NOT NULL
+           AND (v_security_price IS NULL OR v_security_price > p_limit_price) THEN
+            v_security_price := p_limit_price;
+            v_status_id := v_waiting_status_id;
+        END IF;
         v_total_quantity := v_lot_size * p_lot_amount_to_buy;
         v_total_cost := v_total_quantity * v_security_price;
         v_func_result := public.change_brokerage_account_balance(
@@ -2746,7 +3449,8 @@ BEGIN
             "ID ценной бумаги",
             "ID брокерского счёта",
             "ID типа предложения",
-            "ID статуса предложения"
+            "ID статуса предложения",
+            "Лимитная цена"
         ) VALUES (
             v_total_quantity,
             v_total_cost,
@@ -2754,15 +3458,21 @@ BEGIN
             p_security_id,
             p_brokerage_account_id,
             v_buy_type_id,
-            v_active_status_id
+            v_status_id,
+            p_limit_price
         )
         RETURNING "ID предложения" INTO v_proposal_id;
         RAISE NOTICE 'Создано предложение на покупку ID: %, стоимость: %, операция: %',
             v_proposal_id, v_total_cost, v_operation_id;
+        p_proposal_id := v_proposal_id;
+        p_quantity := v_total_quantity;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
+            p_proposal_id := NULL;
     END;
 END;
 $BODY$;
@@ -2780,7 +3490,6 @@ LANGUAGE 'plpgsql'
 AS $BODY$
 DECLARE
     v_security_id INTEGER;
-    r_deposit_account RECORD;
 BEGIN
     p_security_id := NULL;
     p_error_message := NULL;
@@ -2826,26 +3535,24 @@ BEGIN
             v_security_id
         );
 
-        FOR r_deposit_account IN
-            SELECT "ID депозитарного счёта", "ID пользователя"
-            FROM public."Депозитарный счёт"
-        LOOP
-            INSERT INTO public."Баланс депозитарного счёта" (
-                "Сумма",
-                "ID депозитарного счёта",
-                "ID пользователя",
-                "ID ценной бумаги"
-            ) VALUES (
-                0.00,
-                r_deposit_account."ID депозитарного счёта",
-                r_deposit_account."ID пользователя",
-                v_security_id
-            );
-        END LOOP;
+        INSERT INTO public."Баланс депозитарного счёта" (
+            "Сумма",
+            "ID депозитарного счёта",
+            "ID пользователя",
+            "ID ценной бумаги"
+        )
+        SELECT
+            0.00,
+            "ID депозитарного счёта",
+            "ID пользователя",
+            v_security_id
+        FROM public."Депозитарный счёт";
 
         p_security_id := v_security_id;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
             p_security_id := NULL;
@@ -2857,7 +3564,10 @@ CREATE OR REPLACE PROCEDURE public.add_sell_proposal(
     p_security_id integer,
     p_brokerage_account_id integer,
     p_lot_amount_to_sell integer,
-    OUT p_error_message character varying
+    OUT p_error_message character varying,
+    OUT p_proposal_id integer,
+    OUT p_quantity numeric,
+    p_limit_price numeric DEFAULT NULL
 )
 LANGUAGE 'plpgsql'
 AS $BODY$
@@ -2871,8 +3581,11 @@ DECLARE
     v_brokerage_operation_id INTEGER;
     v_deposit_operation_id INTEGER;
     v_proposal_id INTEGER;
+    v_security_price NUMERIC(12,2);
+    v_status_id INTEGER;
     v_sell_type_id CONSTANT INTEGER := 2;
     v_active_status_id CONSTANT INTEGER := 3;
+    v_waiting_status_id CONSTANT INTEGER := 4;
     v_employee_id CONSTANT INTEGER := 2;
     v_empty_brokerage_type CONSTANT INTEGER := 6;
     v_lock_deposit_operation_type_id CONSTANT INTEGER := 3;
@@ -2894,8 +3607,17 @@ BEGIN
             RETURN;
         END IF;
 
+        v_security_price := get_security_value_native(p_security_id);
+        v_status_id := v_active_status_id;
+        -- Лимитная заявка, цена ниже лимита: бумаги замораживаются сразу,
+        -- заявка ждёт цену
+        IF p_limit_price IS NOT NULL
+           AND (v_security_price IS NULL OR v_security_price < p_limit_price) THEN
+            v_security_price := p_limit_price;
+            v_status_id := v_waiting_status_id;
+        END IF;
         v_total_quantity := v_lot_size * p_lot_amount_to_sell;
-        v_total_cost := v_total_quantity * get_security_value_native(p_security_id);
+        v_total_cost := v_total_quantity * v_security_price;
 
         SELECT "ID пользователя" INTO v_user_id
         FROM public."Брокерский счёт"
@@ -2985,7 +3707,8 @@ BEGIN
             "ID ценной бумаги",
             "ID брокерского счёта",
             "ID типа предложения",
-            "ID статуса предложения"
+            "ID статуса предложения",
+            "Лимитная цена"
         ) VALUES (
             v_total_quantity,
             v_total_cost,
@@ -2993,12 +3716,19 @@ BEGIN
             p_security_id,
             p_brokerage_account_id,
             v_sell_type_id,
-            v_active_status_id
-        );
+            v_status_id,
+            p_limit_price
+        )
+        RETURNING "ID предложения" INTO v_proposal_id;
+        p_proposal_id := v_proposal_id;
+        p_quantity := v_total_quantity;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
+            p_proposal_id := NULL;
     END;
 END;
 $BODY$;
@@ -3048,29 +3778,161 @@ BEGIN
         END IF;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
     END;
 END;
 $BODY$;
 
+-- Лимитные заявки, сработавшие при цене p_price: покупки с лимитом не ниже
+-- цены и продажи с лимитом не выше - по диапазону индекса
+-- "IX_Предложение_лимит" на каждую сторону. Заявки переходят на рассмотрение
+-- брокеру по новой цене; по покупкам разница резерва возвращается на счёт
+-- одним изменением на счёт. Возвращает число активированных заявок.
+CREATE OR REPLACE FUNCTION public.activate_limit_proposals(
+    p_security_id integer,
+    p_price numeric
+)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_proposal_ids integer[];
+
+    c_buy_type_id CONSTANT INTEGER := 1;
+    c_sell_type_id CONSTANT INTEGER := 2;
+    c_active_status_id CONSTANT INTEGER := 3;
+    c_waiting_status_id CONSTANT INTEGER := 4;
+    c_employee_id CONSTANT INTEGER := 2;
+    c_brokerage_operation_return_type_id CONSTANT INTEGER := 4;
+BEGIN
+    v_proposal_ids := ARRAY(
+        SELECT triggered.id
+        FROM (
+            SELECT p."ID предложения" AS id
+            FROM public."Предложение" p
+            WHERE p."ID ценной бумаги" = p_security_id
+              AND p."ID типа предложения" = c_buy_type_id
+              AND p."ID статуса предложения" = c_waiting_status_id
+              AND p."Лимитная цена" >= p_price
+            FOR UPDATE
+        ) triggered
+        UNION ALL
+        SELECT triggered.id
+        FROM (
+            SELECT p."ID предложения" AS id
+            FROM public."Предложение" p
+            WHERE p."ID ценной бумаги" = p_security_id
+              AND p."ID типа предложения" = c_sell_type_id
+              AND p."ID статуса предложения" = c_waiting_status_id
+              AND p."Лимитная цена" <= p_price
+            FOR UPDATE
+        ) triggered
+        ORDER BY 1
+    );
+
+    IF cardinality(v_proposal_ids) = 0 THEN
+        RETURN 0;
+    END IF;
+
+    PERFORM 1
+    FROM public."Брокерский счёт"
+    WHERE "ID брокерского счёта" IN (
+        SELECT p."ID брокерского счёта"
+        FROM public."Предложение" p
+        WHERE p."ID предложения" = ANY(v_proposal_ids)
+          AND p."ID типа предложения" = c_buy_type_id
+    )
+    ORDER BY "ID брокерского счёта"
+    FOR UPDATE;
+
+    WITH refunds AS (
+        SELECT
+            p."ID предложения" AS proposal_id,
+            p."ID брокерского счёта" AS account_id,
+            p."Сумма в валюте" - round(p."Сумма" * p_price, 2) AS amount
+        FROM public."Предложение" p
+        WHERE p."ID предложения" = ANY(v_proposal_ids)
+          AND p."ID типа предложения" = c_buy_type_id
+    ),
+    balances AS (
+        UPDATE public."Брокерский счёт" ba
+        SET "Баланс" = ba."Баланс" + per_account.amount
+        FROM (
+            SELECT account_id, sum(amount) AS amount
+            FROM refunds
+            WHERE amount > 0
+            GROUP BY account_id
+        ) per_account
+        WHERE ba."ID брокерского счёта" = per_account.account_id
+    )
+    INSERT INTO public."История операций бр. счёта" (
+        "Сумма операции",
+        "Время",
+        "ID брокерского счёта",
+        "ID сотрудника",
+        "ID типа операции бр. счёта"
+    )
+    SELECT r.amount, now(), r.account_id, c_employee_id, c_brokerage_operation_return_type_id
+    FROM refunds r
+    WHERE r.amount > 0
+    ORDER BY r.proposal_id;
+
+    UPDATE public."Предложение"
+    SET "Сумма в валюте" = round("Сумма" * p_price, 2),
+        "ID статуса предложения" = c_active_status_id
+    WHERE "ID предложения" = ANY(v_proposal_ids);
+
+    RETURN cardinality(v_proposal_ids);
+END;
+$$;
+
+-- Любая запись текущей цены (change_stock_price, загрузка цен файлом)
+-- активирует сработавшие лимитные заявки в той же транзакции
+CREATE OR REPLACE FUNCTION public.trg_activate_limit_proposals()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM public.activate_limit_proposals(NEW."ID ценной бумаги", NEW."Цена");
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER activate_limit_proposals
+    AFTER INSERT OR UPDATE OF "Цена" ON public."История цены"
+    FOR EACH ROW
+    WHEN (NEW."Дата" >= CURRENT_DATE)
+    EXECUTE FUNCTION public.trg_activate_limit_proposals();
+
 CREATE OR REPLACE PROCEDURE public.add_proposal(
     IN p_user_id integer,
     IN p_security_id integer,
     IN p_brokerage_account_id integer,
     IN p_proposal_type_id integer,
     IN p_lot_amount integer,
-    OUT p_error_message character varying
+    OUT p_error_message character varying,
+    OUT p_proposal_id integer,
+    OUT p_offer_type character varying,
+    OUT p_security_name character varying,
+    OUT p_security_isin character varying,
+    OUT p_quantity numeric,
+    OUT p_proposal_status integer,
+    IN p_limit_price numeric DEFAULT NULL
 )
 LANGUAGE 'plpgsql'
 AS $BODY$
 DECLARE
     v_security_archived BOOLEAN;
     v_security_ticker VARCHAR;
+    v_security_isin VARCHAR;
     v_security_currency_id INTEGER;
     v_account_currency_id INTEGER;
 BEGIN
     p_error_message := NULL;
+    p_proposal_id := NULL;
 
     BEGIN
         IF p_proposal_type_id NOT IN (1, 2) THEN
@@ -3081,6 +3943,10 @@ BEGIN
             p_error_message := format('Количество лотов должно быть строго больше нуля (получено: %s)', p_lot_amount);
             RETURN;
         END IF;
+        IF p_limit_price IS NOT NULL AND p_limit_price <= 0 THEN
+            p_error_message := format('Лимитная цена должна быть строго больше нуля (получено: %s)', p_limit_price);
+            RETURN;
+        END IF;
         PERFORM 1
         FROM public."Брокерский счёт"
         WHERE "ID брокерского счёта" = p_brokerage_account_id
@@ -3091,9 +3957,9 @@ BEGIN
                                     p_brokerage_account_id, p_user_id);
             RETURN;
         END IF;
-        SELECT s."Статус архивации", s."Наименование", s."ID валюты",
+        SELECT s."Статус архивации", s."Наименование", s."ISIN", s."ID валюты",
                ba."ID валюты"
-        INTO v_security_archived, v_security_ticker, v_security_currency_id,
+        INTO v_security_archived, v_security_ticker, v_security_isin, v_security_currency_id,
              v_account_currency_id
         FROM public."Список ценных бумаг" s
         CROSS JOIN public."Брокерский счёт" ba
@@ -3116,15 +3982,32 @@ BEGIN
             RETURN;
         END IF;
         IF p_proposal_type_id = 1 THEN
-            CALL add_buy_proposal(p_security_id, p_brokerage_account_id, p_lot_amount, p_error_message);
+            CALL add_buy_proposal(p_security_id, p_brokerage_account_id, p_lot_amount,
+                                  p_error_message, p_proposal_id, p_quantity, p_limit_price);
         ELSIF p_proposal_type_id = 2 THEN
-            CALL add_sell_proposal(p_security_id, p_brokerage_account_id, p_lot_amount, p_error_message);
+            CALL add_sell_proposal(p_security_id, p_brokerage_account_id, p_lot_amount,
+                                   p_error_message, p_proposal_id, p_quantity, p_limit_price);
         END IF;
         IF p_error_message IS NOT NULL THEN
             RETURN;
         END IF;
 
+        SELECT "Тип"
+        INTO p_offer_type
+        FROM public."Тип предложения"
+        WHERE "ID типа предложения" = p_proposal_type_id;
+
+        p_security_name := v_security_ticker;
+        p_security_isin := v_security_isin;
+        -- На рассмотрении или, для лимитной заявки, ожидает цены
+        SELECT "ID статуса предложения"
+        INTO p_proposal_status
+        FROM public."Предложение"
+        WHERE "ID предложения" = p_proposal_id;
+
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
     END;
@@ -3160,6 +4043,8 @@ BEGIN
         END IF;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN foreign_key_violation THEN
             p_error_message := format('Нельзя удалить банк с ID %s: на него есть ссылки в других таблицах', p_bank_id);
         WHEN OTHERS THEN
@@ -3203,6 +4088,8 @@ BEGIN
         END IF;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
     END;
@@ -3246,6 +4133,8 @@ BEGIN
         END IF;
 
     EXCEPTION
+        WHEN serialization_failure OR deadlock_detected THEN
+            RAISE;
         WHEN OTHERS THEN
             p_error_message := SQLERRM;
     END;
@@ -3280,12 +4169,12 @@ select verify_user_passport(2);
 
 call register_user('3', '$2b$12$SLJKJ4d31q3acOktI7eH7eOynavGTmWUTcU2At/mCYdEPu8KLrayO', 'email3@example.com', null, null);
 
-call add_brokerage_account(1, 1, 1, '500100732259', null, null);
-call add_brokerage_account(1, 1, 3, '600133890863', null, null);
+call add_brokerage_account(1, 1, 1, '500100732259', null, null, null, null, null);
+call add_brokerage_account(1, 1, 3, '600133890863', null, null, null, null, null);
 select change_brokerage_account_balance(1, 1000000, 1, 2);
 
 
-call add_buy_proposal(1, 1, 1, null);
+call add_buy_proposal(1, 1, 1, null, null, null);
 select process_proposal(1, 1, true);
 
-call add_proposal(1, 1, 1, 1, 2, null);
+call add_proposal(1, 1, 1, 1, 2, null, null, null, null, null, null, null);
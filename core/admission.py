@@ -0,0 +1,143 @@
+# core/admission.py
+import asyncio
+import itertools
+from collections import defaultdict
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ConfigDict
+from starlette import status
+
+from core import metrics
+from core.config import ADMISSION_CAPACITY
+
+
+class AdmissionClass(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    name: str
+    priority: int              # меньше - важнее
+    max_concurrency: int       # одновременно выполняемых запросов класса
+    max_queue: int             # ожидающих запросов класса, дальше - 429
+    queue_timeout: float       # секунд в очереди, дальше - 503
+    retry_after: int = 1       # значение заголовка Retry-After, секунды
+
+
+# Заявки и их обработка брокером
+TRADING = AdmissionClass(name="trading", priority=0, max_concurrency=10, max_queue=50, queue_timeout=2.0)
+# Короткие чтения и правки
+INTERACTIVE = AdmissionClass(name="interactive", priority=1, max_concurrency=10, max_queue=100, queue_timeout=1.0)
+# bcrypt занимает CPU, а не соединения: отдельный небольшой лимит
+HASHING = AdmissionClass(name="hashing", priority=1, max_concurrency=4, max_queue=20, queue_timeout=3.0, retry_after=2)
+# Графики и выгрузки таблиц
+REPORTING = AdmissionClass(name="reporting", priority=2, max_concurrency=3, max_queue=6, queue_timeout=0.5, retry_after=5)
+# Массовые загрузки (COPY): по одной, чтобы не вытеснять интерактивные запросы
+BULK = AdmissionClass(name="bulk", priority=3, max_concurrency=1, max_queue=2, queue_timeout=0.5, retry_after=30)
+
+
+class _Waiter:
+    def __init__(self, admission_class: AdmissionClass, seq: int):
+        self.admission_class = admission_class
+        self.seq = seq
+        self.future = asyncio.get_running_loop().create_future()
+
+
+# Общий бюджет (по умолчанию - размер пула соединений) с лимитами по классам.
+# Освободившееся место достаётся ожидающему с наивысшим приоритетом,
+# внутри класса - в порядке очереди.
+class AdmissionController:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.active = 0
+        self.active_by_class = defaultdict(int)
+        self.waiters: list[_Waiter] = []
+        self._seq = itertools.count()
+
+    def _can_admit(self, admission_class: AdmissionClass) -> bool:
+        return (
+            self.active < self.capacity
+            and self.active_by_class[admission_class.name] < admission_class.max_concurrency
+        )
+
+    def _admit(self, admission_class: AdmissionClass) -> None:
+        self.active += 1
+        self.active_by_class[admission_class.name] += 1
+        metrics.increment("admission_admitted", admission_class.name)
+
+    def _shed(self, admission_class: AdmissionClass, status_code: int, detail: str):
+        metrics.increment("admission_shed", admission_class.name)
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(admission_class.retry_after)}
+        )
+
+    def _wake(self) -> None:
+        for waiter in sorted(self.waiters, key=lambda w: (w.admission_class.priority, w.seq)):
+            if self.active >= self.capacity:
+                break
+            if waiter.future.done() or not self._can_admit(waiter.admission_class):
+                continue
+            self.waiters.remove(waiter)
+            self._admit(waiter.admission_class)
+            waiter.future.set_result(None)
+
+    def release(self, admission_class: AdmissionClass) -> None:
+        self.active -= 1
+        self.active_by_class[admission_class.name] -= 1
+        self._wake()
+
+    async def acquire(self, admission_class: AdmissionClass) -> None:
+        queued = [w for w in self.waiters if w.admission_class.name == admission_class.name]
+        if not queued and self._can_admit(admission_class):
+            self._admit(admission_class)
+            return
+
+        if len(queued) >= admission_class.max_queue:
+            raise self._shed(
+                admission_class,
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                "Слишком много запросов. Попробуйте позже."
+            )
+
+        waiter = _Waiter(admission_class, next(self._seq))
+        self.waiters.append(waiter)
+        metrics.increment("admission_queued", admission_class.name)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), admission_class.queue_timeout)
+        except BaseException as e:
+            if waiter.future.done():
+                # Место уже выделено, но запрос не будет выполняться
+                self.release(admission_class)
+            else:
+                self.waiters.remove(waiter)
+                waiter.future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._shed(
+                    admission_class,
+                    status.HTTP_503_SERVICE_UNAVAILABLE,
+                    "Сервер перегружен. Попробуйте позже."
+                )
+            raise
+
+
+admission_controller = AdmissionController(ADMISSION_CAPACITY)
+
+
+def admission_class(cls: AdmissionClass):
+    def decorator(endpoint):
+        endpoint.admission_class = cls
+        return endpoint
+    return decorator
+
+
+# Зависимость уровня роутера. Ставится первой в dependencies, до профиля
+# транзакции и проверки токена, чтобы лишние запросы не занимали соединения.
+def use_admission(default: AdmissionClass):
+    async def dependency(request: Request):
+        cls = getattr(request.scope.get("endpoint"), "admission_class", default)
+        await admission_controller.acquire(cls)
+        try:
+            yield
+        finally:
+            admission_controller.release(cls)
+    return dependency
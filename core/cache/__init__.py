@@ -0,0 +1,15 @@
+# core/cache/__init__.py
+from .base import CacheBackend, CacheError
+from .cache import Cache, get_backend, invalidate
+from .memory import MemoryBackend
+from .resp import RedisBackend
+
+__all__ = [
+    "Cache",
+    "CacheBackend",
+    "CacheError",
+    "MemoryBackend",
+    "RedisBackend",
+    "get_backend",
+    "invalidate",
+]
@@ -0,0 +1,40 @@
+# core/cache/base.py
+from abc import ABC, abstractmethod
+from typing import Iterable, Optional
+
+
+class CacheError(Exception):
+    pass
+
+
+# Общий интерфейс хранилищ. Значения - уже сериализованные байты,
+# ключи - полные (с префиксом и пространством имён).
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        ...
+
+    # Записать, только если ключа нет (для блокировок). True - если записано.
+    @abstractmethod
+    async def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        ...
+
+    @abstractmethod
+    async def tag(self, key: str, tags: Iterable[str]) -> None:
+        ...
+
+    # Удаляет все ключи с указанными тегами, возвращает их количество
+    @abstractmethod
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        ...
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,151 @@
+# core/cache/cache.py
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from pydantic_core import to_json
+
+from core import metrics
+from core.config import (
+    CACHE_BACKEND, CACHE_REDIS_URL, CACHE_REDIS_POOL_SIZE, CACHE_KEY_PREFIX, CACHE_MAX_ENTRIES,
+    CACHE_DEFAULT_TTL, CACHE_TAG_TTL, CACHE_LOCK_TIMEOUT, CACHE_LOCK_POLL_INTERVAL
+)
+from core.single_flight import single_flight
+from .base import CacheBackend, CacheError
+from .memory import MemoryBackend
+from .resp import RedisBackend
+
+# Сбой сервера кэша не должен ломать запрос - работаем как при промахе
+_BACKEND_ERRORS = (CacheError, OSError, EOFError)
+
+_backend: Optional[CacheBackend] = None
+
+
+def get_backend() -> CacheBackend:
+    global _backend
+    if _backend is None:
+        if CACHE_BACKEND == "redis":
+            _backend = RedisBackend(CACHE_REDIS_URL, CACHE_REDIS_POOL_SIZE, CACHE_TAG_TTL)
+        else:
+            _backend = MemoryBackend(CACHE_MAX_ENTRIES)
+    return _backend
+
+
+# Кэш с пространством имён поверх общего хранилища. Значения хранятся в JSON,
+# теги общие для всех пространств имён (например, тег "security" сбрасывает
+# всё, что построено по списку ценных бумаг).
+class Cache:
+    def __init__(self, namespace: str, backend: Optional[CacheBackend] = None, ttl: float = CACHE_DEFAULT_TTL):
+        self.namespace = namespace
+        self.backend = backend or get_backend()
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"{CACHE_KEY_PREFIX}:{self.namespace}:{key}"
+
+    @staticmethod
+    def _tag(tag: str) -> str:
+        return f"{CACHE_KEY_PREFIX}:tag:{tag}"
+
+    async def _get_raw(self, key: str) -> Optional[bytes]:
+        try:
+            raw = await self.backend.get(self._key(key))
+        except _BACKEND_ERRORS:
+            metrics.increment("cache_errors", self.namespace)
+            raw = None
+        metrics.increment("cache_hits" if raw is not None else "cache_misses", self.namespace)
+        return raw
+
+    async def _set_raw(self, key: str, raw: bytes, ttl: Optional[float], tags: Iterable[str]) -> None:
+        full_key = self._key(key)
+        try:
+            await self.backend.set(full_key, raw, ttl or self.ttl)
+            if tags:
+                await self.backend.tag(full_key, [self._tag(tag) for tag in tags])
+        except _BACKEND_ERRORS:
+            metrics.increment("cache_errors", self.namespace)
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        raw = await self._get_raw(key)
+        return json.loads(raw) if raw is not None else default
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None, tags: Iterable[str] = ()) -> None:
+        await self._set_raw(key, to_json(value), ttl, tags)
+
+    # Готовые байты без JSON-обёртки (например, тело ответа целиком)
+    async def get_bytes(self, key: str) -> Optional[bytes]:
+        return await self._get_raw(key)
+
+    async def set_bytes(self, key: str, raw: bytes, ttl: Optional[float] = None, tags: Iterable[str] = ()) -> None:
+        await self._set_raw(key, raw, ttl, tags)
+
+    async def delete(self, key: str) -> None:
+        try:
+            await self.backend.delete(self._key(key))
+        except _BACKEND_ERRORS:
+            metrics.increment("cache_errors", self.namespace)
+
+    async def invalidate(self, *tags: str) -> None:
+        try:
+            await self.backend.invalidate_tags([self._tag(tag) for tag in tags])
+        except _BACKEND_ERRORS:
+            metrics.increment("cache_errors", self.namespace)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float], tags: Iterable[str]) -> bytes:
+        # Между процессами загрузку выполняет тот, кто взял блокировку,
+        # остальные ждут появления значения не дольше CACHE_LOCK_TIMEOUT
+        lock_key = self._key(key) + ":lock"
+        try:
+            locked = await self.backend.add(lock_key, b"1", CACHE_LOCK_TIMEOUT)
+        except _BACKEND_ERRORS:
+            metrics.increment("cache_errors", self.namespace)
+            locked = False
+        else:
+            if not locked:
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + CACHE_LOCK_TIMEOUT
+                while loop.time() < deadline:
+                    await asyncio.sleep(CACHE_LOCK_POLL_INTERVAL)
+                    try:
+                        raw = await self.backend.get(self._key(key))
+                    except _BACKEND_ERRORS:
+                        break
+                    if raw is not None:
+                        return raw
+
+        try:
+            raw = to_json(await loader())
+            await self._set_raw(key, raw, ttl, tags)
+            return raw
+        finally:
+            if locked:
+                try:
+                    await self.backend.delete(lock_key)
+                except _BACKEND_ERRORS:
+                    pass
+
+    # Значение из кэша или результат loader(). Внутри процесса одинаковые
+    # промахи объединяются в одну загрузку (core.single_flight).
+    async def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        tags: Iterable[str] = ()
+    ) -> Any:
+        raw = await self._get_raw(key)
+        if raw is None:
+            raw = await single_flight(
+                f"cache:{self.namespace}",
+                {"key": key},
+                lambda: self._load(key, loader, ttl, tags)
+            )
+        return json.loads(raw)
+
+
+# Сброс по тегам без привязки к пространству имён (например, по уведомлению из БД)
+async def invalidate(*tags: str) -> None:
+    try:
+        await get_backend().invalidate_tags([Cache._tag(tag) for tag in tags])
+    except _BACKEND_ERRORS:
+        metrics.increment("cache_errors", "invalidate")
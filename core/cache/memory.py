@@ -0,0 +1,81 @@
+# core/cache/memory.py
+import time
+from collections import OrderedDict, defaultdict
+from typing import Iterable, Optional
+
+from core import metrics
+from .base import CacheBackend
+
+
+def _namespace(key: str) -> str:
+    # <префикс>:<пространство имён>:<ключ>
+    parts = key.split(":", 2)
+    return parts[1] if len(parts) > 2 else key
+
+
+# LRU с TTL в памяти процесса. У каждого воркера uvicorn - своя копия.
+class MemoryBackend(CacheBackend):
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[bytes, Optional[float]]] = OrderedDict()
+        self._tags: dict[str, set[str]] = defaultdict(set)
+        self._key_tags: dict[str, set[str]] = defaultdict(set)
+
+    def _remove(self, key: str) -> None:
+        self._entries.pop(key, None)
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _get_alive(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = self._get_alive(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted = next(iter(self._entries))
+            self._remove(evicted)
+            metrics.increment("cache_evictions", _namespace(evicted))
+
+    async def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        if self._get_alive(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._remove(key)
+
+    async def tag(self, key: str, tags: Iterable[str]) -> None:
+        if key not in self._entries:
+            return
+        for tag in tags:
+            self._tags[tag].add(key)
+            self._key_tags[key].add(tag)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        keys = set()
+        for tag in tags:
+            keys |= self._tags.pop(tag, set())
+        for key in keys:
+            self._remove(key)
+        return len(keys)
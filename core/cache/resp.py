@@ -0,0 +1,131 @@
+# core/cache/resp.py
+import asyncio
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+
+from .base import CacheBackend, CacheError
+
+
+def _encode_command(*args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def _read_reply(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Соединение с сервером кэша закрыто")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise CacheError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length == -1:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise CacheError(f"Неизвестный ответ сервера кэша: {line!r}")
+
+    async def execute(self, *args):
+        self.writer.write(_encode_command(*args))
+        await self.writer.drain()
+        return await self._read_reply()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+# Клиент протокола Redis (RESP2) поверх asyncio без внешних зависимостей.
+# Подходит для Redis и совместимых серверов; кэш общий для всех воркеров.
+class RedisBackend(CacheBackend):
+    def __init__(self, url: str, pool_size: int, tag_ttl: int):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.database = int(parsed.path.lstrip("/") or 0)
+        self.tag_ttl = tag_ttl
+        self._pool: asyncio.Queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(pool_size)
+
+    async def _connect(self) -> _Connection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        connection = _Connection(reader, writer)
+        if self.password:
+            await connection.execute("AUTH", self.password)
+        if self.database:
+            await connection.execute("SELECT", self.database)
+        return connection
+
+    async def _execute(self, *args):
+        async with self._semaphore:
+            connection = self._pool.get_nowait() if not self._pool.empty() else await self._connect()
+            try:
+                result = await connection.execute(*args)
+            except CacheError:
+                # Ошибка команды, ответ прочитан полностью
+                self._pool.put_nowait(connection)
+                raise
+            except BaseException:
+                # Ответ мог остаться непрочитанным - соединение больше не используем
+                connection.close()
+                raise
+            self._pool.put_nowait(connection)
+            return result
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._execute("GET", key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        if ttl:
+            await self._execute("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            await self._execute("SET", key, value)
+
+    async def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        if ttl:
+            result = await self._execute("SET", key, value, "NX", "PX", int(ttl * 1000))
+        else:
+            result = await self._execute("SET", key, value, "NX")
+        return result == "OK"
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self._execute("DEL", *keys)
+
+    async def tag(self, key: str, tags: Iterable[str]) -> None:
+        for tag in tags:
+            await self._execute("SADD", tag, key)
+            await self._execute("EXPIRE", tag, self.tag_ttl)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        count = 0
+        for tag in tags:
+            keys = await self._execute("SMEMBERS", tag) or []
+            await self._execute("DEL", tag, *keys)
+            count += len(keys)
+        return count
+
+    async def close(self) -> None:
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
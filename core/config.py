@@ -31,6 +31,10 @@ PORT = 8000
 
 # USERS
 USER_BAN_STATUS_ID = 2
+VERIFICATION_STATUS_PENDING_ID = 3  # паспорт загружен, ждёт верификатора
+PASSPORT_CLAIM_LEASE = 600  # секунды: аренда паспорта верификатором (POST /api/verifier/passports/claim)
+PASSPORT_CLAIM_MAX = 50  # паспортов за один захват
+PASSPORT_QUEUE_PAGE_SIZE = 100  # максимум строк на странице очереди паспортов
 
 # EMPLOYEES
 MEGAADMIN_EMPLOYEE_ROLE = 1
@@ -43,6 +47,12 @@ EMPLOYMENT_STATUS_ID_BLOCKED = 2
 BALANCE_INCREASE_ID = 1
 BALANCE_DECREASE_ID = 2
 
+# PROPOSALS
+PROPOSAL_STATUS_ACTIVE_ID = 3  # на рассмотрении у брокера
+PROPOSAL_STATUS_WAITING_ID = 4  # лимитная заявка ждёт цену
+PROPOSAL_CLAIM_LEASE = 300  # секунды: аренда предложения брокером (POST /api/broker/proposal/claim)
+PROPOSAL_CLAIM_MAX = 50  # предложений за один захват
+
 TABLES = {
     "admin_rights_level": AdminRightsLevel,
     "depository_account_operation_type": DepositoryAccountOperationType,
@@ -67,4 +77,62 @@ TABLES = {
     "price_history": PriceHistory,
     "currency_rate": CurrencyRate,
     "user_restriction_status": UserRestrictionStatus
-}
\ No newline at end of file
+}
+
+# TRANSACTION RETRIES (SQLSTATE 40001 / 40P01)
+TRANSACTION_RETRY_ATTEMPTS = 5
+TRANSACTION_RETRY_BASE_DELAY = 0.02  # секунды
+TRANSACTION_RETRY_MAX_DELAY = 0.5
+
+# ADMISSION CONTROL
+# Общий бюджет одновременных запросов: pool_size (5) + max_overflow (10) по умолчанию
+ADMISSION_CAPACITY = 15
+
+# CACHE
+CACHE_BACKEND = "memory"  # "memory" - LRU в процессе, "redis" - общий для воркеров кэш
+CACHE_REDIS_URL = "redis://localhost:6379/0"
+CACHE_REDIS_POOL_SIZE = 10
+CACHE_KEY_PREFIX = "dbcourse"
+CACHE_MAX_ENTRIES = 10000
+CACHE_DEFAULT_TTL = 60  # секунды
+CACHE_TAG_TTL = 86400
+CACHE_LOCK_TIMEOUT = 5.0
+CACHE_LOCK_POLL_INTERVAL = 0.05
+
+# DATA CHANGE NOTIFICATIONS (LISTEN/NOTIFY)
+DATA_CHANGES_CHANNEL = "data_changes"
+LISTENER_RECONNECT_BASE_DELAY = 0.5  # секунды
+LISTENER_RECONNECT_MAX_DELAY = 30.0
+LISTENER_KEEPALIVE_INTERVAL = 30.0
+
+# PUSH (WebSocket / SSE)
+PRICE_CHANGES_CHANNEL = "price_changes"
+PROPOSAL_STATUS_CHANNEL = "proposal_status_changes"
+PUSH_QUEUE_SIZE = 100  # событий на подписчика, дальше - resync
+PUSH_KEEPALIVE_INTERVAL = 15.0  # секунды
+
+# DEGRADED MODE (stale-while-revalidate + circuit breaker)
+BREAKER_FAILURE_THRESHOLD = 5  # ошибок БД подряд до размыкания
+BREAKER_RESET_TIMEOUT = 10.0  # секунды до пробного запроса
+STALE_TTL = 86400  # сколько хранить последний успешный ответ
+STALE_MAX_BYTES = 1024 * 1024  # ответы крупнее (истории цен и курсов) без запасной копии
+STALE_REFRESH_INTERVAL = 300  # секунды: обновление копии ответа без ETag
+PRINCIPAL_CACHE_TTL = 60
+
+# STATEMENTS (выписки)
+STATEMENT_BATCH_SIZE = 500  # строк за одну выборку серверного курсора
+
+# BULK IMPORT
+BULK_MAX_REPORTED_REJECTS = 1000  # отклонённых строк в ответе (счётчик - все)
+BULK_MAX_SECURITIES = 1000  # бумаг в одном запросе POST /api/admin/exchange/stocks/bulk
+BULK_MAX_USERS = 10000  # пользователей в одном запросе POST /api/staff/users/bulk
+BULK_MAX_PASSPORTS = 500  # паспортов в одном запросе POST /api/verifier/passports/verify
+LOOKUP_CACHE_TTL = 3600  # справочники статусов меняются только миграциями
+BULK_USER_CHUNK_SIZE = 10000  # пользователей в одной транзакции массовой загрузки
+
+# BACKGROUND JOBS (db/jobs.py)
+JOBS_CHANNEL = "background_jobs"  # NOTIFY при постановке задачи - будит воркеры
+JOB_WORKERS = 2  # задач одновременно в одном процессе
+JOB_CHUNK_SIZE = 500  # строк в одной транзакции задачи
+JOB_POLL_INTERVAL = 5.0  # секунды: опрос очереди, если уведомление потерялось
+JOB_STALE_TIMEOUT = 120.0  # секунды без пульса - задачу забирает другой воркер
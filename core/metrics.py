@@ -0,0 +1,14 @@
+# core/metrics.py
+from collections import defaultdict
+from typing import Dict
+
+# Счётчики в памяти процесса: {метрика: {метка: значение}}
+_counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+def increment(name: str, label: str, value: int = 1) -> None:
+    _counters[name][label] += value
+
+
+def snapshot() -> Dict[str, Dict[str, int]]:
+    return {name: dict(labels) for name, labels in _counters.items()}
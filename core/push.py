@@ -0,0 +1,96 @@
+# core/push.py
+import asyncio
+import json
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from core import metrics
+from core.config import PRICE_CHANGES_CHANNEL, PROPOSAL_STATUS_CHANNEL, PUSH_QUEUE_SIZE
+from db.notifications import notification_listener
+
+PRICES_TOPIC = "prices"
+
+# Клиент пропустил события и должен перезапросить данные через REST
+RESYNC_MESSAGE = json.dumps({"type": "resync"})
+
+
+def user_topic(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+class Subscription:
+    def __init__(self, topics: Iterable[str], queue_size: int):
+        self.topics = tuple(topics)
+        self.queue: asyncio.Queue[str] = asyncio.Queue(queue_size)
+
+    def offer(self, message: str) -> None:
+        # Медленный клиент не задерживает остальных: при переполнении очереди
+        # старые события отбрасываются, вместо них - одно событие resync
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_MESSAGE)
+            metrics.increment("push_overflows", self.topics[0])
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+# Раздача событий подписчикам воркера. События приходят из единственного
+# соединения LISTEN (db.notifications), а не из отдельного запроса на клиента.
+class PushHub:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: dict[str, set[Subscription]] = defaultdict(set)
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        subscription = Subscription(topics, self.queue_size)
+        for topic in subscription.topics:
+            self._subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def publish(self, topic: str, event: dict) -> None:
+        subscribers = self._subscribers.get(topic)
+        if not subscribers:
+            return
+        message = json.dumps(event, ensure_ascii=False)
+        for subscription in list(subscribers):
+            subscription.offer(message)
+        metrics.increment("push_events", event["type"])
+
+    def resync_all(self) -> None:
+        for subscription in {s for subscribers in self._subscribers.values() for s in subscribers}:
+            subscription.offer(RESYNC_MESSAGE)
+
+
+push_hub = PushHub(PUSH_QUEUE_SIZE)
+
+
+async def _on_price_change(payload: str) -> None:
+    push_hub.publish(PRICES_TOPIC, {"type": "price", **json.loads(payload)})
+
+
+async def _on_proposal_status(payload: str) -> None:
+    data = json.loads(payload)
+    user_id = data.pop("user_id")
+    push_hub.publish(user_topic(user_id), {"type": "proposal_status", **data})
+
+
+async def _on_reconnect() -> None:
+    push_hub.resync_all()
+
+
+notification_listener.subscribe(PRICE_CHANGES_CHANNEL, _on_price_change, _on_reconnect)
+notification_listener.subscribe(PROPOSAL_STATUS_CHANNEL, _on_proposal_status)
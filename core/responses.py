@@ -0,0 +1,37 @@
+# core/responses.py
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+from starlette import status
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        # Точное число из БД без округления через float (12.30 -> 12.30)
+        if not obj.is_finite():
+            return None
+        return orjson.Fragment(format(obj, "f"))
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Тип {type(obj).__name__} не сериализуется в JSON")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# Ответ, провалидированный схемой ровно один раз: строки из БД сразу
+# проверяются TypeAdapter'ом и отдаются без повторной проверки FastAPI
+# (response_model в декораторе остаётся для документации). Режим "json" -
+# тот же формат, что у FastAPI: Decimal-поля моделей остаются строками.
+def model_response(adapter: TypeAdapter, data: Any, status_code: int = status.HTTP_200_OK) -> ORJSONResponse:
+    validated = adapter.validate_python(data, from_attributes=True)
+    return ORJSONResponse(adapter.dump_python(validated, mode="json"), status_code=status_code)
@@ -0,0 +1,64 @@
+# core/single_flight.py
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+from core import metrics
+from core.responses import dumps
+
+
+class _LeaderCancelled(Exception):
+    pass
+
+
+# Ключ -> future с уже сериализованным JSON ответа
+_in_flight: dict[tuple, asyncio.Future] = {}
+
+
+def _make_key(route: str, params: dict) -> tuple:
+    return (route, tuple(sorted(params.items())))
+
+
+# Одинаковые параллельные чтения ждут один запрос к БД и получают
+# одни и те же байты ответа. Первый запрос (лидер) выполняет loader,
+# остальные считаются в single_flight_coalesced.
+async def single_flight(route: str, params: dict, loader: Callable[[], Awaitable[bytes]]) -> bytes:
+    key = _make_key(route, params)
+    while key in _in_flight:
+        metrics.increment("single_flight_coalesced", route)
+        try:
+            return await asyncio.shield(_in_flight[key])
+        except _LeaderCancelled:
+            # Лидер отменён (клиент отключился) - пробуем выполнить запрос сами
+            continue
+
+    future = asyncio.get_running_loop().create_future()
+    # Ошибку могут не забрать, если ожидающих не было
+    future.add_done_callback(lambda f: f.exception())
+    _in_flight[key] = future
+    metrics.increment("single_flight_leaders", route)
+    try:
+        content = await loader()
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    except BaseException:
+        future.set_exception(_LeaderCancelled())
+        raise
+    else:
+        future.set_result(content)
+        return content
+    finally:
+        del _in_flight[key]
+
+
+# Для ORM-объектов: jsonable_encoder отбрасывает служебные атрибуты SQLAlchemy
+def encode_json(data: Any) -> bytes:
+    return dumps(jsonable_encoder(data))
+
+
+def json_response(content: bytes, etag: Optional[str] = None) -> Response:
+    headers = {"ETag": etag} if etag is not None else None
+    return Response(content=content, media_type="application/json", headers=headers)
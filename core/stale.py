@@ -0,0 +1,208 @@
+# core/stale.py
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from core import metrics
+from core.cache import Cache
+from core.config import (
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, STALE_TTL, STALE_MAX_BYTES, STALE_REFRESH_INTERVAL
+)
+from core.single_flight import single_flight, json_response
+from db.errors import (
+    get_sqlstate, CONNECTION_EXCEPTION_CLASS, TOO_MANY_CONNECTIONS, ADMIN_SHUTDOWN, CRASH_SHUTDOWN,
+    CANNOT_CONNECT_NOW
+)
+from db.session import AsyncSessionLocal
+from db.transactions import apply_transaction_profile, INTERACTIVE_READ
+
+# Ошибки чтения из БД, при которых отдаётся запасная копия ответа
+DB_ERRORS = (SQLAlchemyError, OSError, asyncio.TimeoutError)
+
+UNAVAILABLE_SQLSTATES = {TOO_MANY_CONNECTIONS, ADMIN_SHUTDOWN, CRASH_SHUTDOWN, CANNOT_CONNECT_NOW}
+
+
+# Предохранитель считает только недоступность БД: нет соединения, таймаут
+# пула, разрыв соединения. Таймаут или ошибка одного запроса (медленный
+# отчёт) не должны переводить в деградацию все остальные endpoint'ы.
+def is_unavailable(exc: BaseException) -> bool:
+    if isinstance(exc, (InterfaceError, PoolTimeoutError, OSError, asyncio.TimeoutError)):
+        return True
+    if not isinstance(exc, DBAPIError):
+        return False
+    if exc.connection_invalidated:
+        return True
+    sqlstate = get_sqlstate(exc)
+    if sqlstate is None:
+        return isinstance(exc, OperationalError)
+    return sqlstate.startswith(CONNECTION_EXCEPTION_CLASS) or sqlstate in UNAVAILABLE_SQLSTATES
+
+Loader = Callable[[AsyncSession], Awaitable[bytes]]
+
+
+# Размыкается после BREAKER_FAILURE_THRESHOLD ошибок подряд; через
+# BREAKER_RESET_TIMEOUT пропускает один пробный запрос (half-open)
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    @property
+    def closed(self) -> bool:
+        return self.state == self.CLOSED
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                metrics.increment("circuit_breaker_opened", self.name)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    # Неудачный пробный запрос с любой причиной: снова ждать BREAKER_RESET_TIMEOUT
+    def reopen(self) -> None:
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+
+db_breaker = CircuitBreaker("database", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+
+# Последние успешные ответы (без учёта версии данных): строка с временем
+# сохранения, затем тело ответа как есть
+_last_good = Cache("stale", ttl=STALE_TTL)
+# ключ -> (ETag, время сохранения) копии, записанной этим процессом
+_stored: dict[str, tuple[Optional[str], float]] = {}
+# ключ -> фоновое обновление (ссылка держит задачу до завершения)
+_refreshing: dict[str, asyncio.Task] = {}
+
+
+def _stale_key(route: str, params: dict) -> str:
+    return f"{route}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+# Копия обновляется раз на версию данных (ETag), а для ответов без ETag -
+# не чаще STALE_REFRESH_INTERVAL; до истечения STALE_TTL - повторно
+def _should_store(key: str, etag: Optional[str], size: int) -> bool:
+    if size > STALE_MAX_BYTES:
+        return False
+    stored = _stored.get(key)
+    if stored is None:
+        return True
+    stored_etag, stored_at = stored
+    age = time.monotonic() - stored_at
+    if etag is None:
+        return age >= STALE_REFRESH_INTERVAL
+    return etag != stored_etag or age >= STALE_TTL / 2
+
+
+async def _load(key: str, loader: Loader, db: AsyncSession, etag: Optional[str] = None) -> bytes:
+    content = await loader(db)
+    if _should_store(key, etag, len(content)):
+        _stored[key] = (etag, time.monotonic())
+        await _last_good.set_bytes(key, f"{time.time()}\n".encode() + content)
+    return content
+
+
+async def _refresh(key: str, loader: Loader, profile) -> None:
+    try:
+        if not db_breaker.allow():
+            return
+        # Пробный запрос - единственный путь из half-open: любой исход, кроме
+        # успешной загрузки (ошибка запроса, таймаут, отмена), размыкает снова
+        loaded = False
+        try:
+            async with AsyncSessionLocal() as db:
+                await apply_transaction_profile(db, profile)
+                await _load(key, loader, db)
+            loaded = True
+        except Exception:
+            metrics.increment("breaker_probe_failures", db_breaker.name)
+        finally:
+            if loaded:
+                db_breaker.record_success()
+            else:
+                db_breaker.reopen()
+    finally:
+        _refreshing.pop(key, None)
+
+
+def _schedule_refresh(key: str, loader: Loader, profile) -> None:
+    if key in _refreshing:
+        return
+    _refreshing[key] = asyncio.create_task(_refresh(key, loader, profile))
+
+
+# Чтение с деградацией: при ошибке БД или разомкнутом предохранителе отдаёт
+# последний успешный ответ с заголовками устаревания и обновляет его в фоне.
+# loader получает сессию, так как фоновое обновление идёт в своей сессии.
+async def serve_with_fallback(
+    route: str,
+    params: dict,
+    loader: Loader,
+    db: AsyncSession,
+    etag: Optional[str] = None
+) -> Response:
+    key = _stale_key(route, params)
+    profile = db.info.get("transaction_profile", INTERACTIVE_READ)
+
+    if db_breaker.closed:
+        try:
+            content = await single_flight(route, {**params, "etag": etag}, lambda: _load(key, loader, db, etag))
+        except DB_ERRORS as e:
+            if is_unavailable(e):
+                db_breaker.record_failure()
+            try:
+                await db.rollback()
+            except DB_ERRORS:
+                pass
+        else:
+            db_breaker.record_success()
+            return json_response(content, etag)
+
+    if not db_breaker.closed:
+        # Пробный запрос (half-open) идёт в фоне, а не в запросе клиента
+        _schedule_refresh(key, loader, profile)
+
+    stale = await _last_good.get_bytes(key)
+    if stale is None:
+        metrics.increment("stale_unavailable", route)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="База данных временно недоступна. Попробуйте позже.",
+            headers={"Retry-After": str(int(BREAKER_RESET_TIMEOUT))}
+        )
+
+    metrics.increment("stale_responses", route)
+    stored_at, _, content = stale.partition(b"\n")
+    age = int(time.time() - float(stored_at))
+    # ETag не отдаём: устаревшее содержимое не соответствует текущей версии
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers={"X-Stale-Age": str(age), "Warning": '110 - "Response is Stale"'}
+    )
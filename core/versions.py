@@ -0,0 +1,45 @@
+# core/versions.py
+from collections import defaultdict
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from starlette import status
+
+# Версии справочных данных по ключам TABLES. Источник - последовательности
+# data_version_* в БД: триггер trg_notify_data_change берёт следующее значение
+# и рассылает его в NOTIFY, db.notifications записывает его сюда. Так у всех
+# воркеров одна и та же версия и один ETag, а сам воркер после своей записи
+# ничего не увеличивает.
+VERSIONED_TABLES = ("bank", "currency", "currency_rate", "security", "price_history")
+
+_versions: Dict[str, int] = defaultdict(int)
+
+
+# Уведомления могут прийти не по порядку - версия только растёт
+def set_version(table: str, version: int) -> None:
+    if version > _versions[table]:
+        _versions[table] = version
+
+
+# variant - вид ответа, если содержимое зависит не только от данных
+# (например, от типа пользователя)
+def get_etag(*tables: str, variant: Optional[str] = None) -> str:
+    versions = ".".join(str(_versions[table]) for table in tables)
+    suffix = f"-{variant}" if variant is not None else ""
+    return f'"{versions}{suffix}"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Для If-None-Match используется слабое сравнение (RFC 9110)
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+# 304 без обращения к БД, если клиент прислал актуальный ETag
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return None
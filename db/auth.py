@@ -6,7 +6,8 @@ from jose import jwt, JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from core.config import MEGAADMIN_EMPLOYEE_ROLE, ADMIN_EMPLOYEE_ROLE, BROKER_EMPLOYEE_ROLE, VERIFIER_EMPLOYEE_ROLE
+from core.cache import Cache
+from core.config import MEGAADMIN_EMPLOYEE_ROLE, ADMIN_EMPLOYEE_ROLE, BROKER_EMPLOYEE_ROLE, VERIFIER_EMPLOYEE_ROLE, PRINCIPAL_CACHE_TTL
 from db.models.models import User, Staff
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -14,6 +15,8 @@ from .session import get_db
 
 bearer_scheme = HTTPBearer()
 
+_principals = Cache("principals", ttl=PRINCIPAL_CACHE_TTL)
+
 SECRET_KEY = "your-secret-key-change-in-production-12345"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1000
@@ -58,13 +61,19 @@ async def get_current_user(
     token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     db: AsyncSession = Depends(get_db)
 ) -> Dict:
+    return await resolve_principal(token.credentials, db)
+
+
+# Проверка токена без HTTPBearer - для WebSocket и SSE, где браузер
+# не может передать заголовок Authorization
+async def resolve_principal(token: str, db: AsyncSession) -> Dict:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Не удалось проверить учетные данные",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         role = payload.get("role")
         staff_id = payload.get("staff_id")
         user_id = payload.get("user_id")
@@ -89,12 +98,22 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
+    # Проверка существования кэшируется: при недоступной БД недавно
+    # проверенные токены продолжают работать (сброс - по NOTIFY на таблицы)
     if user_type == "staff":
-        exists = await db.scalar(select(Staff.id).where(Staff.id == id_to_check))
+        exists = await _principals.get_or_set(
+            f"staff:{id_to_check}",
+            lambda: db.scalar(select(Staff.id).where(Staff.id == id_to_check)),
+            tags=["staff"]
+        )
         if exists is None:
             raise credentials_exception
     else:
-        exists = await db.scalar(select(User.id).where(User.id == id_to_check))
+        exists = await _principals.get_or_set(
+            f"user:{id_to_check}",
+            lambda: db.scalar(select(User.id).where(User.id == id_to_check)),
+            tags=["user"]
+        )
         if exists is None:
             raise credentials_exception
 
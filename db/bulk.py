@@ -0,0 +1,196 @@
+# db/bulk.py
+import codecs
+import csv
+import json
+from decimal import InvalidOperation
+from typing import AsyncIterable, AsyncIterator, Callable, Optional
+
+from fastapi import HTTPException, Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from core.config import BULK_MAX_REPORTED_REJECTS
+
+# Массовая загрузка: файл (CSV с заголовком или NDJSON) читается потоком -
+# из тела запроса или с диска (db.imports) - строки приводятся к типам и
+# через COPY попадают во временную таблицу. Проверки по БД и запись делает
+# вызывающий код одним SQL.
+
+FILE_EXTENSIONS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+}
+
+UPLOAD_FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+}
+
+# Ошибки разбора значения строки - строка отклоняется, загрузка продолжается
+PARSE_ERRORS = (ValueError, TypeError, KeyError, InvalidOperation)
+
+# parse(record) -> кортеж значений колонок staging-таблицы (без line)
+RowParser = Callable[[dict], tuple]
+
+
+# limit=None - хранить все отказы (файл отказов в командной строке)
+class BulkRejects:
+    def __init__(self, limit: Optional[int] = BULK_MAX_REPORTED_REJECTS):
+        self.limit = limit
+        self.count = 0
+        self.items: list[dict] = []
+
+    def add(self, line: int, error: str) -> None:
+        self.count += 1
+        if self.limit is None or len(self.items) < self.limit:
+            self.items.append({"line": line, "error": error})
+
+    def extend(self, rows) -> None:
+        for line, error in rows:
+            self.add(line, error)
+
+    def report(self) -> dict:
+        return {
+            "rejected": self.count,
+            "rejects": sorted(self.items, key=lambda item: item["line"]),
+        }
+
+
+def upload_format(request: Request) -> str:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = UPLOAD_FORMATS.get(content_type)
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Ожидается Content-Type: text/csv или application/x-ndjson"
+        )
+    return fmt
+
+
+async def _lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    try:
+        async for chunk in chunks:
+            *lines, tail = (tail + decoder.decode(chunk)).split("\n")
+            for line in lines:
+                yield line
+        tail += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Файл должен быть в кодировке UTF-8"
+        )
+    if tail:
+        yield tail
+
+
+async def _records(chunks: AsyncIterable[bytes], fmt: str, fields: tuple[str, ...],
+                   rejects: BulkRejects) -> AsyncIterator[tuple[int, dict]]:
+    header: Optional[list[str]] = None
+    line_no = 0
+    async for line in _lines(chunks):
+        line_no += 1
+        line = line.rstrip("\r")
+        if not line.strip():
+            continue
+
+        if fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except ValueError:
+                rejects.add(line_no, "Некорректный JSON")
+                continue
+            if not isinstance(record, dict):
+                rejects.add(line_no, "Ожидается JSON-объект")
+                continue
+            yield line_no, record
+            continue
+
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [value.strip().lower() for value in values]
+            missing = [field for field in fields if field not in header]
+            if missing:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"В заголовке CSV нет колонок: {', '.join(missing)}"
+                )
+            continue
+        if len(values) != len(header):
+            rejects.add(line_no, f"Ожидается колонок: {len(header)}, получено: {len(values)}")
+            continue
+        yield line_no, dict(zip(header, values))
+
+
+async def _parsed(chunks: AsyncIterable[bytes], fmt: str, fields: tuple[str, ...], parse: RowParser,
+                  rejects: BulkRejects) -> AsyncIterator[tuple]:
+    async for line_no, record in _records(chunks, fmt, fields, rejects):
+        try:
+            yield (line_no, *parse(record))
+        except PARSE_ERRORS as e:
+            rejects.add(line_no, f"Некорректное значение: {e}")
+
+
+# Создаёт таблицу загрузки и заливает в неё файл через COPY. По умолчанию
+# таблица временная и удаляется при коммите; temporary=False - UNLOGGED
+# таблица для загрузок с коммитом по частям (удаляет вызывающий код).
+# fields - обязательные поля файла, parse переводит запись файла в значения
+# columns. Кроме columns в таблице есть line, error (причина отказа,
+# заполняет проверка) и extra_columns для данных, найденных проверкой.
+# Возвращает число загруженных строк.
+async def copy_upload(
+    db: AsyncSession,
+    chunks: AsyncIterable[bytes],
+    fmt: str,
+    table: str,
+    fields: tuple[str, ...],
+    columns: dict[str, str],
+    parse: RowParser,
+    rejects: BulkRejects,
+    extra_columns: Optional[dict[str, str]] = None,
+    temporary: bool = True
+) -> int:
+    definition = ", ".join(
+        f"{name} {sql_type}" for name, sql_type in {**columns, **(extra_columns or {})}.items()
+    )
+    if temporary:
+        create = f"CREATE TEMP TABLE {table} (line integer PRIMARY KEY, {definition}, error text) ON COMMIT DROP"
+    else:
+        create = f"CREATE UNLOGGED TABLE {table} (line integer PRIMARY KEY, {definition}, error text)"
+    await db.execute(text(create))
+
+    # COPY доступен только в драйвере: берём соединение asyncpg этой же транзакции
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    result = await raw_connection.driver_connection.copy_records_to_table(
+        table,
+        records=_parsed(chunks, fmt, fields, parse, rejects),
+        columns=["line", *columns],
+    )
+    # У временных таблиц нет автоанализа - без статистики планировщик
+    # ошибается в соединениях на больших файлах
+    await db.execute(text(f"ANALYZE {table}"))
+    return int(result.split()[-1])
+
+
+async def collect_rejects(db: AsyncSession, table: str, rejects: BulkRejects) -> None:
+    result = await db.execute(text(f"SELECT line, error FROM {table} WHERE error IS NOT NULL"))
+    rejects.extend(result)
+
+
+def optional(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def required(record: dict, field: str) -> str:
+    value = optional(record.get(field))
+    if value is None:
+        raise ValueError(f"не заполнено поле {field}")
+    return value
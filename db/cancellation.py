@@ -0,0 +1,50 @@
+# db/cancellation.py
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import metrics
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+# Следит за отключением клиента и отменяет задачу запроса.
+# asyncpg при отмене ожидающего запроса сам отправляет серверу CancelRequest,
+# после чего сессия откатывается и соединение возвращается в пул.
+# Тело запроса FastAPI читает до зависимостей, поэтому дальше receive()
+# может вернуть только http.disconnect.
+@asynccontextmanager
+async def cancel_on_disconnect(request: Request, db: AsyncSession):
+    task = asyncio.current_task()
+    route = getattr(request.scope.get("endpoint"), "__name__", request.url.path)
+    disconnected = False
+
+    async def watch():
+        nonlocal disconnected
+        while True:
+            message = await request.receive()
+            if message["type"] == "http.disconnect":
+                disconnected = True
+                task.cancel()
+                return
+
+    watcher = asyncio.create_task(watch())
+    try:
+        yield
+    except asyncio.CancelledError:
+        if not disconnected:
+            raise
+        task.uncancel()
+        metrics.increment("client_disconnects", route)
+        try:
+            await db.rollback()
+        except Exception:
+            # Соединение в неизвестном состоянии - не возвращаем его в пул
+            await db.invalidate()
+        raise ClientDisconnected()
+    finally:
+        watcher.cancel()
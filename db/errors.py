@@ -0,0 +1,31 @@
+# db/errors.py
+from typing import Optional
+
+UNIQUE_VIOLATION = "23505"
+FOREIGN_KEY_VIOLATION = "23503"
+SERIALIZATION_FAILURE = "40001"
+DEADLOCK_DETECTED = "40P01"
+# Недоступность сервера (класс 08 - ошибки соединения - проверяется отдельно)
+TOO_MANY_CONNECTIONS = "53300"
+ADMIN_SHUTDOWN = "57P01"
+CRASH_SHUTDOWN = "57P02"
+CANNOT_CONNECT_NOW = "57P03"
+CONNECTION_EXCEPTION_CLASS = "08"
+
+
+def _asyncpg_error(exc: BaseException) -> BaseException:
+    # sqlalchemy.exc.DBAPIError -> адаптер asyncpg в SQLAlchemy -> исключение asyncpg
+    orig = getattr(exc, "orig", None) or exc
+    return orig.__cause__ or orig
+
+
+def get_sqlstate(exc: BaseException) -> Optional[str]:
+    orig = getattr(exc, "orig", None)
+    sqlstate = getattr(orig, "sqlstate", None)
+    if sqlstate is None:
+        sqlstate = getattr(_asyncpg_error(exc), "sqlstate", None)
+    return sqlstate
+
+
+def get_constraint_name(exc: BaseException) -> Optional[str]:
+    return getattr(_asyncpg_error(exc), "constraint_name", None)
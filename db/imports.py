@@ -0,0 +1,347 @@
+# db/imports.py
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import uuid
+from datetime import date
+from decimal import Decimal
+from typing import AsyncIterable, AsyncIterator, Callable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import cache, metrics
+from core.config import BULK_MAX_REPORTED_REJECTS, BULK_USER_CHUNK_SIZE
+from db.bulk import BulkRejects, FILE_EXTENSIONS, copy_upload, collect_rejects, optional, required
+from db.session import AsyncSessionLocal, engine
+from db.transactions import apply_transaction_profile, BULK_WRITE
+
+# Загрузки файлом: общие для HTTP (routers/admin_router.py) и командной
+# строки (python -m db.imports). Коммит делает вызывающий код, кроме
+# загрузки пользователей - она коммитит по частям сама.
+
+def _decimal(value: str) -> Decimal:
+    number = Decimal(value)
+    if not number.is_finite():
+        raise ValueError("ожидается число")
+    return number
+
+
+def _parse_price_row(record: dict) -> tuple:
+    return (
+        required(record, "isin").upper(),
+        date.fromisoformat(required(record, "date")),
+        _decimal(required(record, "price")),
+    )
+
+
+# ISIN уникален только среди неархивированных бумаг: берём действующую,
+# а для архивных - последнюю добавленную
+_validate_prices_query = text("""
+    UPDATE price_staging st
+    SET security_id = checked.security_id,
+        error = checked.error
+    FROM (
+        SELECT
+            st.line,
+            s.id AS security_id,
+            CASE
+                WHEN s.id IS NULL THEN format('Ценная бумага с ISIN %s не найдена', st.isin)
+                WHEN st.price <= 0 THEN 'Цена должна быть больше нуля'
+                WHEN st.price <> round(st.price, 2) THEN 'Цена - не более двух знаков после запятой'
+                WHEN st.price >= 10000000000 THEN 'Цена превышает допустимое значение'
+                WHEN st.price_date > CURRENT_DATE THEN 'Дата цены в будущем'
+                WHEN row_number() OVER (PARTITION BY st.isin, st.price_date ORDER BY st.line DESC) > 1
+                    THEN 'Повтор ISIN и даты в файле: используется последняя строка'
+            END AS error
+        FROM price_staging st
+        LEFT JOIN (
+            SELECT DISTINCT ON ("ISIN") "ISIN" AS isin, "ID ценной бумаги" AS id
+            FROM "Список ценных бумаг"
+            ORDER BY "ISIN", "Статус архивации", "ID ценной бумаги" DESC
+        ) s ON s.isin = st.isin
+    ) checked
+    WHERE checked.line = st.line
+""")
+
+_upsert_prices_query = text("""
+    INSERT INTO "История цены" ("Дата", "Цена", "ID ценной бумаги")
+    SELECT price_date, price, security_id
+    FROM price_staging
+    WHERE error IS NULL
+    ON CONFLICT ("Дата", "ID ценной бумаги") DO UPDATE
+    SET "Цена" = EXCLUDED."Цена"
+""")
+
+
+# История цен: isin,date,price. Существующая цена на дату заменяется.
+async def import_prices(db: AsyncSession, chunks: AsyncIterable[bytes], fmt: str, rejects: BulkRejects) -> dict:
+    received = await copy_upload(
+        db, chunks, fmt, "price_staging",
+        fields=("isin", "date", "price"),
+        columns={"isin": "text", "price_date": "date", "price": "numeric"},
+        parse=_parse_price_row,
+        rejects=rejects,
+        extra_columns={"security_id": "integer"}
+    )
+    await db.execute(_validate_prices_query)
+    await collect_rejects(db, "price_staging", rejects)
+    result = await db.execute(_upsert_prices_query)
+    metrics.increment("bulk_rows_imported", "price_history", result.rowcount)
+    return {"received": received, "imported": result.rowcount, **rejects.report()}
+
+
+def _parse_rate_row(record: dict) -> tuple:
+    return (
+        required(record, "code").upper(),
+        date.fromisoformat(required(record, "date")),
+        _decimal(required(record, "rate")),
+    )
+
+
+# Те же правила, что у триггера check_rate_positive и колонки NUMERIC(20,8),
+# но одной проверкой на весь файл: ошибка строки не прерывает загрузку.
+# Курс базовой валюты (ID 1, рубль) всегда 1 и не хранится.
+_validate_rates_query = text("""
+    UPDATE rate_staging st
+    SET currency_id = checked.currency_id,
+        error = checked.error
+    FROM (
+        SELECT
+            st.line,
+            c.id AS currency_id,
+            CASE
+                WHEN c.id IS NULL THEN format('Валюта с кодом %s не найдена', st.code)
+                WHEN c.id = 1 THEN 'Курс базовой валюты не загружается'
+                WHEN st.rate <= 0 THEN 'Курс валюты должен быть положительным числом'
+                WHEN st.rate <> round(st.rate, 8) THEN 'Курс - не более восьми знаков после запятой'
+                WHEN st.rate >= 1000000000000 THEN 'Курс превышает допустимое значение'
+                WHEN st.rate_date > CURRENT_DATE THEN 'Дата курса в будущем'
+                WHEN row_number() OVER (PARTITION BY st.code, st.rate_date ORDER BY st.line DESC) > 1
+                    THEN 'Повтор валюты и даты в файле: используется последняя строка'
+            END AS error
+        FROM rate_staging st
+        LEFT JOIN (
+            SELECT DISTINCT ON ("Код") trim("Код") AS code, "ID валюты" AS id
+            FROM "Список валют"
+            ORDER BY "Код", "Статус архивации", "ID валюты" DESC
+        ) c ON c.code = st.code
+    ) checked
+    WHERE checked.line = st.line
+""")
+
+_upsert_rates_query = text("""
+    INSERT INTO "Курсы валют" ("ID валюты", "Курс к рублю", "Дата")
+    SELECT currency_id, rate, rate_date
+    FROM rate_staging
+    WHERE error IS NULL
+    ON CONFLICT ("ID валюты", "Дата") DO UPDATE
+    SET "Курс к рублю" = EXCLUDED."Курс к рублю"
+""")
+
+
+# Курсы к рублю: code,date,rate. Существующий курс на дату заменяется.
+async def import_currency_rates(db: AsyncSession, chunks: AsyncIterable[bytes], fmt: str, rejects: BulkRejects) -> dict:
+    received = await copy_upload(
+        db, chunks, fmt, "rate_staging",
+        fields=("code", "date", "rate"),
+        columns={"code": "text", "rate_date": "date", "rate": "numeric"},
+        parse=_parse_rate_row,
+        rejects=rejects,
+        extra_columns={"currency_id": "integer"}
+    )
+    await db.execute(_validate_rates_query)
+    await collect_rejects(db, "rate_staging", rejects)
+    result = await db.execute(_upsert_rates_query)
+    metrics.increment("bulk_rows_imported", "currency_rate", result.rowcount)
+    return {"received": received, "imported": result.rowcount, **rejects.report()}
+
+
+def _parse_user_row(record: dict) -> tuple:
+    registration_date = optional(record.get("registration_date"))
+    return (
+        required(record, "login"),
+        required(record, "email"),
+        required(record, "password_hash"),
+        date.fromisoformat(registration_date) if registration_date else date.today(),
+    )
+
+
+# Правила register_user и колонок таблицы "Пользователь". Пароль принимается
+# только готовым bcrypt-хешем: хеширование миллионов паролей здесь заняло бы дни.
+# Повтор логина или email в файле - побеждает первая строка.
+_validate_users_query = r"""
+    UPDATE {table} st
+    SET error = checked.error
+    FROM (
+        SELECT
+            st.line,
+            CASE
+                WHEN length(st.login) > 30 THEN 'Логин длиннее 30 символов'
+                WHEN length(st.email) > 40 THEN 'Email длиннее 40 символов'
+                WHEN st.email !~ '^[^@\s]+@[^@\s]+\.[^@\s]+$' THEN 'Некорректный email'
+                WHEN st.password_hash !~ '^\$2[aby]\$[0-9]{{2}}\$[./A-Za-z0-9]{{53}}$'
+                    THEN 'Пароль должен быть bcrypt-хешем'
+                WHEN st.registration_date > CURRENT_DATE THEN 'Дата регистрации в будущем'
+                WHEN by_login."ID пользователя" IS NOT NULL THEN 'Логин уже занят'
+                WHEN by_email."ID пользователя" IS NOT NULL THEN 'Email уже зарегистрирован'
+                WHEN row_number() OVER (PARTITION BY st.login ORDER BY st.line) > 1
+                    THEN 'Логин повторяется в файле'
+                WHEN row_number() OVER (PARTITION BY st.email ORDER BY st.line) > 1
+                    THEN 'Email повторяется в файле'
+            END AS error
+        FROM {table} st
+        LEFT JOIN "Пользователь" by_login ON by_login."Логин" = st.login
+        LEFT JOIN "Пользователь" by_email ON by_email."Электронная почта" = st.email
+    ) checked
+    WHERE checked.line = st.line
+      AND checked.error IS NOT NULL
+"""
+
+# Одна часть по возрастанию line. ON CONFLICT DO NOTHING - на случай
+# регистрации с тем же логином или email после проверки.
+_insert_users_chunk_query = """
+    WITH chunk AS (
+        SELECT line, login, email, password_hash, registration_date
+        FROM {table}
+        WHERE error IS NULL AND line > :after
+        ORDER BY line
+        LIMIT :size
+    ), inserted AS (
+        INSERT INTO "Пользователь" (
+            "Электронная почта", "Дата регистрации", "Логин", "Пароль",
+            "ID статуса верификации", "ID статуса блокировки"
+        )
+        SELECT email, registration_date, login, password_hash, 1, 1
+        FROM chunk
+        ORDER BY line
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    SELECT (SELECT max(line) FROM chunk), (SELECT count(*) FROM chunk), (SELECT count(*) FROM inserted)
+"""
+
+
+# Пользователи из другой системы: login,email,password_hash[,registration_date].
+# Вставка частями по BULK_USER_CHUNK_SIZE с коммитом каждой: блокировки
+# короткие, а после сбоя повторный запуск пропустит уже загруженных
+# (они отклоняются проверкой как занятые). Статусы - как у register_user:
+# не верифицирован, не заблокирован.
+async def import_users(db: AsyncSession, chunks: AsyncIterable[bytes], fmt: str, rejects: BulkRejects,
+                       progress: Optional[Callable[[int, int], None]] = None) -> dict:
+    table = f"user_import_{uuid.uuid4().hex[:12]}"
+    try:
+        received = await copy_upload(
+            db, chunks, fmt, table,
+            fields=("login", "email", "password_hash"),
+            columns={"login": "text", "email": "text", "password_hash": "text", "registration_date": "date"},
+            parse=_parse_user_row,
+            rejects=rejects,
+            temporary=False
+        )
+        await db.execute(text(_validate_users_query.format(table=table)))
+        await collect_rejects(db, table, rejects)
+        total = await db.scalar(text(f"SELECT count(*) FROM {table} WHERE error IS NULL"))
+        await db.commit()
+
+        imported = conflicts = done = 0
+        after = 0
+        chunk_query = text(_insert_users_chunk_query.format(table=table))
+        while True:
+            last_line, chunk_size, inserted = (
+                await db.execute(chunk_query, {"after": after, "size": BULK_USER_CHUNK_SIZE})
+            ).one()
+            await db.commit()
+            if last_line is None:
+                break
+            after = last_line
+            done += chunk_size
+            imported += inserted
+            conflicts += chunk_size - inserted
+            metrics.increment("bulk_rows_imported", "user", inserted)
+            if progress is not None:
+                progress(done, total)
+    finally:
+        await db.rollback()
+        await db.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        await db.commit()
+
+    return {"received": received, "imported": imported, "conflicts": conflicts, **rejects.report()}
+
+
+# Таблица загрузки -> (функция, таблица из core.config.TABLES)
+IMPORTS = {
+    "prices": (import_prices, "price_history"),
+    "rates": (import_currency_rates, "currency_rate"),
+    "users": (import_users, "user"),
+}
+
+
+# Сброс кэша - один раз после коммита всей загрузки, а не на строку.
+# Версии (ETag) всех воркеров меняет NOTIFY триггеров таблиц (db.notifications).
+async def finish_import(*tables: str) -> None:
+    await cache.invalidate(*tables)
+
+
+async def _read_file(path: str, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := await asyncio.to_thread(file.read, chunk_size):
+            yield chunk
+
+
+def _print_progress(done: int, total: int) -> None:
+    print(f"Загружено {done} из {total}", file=sys.stderr, flush=True)
+
+
+def _write_rejects(path: str, rejects: BulkRejects) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(("line", "error"))
+        writer.writerows((item["line"], item["error"]) for item in rejects.report()["rejects"])
+
+
+async def _run_cli(kind: str, path: str, rejects_path: Optional[str]) -> dict:
+    fmt = FILE_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise SystemExit(f"Неизвестный формат файла {path}: ожидается .csv или .ndjson")
+
+    load, table = IMPORTS[kind]
+    # Для файла отказов храним все отказы, в выводе - только первые
+    rejects = BulkRejects(limit=None if rejects_path else BULK_MAX_REPORTED_REJECTS)
+    options = {"progress": _print_progress} if kind == "users" else {}
+    try:
+        async with AsyncSessionLocal() as db:
+            await apply_transaction_profile(db, BULK_WRITE)
+            try:
+                report = await load(db, _read_file(path), fmt, rejects, **options)
+                await db.commit()
+            except HTTPException as e:
+                await db.rollback()
+                raise SystemExit(e.detail)
+            except Exception:
+                await db.rollback()
+                raise
+    finally:
+        await engine.dispose()
+    await finish_import(table)
+    if rejects_path:
+        _write_rejects(rejects_path, rejects)
+        report["rejects"] = report["rejects"][:BULK_MAX_REPORTED_REJECTS]
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовая загрузка цен, курсов валют и пользователей")
+    parser.add_argument(
+        "kind", choices=sorted(IMPORTS),
+        help="prices (isin,date,price), rates (code,date,rate) или "
+             "users (login,email,password_hash[,registration_date])"
+    )
+    parser.add_argument("path", help="файл .csv (с заголовком) или .ndjson")
+    parser.add_argument("--rejects", help="записать отклонённые строки (line,error) в CSV-файл")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_run_cli(args.kind, args.path, args.rejects)), ensure_ascii=False, indent=2))
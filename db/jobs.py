@@ -0,0 +1,472 @@
+# db/jobs.py
+import asyncio
+import json
+import random
+from typing import Awaitable, Callable, Optional
+
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import text
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import cache, metrics
+from core.config import (
+    JOBS_CHANNEL, JOB_WORKERS, JOB_CHUNK_SIZE, JOB_POLL_INTERVAL, JOB_STALE_TIMEOUT, PROPOSAL_STATUS_ACTIVE_ID,
+    PROPOSAL_STATUS_WAITING_ID, TRANSACTION_RETRY_ATTEMPTS, TRANSACTION_RETRY_BASE_DELAY, TRANSACTION_RETRY_MAX_DELAY
+)
+from db.notifications import notification_listener
+from db.retry import is_retryable
+from db.session import AsyncSessionLocal
+from db.transactions import apply_transaction_profile, TransactionProfile, INTERACTIVE_WRITE, MONEY_MOVEMENT
+
+# Фоновые задачи для долгих административных операций. Задача - строка
+# таблицы "Фоновая задача"; воркеры каждого процесса забирают её через
+# FOR UPDATE SKIP LOCKED и выполняют по этапам, порциями по JOB_CHUNK_SIZE
+# строк. Каждая порция коммитится вместе с этапом и курсором задачи, поэтому
+# после падения процесса или ошибки выполнение продолжается с того же места.
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+# Ошибка предметной области: задача завершается со статусом failed
+class JobError(Exception):
+    pass
+
+
+# Задачу забрал другой воркер (пульс устарел) - результат порции отбрасываем
+class _JobLost(Exception):
+    pass
+
+
+# step(db, params, cursor) -> (обработано строк, следующий курсор);
+# курсор None - этап завершён
+JobStep = Callable[[AsyncSession, dict, Optional[int]], Awaitable[tuple[int, Optional[int]]]]
+# count(db, params) -> оценка общего числа строк для прогресса
+JobCounter = Callable[[AsyncSession, dict], Awaitable[int]]
+
+
+class JobKind(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    name: str
+    count: JobCounter
+    stages: tuple[tuple[str, JobStep], ...]
+    profile: TransactionProfile
+    # Версии и теги кэша, сбрасываемые после завершения задачи
+    tables: tuple[str, ...] = ()
+
+
+# ---- Архивация ценной бумаги ----
+
+async def _count_archive_security(db: AsyncSession, params: dict) -> int:
+    result = await db.execute(
+        text("""
+            SELECT
+                (SELECT count(*) FROM "Предложение"
+                 WHERE "ID ценной бумаги" = :security_id AND "ID статуса предложения" IN (:active_status_id, :waiting_status_id))
+              + (SELECT count(*) FROM "Баланс депозитарного счёта" WHERE "ID ценной бумаги" = :security_id)
+              + (SELECT count(*) FROM "История цены" WHERE "ID ценной бумаги" = :security_id)
+        """),
+        {
+            "security_id": params["security_id"],
+            "active_status_id": PROPOSAL_STATUS_ACTIVE_ID,
+            "waiting_status_id": PROPOSAL_STATUS_WAITING_ID,
+        }
+    )
+    return result.scalar_one()
+
+
+# Порция активных и ожидающих цены предложений отклоняется одним вызовом: возвраты и
+# разморозки агрегированы по счетам (reject_security_proposals в DB_SCRIPT.sql)
+async def _reject_proposals(db: AsyncSession, params: dict, cursor: Optional[int]) -> tuple[int, Optional[int]]:
+    result = await db.execute(
+        text("""
+            SELECT p_rejected, p_last_proposal_id, p_error_message
+            FROM reject_security_proposals(:employee_id, :security_id, :limit)
+        """),
+        {"employee_id": params["employee_id"], "security_id": params["security_id"], "limit": JOB_CHUNK_SIZE}
+    )
+    rejected, last_proposal_id, error_message = result.one()
+    if error_message:
+        raise JobError(error_message)
+
+    if rejected < JOB_CHUNK_SIZE:
+        return rejected, None
+    return rejected, last_proposal_id
+
+
+# Удаление порциями по первичному ключу: строки выбранного диапазона
+# блокируются только на время своей транзакции
+def _delete_step(table: str, key: str, owner: str, param: str) -> JobStep:
+    query = text(f"""
+        WITH deleted AS (
+            DELETE FROM "{table}"
+            WHERE "{key}" IN (
+                SELECT "{key}"
+                FROM "{table}"
+                WHERE "{owner}" = :owner_id
+                ORDER BY "{key}"
+                LIMIT :limit
+            )
+            RETURNING 1
+        )
+        SELECT count(*) FROM deleted
+    """)
+
+    async def step(db: AsyncSession, params: dict, cursor: Optional[int]) -> tuple[int, Optional[int]]:
+        result = await db.execute(query, {"owner_id": params[param], "limit": JOB_CHUNK_SIZE})
+        deleted = result.scalar_one()
+        return deleted, (None if deleted < JOB_CHUNK_SIZE else 0)
+
+    return step
+
+
+ARCHIVE_SECURITY = JobKind(
+    name="archive_security",
+    count=_count_archive_security,
+    stages=(
+        ("proposals", _reject_proposals),
+        ("balances", _delete_step(
+            "Баланс депозитарного счёта", "ID баланса депозитарного счёта", "ID ценной бумаги", "security_id"
+        )),
+        ("prices", _delete_step("История цены", "ID зап. ист. цены", "ID ценной бумаги", "security_id")),
+    ),
+    profile=MONEY_MOVEMENT,
+    tables=("security", "price_history"),
+)
+
+
+# ---- Архивация валюты ----
+
+async def _count_archive_currency(db: AsyncSession, params: dict) -> int:
+    result = await db.execute(
+        text('SELECT count(*) FROM "Курсы валют" WHERE "ID валюты" = :currency_id'),
+        {"currency_id": params["currency_id"]}
+    )
+    return result.scalar_one()
+
+
+ARCHIVE_CURRENCY = JobKind(
+    name="archive_currency",
+    count=_count_archive_currency,
+    stages=(
+        ("rates", _delete_step("Курсы валют", "ID записи курса", "ID валюты", "currency_id")),
+    ),
+    profile=INTERACTIVE_WRITE,
+    tables=("currency", "currency_rate"),
+)
+
+
+JOB_KINDS = {kind.name: kind for kind in (ARCHIVE_SECURITY, ARCHIVE_CURRENCY)}
+
+
+# ---- Очередь ----
+
+# Ставит задачу в транзакции вызывающего кода: задача появится (и воркеры
+# проснутся по NOTIFY) только после его коммита
+async def enqueue(db: AsyncSession, kind: str, params: dict, employee_id: Optional[int] = None) -> int:
+    result = await db.execute(
+        text("""
+            INSERT INTO "Фоновая задача" ("Тип", "Параметры", "ID сотрудника")
+            VALUES (:kind, CAST(:params AS jsonb), :employee_id)
+            RETURNING "ID задачи"
+        """),
+        {"kind": JOB_KINDS[kind].name, "params": json.dumps(params), "employee_id": employee_id}
+    )
+    job_id = result.scalar_one()
+    await db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": JOBS_CHANNEL, "payload": str(job_id)})
+    metrics.increment("jobs_enqueued", kind)
+    return job_id
+
+
+_JOB_COLUMNS = """
+    "ID задачи" AS id,
+    "Тип" AS kind,
+    "Параметры"::text AS params,
+    "Статус" AS status,
+    "Этап" AS stage,
+    "Обработано" AS processed,
+    "Всего" AS total,
+    "Попытка" AS attempt,
+    "Ошибка" AS error,
+    "ID сотрудника" AS employee_id,
+    "Создана" AS created_at,
+    "Начата" AS started_at,
+    "Завершена" AS finished_at
+"""
+
+
+def _job_dict(row: Row) -> dict:
+    job = dict(row._mapping)
+    job["params"] = json.loads(job["params"])
+    if job["status"] == JOB_DONE:
+        job["progress"] = 100
+    elif job["total"]:
+        job["progress"] = min(99, job["processed"] * 100 // job["total"])
+    else:
+        job["progress"] = 0
+    return job
+
+
+async def get_job(db: AsyncSession, job_id: int) -> Optional[dict]:
+    result = await db.execute(
+        text(f'SELECT {_JOB_COLUMNS} FROM "Фоновая задача" WHERE "ID задачи" = :job_id'),
+        {"job_id": job_id}
+    )
+    row = result.first()
+    return _job_dict(row) if row is not None else None
+
+
+async def list_jobs(db: AsyncSession, status: Optional[str], limit: int) -> list[dict]:
+    result = await db.execute(
+        text(f"""
+            SELECT {_JOB_COLUMNS}
+            FROM "Фоновая задача"
+            WHERE CAST(:status AS varchar) IS NULL OR "Статус" = :status
+            ORDER BY "ID задачи" DESC
+            LIMIT :limit
+        """),
+        {"status": status, "limit": limit}
+    )
+    return [_job_dict(row) for row in result]
+
+
+# Повторный запуск упавшей задачи с сохранённого этапа и курсора
+async def retry_job(db: AsyncSession, job_id: int) -> bool:
+    result = await db.execute(
+        text("""
+            UPDATE "Фоновая задача"
+            SET "Статус" = 'queued', "Ошибка" = NULL, "Завершена" = NULL
+            WHERE "ID задачи" = :job_id AND "Статус" = 'failed'
+            RETURNING "ID задачи"
+        """),
+        {"job_id": job_id}
+    )
+    if result.scalar() is None:
+        return False
+    await db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": JOBS_CHANNEL, "payload": str(job_id)})
+    return True
+
+
+# Свободная задача или задача, воркер которой перестал обновлять пульс
+_claim_query = text("""
+    UPDATE "Фоновая задача" j
+    SET "Статус" = 'running',
+        "Попытка" = j."Попытка" + 1,
+        "Начата" = COALESCE(j."Начата", now()),
+        "Пульс" = now(),
+        "Ошибка" = NULL
+    WHERE j."ID задачи" = (
+        SELECT "ID задачи"
+        FROM "Фоновая задача"
+        WHERE "Статус" = 'queued'
+           OR ("Статус" = 'running' AND "Пульс" < now() - make_interval(secs => :stale_timeout))
+        ORDER BY "ID задачи"
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING j."ID задачи" AS id, j."Тип" AS kind, j."Параметры"::text AS params,
+              j."Этап" AS stage, j."Курсор" AS cursor, j."Попытка" AS attempt
+""")
+
+# Изменения задачи проверяют попытку: воркер, у которого задачу забрали,
+# ничего не запишет (и откатит свою порцию)
+_save_query = text("""
+    UPDATE "Фоновая задача"
+    SET "Этап" = :stage,
+        "Курсор" = :cursor,
+        "Обработано" = "Обработано" + :processed,
+        "Всего" = COALESCE(:total, "Всего"),
+        "Пульс" = now()
+    WHERE "ID задачи" = :job_id AND "Попытка" = :attempt AND "Статус" = 'running'
+""")
+
+_finish_query = text("""
+    UPDATE "Фоновая задача"
+    SET "Статус" = :status,
+        "Ошибка" = :error,
+        "Пульс" = now(),
+        "Завершена" = CASE WHEN :status = 'queued' THEN NULL ELSE now() END
+    WHERE "ID задачи" = :job_id AND "Попытка" = :attempt AND "Статус" = 'running'
+""")
+
+
+async def _claim() -> Optional[Row]:
+    async with AsyncSessionLocal() as db:
+        await apply_transaction_profile(db, INTERACTIVE_WRITE)
+        result = await db.execute(_claim_query, {"stale_timeout": JOB_STALE_TIMEOUT})
+        job = result.first()
+        await db.commit()
+        return job
+
+
+async def _save(db: AsyncSession, job: Row, stage: str, cursor: Optional[int], processed: int,
+                total: Optional[int] = None) -> None:
+    result = await db.execute(_save_query, {
+        "job_id": job.id,
+        "attempt": job.attempt,
+        "stage": stage,
+        "cursor": cursor,
+        "processed": processed,
+        "total": total,
+    })
+    if result.rowcount == 0:
+        raise _JobLost()
+
+
+async def _finish(job: Row, status: str, error: Optional[str] = None) -> None:
+    async with AsyncSessionLocal() as db:
+        await apply_transaction_profile(db, INTERACTIVE_WRITE)
+        await db.execute(_finish_query, {"job_id": job.id, "attempt": job.attempt, "status": status, "error": error})
+        await db.commit()
+
+
+# Одна транзакция задачи: порция работы и сохранение прогресса. Ошибки
+# сериализации и взаимные блокировки повторяются, как в retry_transaction.
+async def _transaction(db: AsyncSession, job: Row, work: Callable[[], Awaitable[Optional[int]]]) -> Optional[int]:
+    attempt = 1
+    while True:
+        try:
+            result = await work()
+            await db.commit()
+            return result
+        except Exception as e:
+            await db.rollback()
+            if not is_retryable(e) or attempt >= TRANSACTION_RETRY_ATTEMPTS:
+                raise
+            metrics.increment("transaction_retries", f"job.{job.kind}")
+            delay = min(TRANSACTION_RETRY_MAX_DELAY, TRANSACTION_RETRY_BASE_DELAY * 2 ** attempt)
+            await asyncio.sleep(random.uniform(0, delay))
+            attempt += 1
+
+
+async def _execute(job: Row, kind: JobKind) -> None:
+    params = json.loads(job.params)
+    stage_names = [name for name, _ in kind.stages]
+    stage, cursor = job.stage, job.cursor
+
+    async with AsyncSessionLocal() as db:
+        await apply_transaction_profile(db, kind.profile)
+
+        if stage is None:
+            async def start() -> None:
+                total = await kind.count(db, params)
+                await _save(db, job, stage_names[0], None, 0, total)
+
+            await _transaction(db, job, start)
+            stage = stage_names[0]
+
+        for index in range(stage_names.index(stage), len(kind.stages)):
+            name, step = kind.stages[index]
+            next_stage = stage_names[index + 1] if index + 1 < len(stage_names) else None
+
+            async def chunk() -> Optional[int]:
+                processed, next_cursor = await step(db, params, cursor)
+                if next_cursor is None and next_stage is not None:
+                    await _save(db, job, next_stage, None, processed)
+                else:
+                    await _save(db, job, name, next_cursor, processed)
+                return next_cursor
+
+            # Курсор двигаем только после коммита порции
+            while True:
+                cursor = await _transaction(db, job, chunk)
+                if cursor is None:
+                    break
+
+
+async def _run(job: Row) -> None:
+    kind = JOB_KINDS.get(job.kind)
+    if kind is None:
+        await _finish(job, JOB_FAILED, f"Неизвестный тип задачи: {job.kind}")
+        return
+
+    try:
+        await _execute(job, kind)
+    except _JobLost:
+        metrics.increment("jobs_lost", job.kind)
+        return
+    except asyncio.CancelledError:
+        # Остановка процесса: возвращаем задачу в очередь, прогресс сохранён
+        await _finish(job, JOB_QUEUED)
+        raise
+    except JobError as e:
+        metrics.increment("jobs_failed", job.kind)
+        await _finish(job, JOB_FAILED, str(e))
+        return
+    except Exception as e:
+        metrics.increment("jobs_failed", job.kind)
+        await _finish(job, JOB_FAILED, f"Ошибка выполнения задачи: {e}")
+        return
+
+    await _finish(job, JOB_DONE)
+    metrics.increment("jobs_done", job.kind)
+    await cache.invalidate(*kind.tables)
+
+
+# Воркеры процесса: забирают задачи, пока они есть, затем ждут NOTIFY
+# о новой задаче или JOB_POLL_INTERVAL (задачи упавших воркеров, потерянные
+# уведомления)
+class JobRunner:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def _wait(self) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await _claim()
+            except Exception:
+                # БД недоступна - попробуем на следующем опросе
+                metrics.increment("job_claim_errors", "jobs")
+                job = None
+            if job is None:
+                await self._wait()
+                continue
+            metrics.increment("jobs_started", job.kind)
+            try:
+                await _run(job)
+            except Exception:
+                # Не удалось записать итог: задачу заберут после JOB_STALE_TIMEOUT
+                metrics.increment("job_finish_errors", job.kind)
+
+
+job_runner = JobRunner(JOB_WORKERS)
+
+
+async def _on_job_enqueued(payload: str) -> None:
+    job_runner.wake()
+
+
+async def _on_jobs_reconnect() -> None:
+    job_runner.wake()
+
+
+notification_listener.subscribe(JOBS_CHANNEL, _on_job_enqueued, _on_jobs_reconnect)
@@ -241,6 +241,10 @@ class Proposal(Base):
         default=1,
     )
 
+    claimed_by_id = Column("ID брокера", Integer, nullable=True)
+    lease_expires_at = Column("Аренда до", TIMESTAMP(timezone=True), nullable=True)
+    limit_price = Column("Лимитная цена", Numeric(12, 2), nullable=True)
+
     brokerage_account = relationship(
         "BrokerageAccount",
         backref="proposals",
@@ -329,6 +333,8 @@ class Passport(Base):
     issued_by = Column("Кем выдан", String(50), nullable=False)
     is_actual = Column("Актуальность", Boolean, nullable=False)
     user_id = Column("ID пользователя", Integer, ForeignKey("Пользователь.ID пользователя", ondelete="CASCADE", onupdate="CASCADE"), nullable=False)
+    claimed_by_id = Column("ID верификатора", Integer, nullable=True)
+    lease_expires_at = Column("Аренда до", TIMESTAMP(timezone=True), nullable=True)
 
     user = relationship("User", backref="passports")
 
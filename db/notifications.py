@@ -0,0 +1,130 @@
+# db/notifications.py
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from core import cache, metrics, versions
+from core.config import (
+    DATABASE_URL, DATA_CHANGES_CHANNEL, LISTENER_RECONNECT_BASE_DELAY, LISTENER_RECONNECT_MAX_DELAY,
+    LISTENER_KEEPALIVE_INTERVAL
+)
+from db.session import AsyncSessionLocal
+
+# Таблицы с триггером trg_notify_data_change (ключи из core.config.TABLES)
+NOTIFIED_TABLES = ("price_history", "security", "currency", "currency_rate", "bank", "user", "staff")
+
+# handler(payload) вызывается на каждое уведомление канала
+NotificationHandler = Callable[[str], Awaitable[None]]
+# вызывается после каждого (пере)подключения: уведомления за разрыв потеряны
+ReconnectHandler = Callable[[], Awaitable[None]]
+
+
+# Одно отдельное от пула соединение asyncpg на воркер с LISTEN на все
+# зарегистрированные каналы. После потери соединения переподключается.
+class NotificationListener:
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._handlers: dict[str, NotificationHandler] = {}
+        self._reconnect_handlers: list[ReconnectHandler] = []
+        self._task: Optional[asyncio.Task] = None
+        self._pending: set[asyncio.Task] = set()
+
+    def subscribe(self, channel: str, handler: NotificationHandler,
+                  on_reconnect: Optional[ReconnectHandler] = None) -> None:
+        self._handlers[channel] = handler
+        if on_reconnect is not None:
+            self._reconnect_handlers.append(on_reconnect)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _on_notification(self, connection, pid, channel, payload: str) -> None:
+        metrics.increment("notifications_received", channel)
+        # Обработчик asyncpg синхронный - сам обработчик выполняем отдельной задачей
+        task = asyncio.create_task(self._handlers[channel](payload))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _listen(self, connection: asyncpg.Connection) -> None:
+        connection_lost = asyncio.Event()
+        connection.add_termination_listener(lambda _: connection_lost.set())
+        for channel in self._handlers:
+            await connection.add_listener(channel, self._on_notification)
+        for handler in self._reconnect_handlers:
+            await handler()
+
+        while not connection_lost.is_set():
+            try:
+                await asyncio.wait_for(connection_lost.wait(), LISTENER_KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                # Полуоткрытое TCP-соединение само не закроется - проверяем его
+                await connection.execute("SELECT 1", timeout=LISTENER_KEEPALIVE_INTERVAL)
+
+    async def _run(self) -> None:
+        delay = LISTENER_RECONNECT_BASE_DELAY
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                delay = LISTENER_RECONNECT_BASE_DELAY
+                await self._listen(connection)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                pass
+            finally:
+                if connection is not None:
+                    connection.terminate()
+
+            metrics.increment("listener_reconnects", "notifications")
+            await asyncio.sleep(delay)
+            delay = min(LISTENER_RECONNECT_MAX_DELAY, delay * 2)
+
+
+notification_listener = NotificationListener(
+    make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+)
+
+
+# Текущие версии всех таблиц из последовательностей data_version_*
+_versions_query = text(" UNION ALL ".join(
+    f"SELECT '{table}' AS table_key, CASE WHEN is_called THEN last_value ELSE 0 END AS version "
+    f"FROM public.data_version_{table}"
+    for table in versions.VERSIONED_TABLES
+))
+
+
+# Изменение справочной таблицы: версия (ETag) из уведомления и сброс тегов
+# кэша в каждом воркере, в том числе в том, что сделал запись.
+# Полезная нагрузка - "<ключ таблицы>:<версия>".
+async def _on_data_change(payload: str) -> None:
+    table, _, version = payload.partition(":")
+    metrics.increment("data_change_notifications", table)
+    if table in versions.VERSIONED_TABLES and version:
+        versions.set_version(table, int(version))
+    await cache.invalidate(table)
+
+
+# Уведомления за время разрыва потеряны: версии перечитываются из БД
+async def _on_data_reconnect() -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(_versions_query)
+            for table, version in result:
+                versions.set_version(table, version)
+    except Exception:
+        metrics.increment("data_version_load_errors", "notifications")
+    await cache.invalidate(*NOTIFIED_TABLES)
+
+
+notification_listener.subscribe(DATA_CHANGES_CHANNEL, _on_data_change, _on_data_reconnect)
@@ -0,0 +1,22 @@
+# db/projections.py
+from typing import Any
+
+from sqlalchemy import inspect, select, Select
+from sqlalchemy.engine import Result
+
+
+# Чтение списков без ORM-сущностей: select() явных колонок возвращает
+# кортежи, без identity map, отслеживания изменений и загрузчиков связей
+
+def entity_columns(model) -> list:
+    # Все колонки модели под именами атрибутов (id, name, ...), а не БД
+    return [getattr(model, prop.key) for prop in inspect(model).column_attrs]
+
+
+def select_columns(model) -> Select:
+    return select(*entity_columns(model))
+
+
+def rows_as_dicts(result: Result) -> list[dict[str, Any]]:
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
@@ -0,0 +1,50 @@
+# db/retry.py
+import asyncio
+import functools
+import random
+
+from fastapi import HTTPException
+from sqlalchemy.exc import DBAPIError
+from starlette import status
+
+from core import metrics
+from core.config import TRANSACTION_RETRY_ATTEMPTS, TRANSACTION_RETRY_BASE_DELAY, TRANSACTION_RETRY_MAX_DELAY
+from db.errors import get_sqlstate, SERIALIZATION_FAILURE, DEADLOCK_DETECTED
+
+RETRYABLE_SQLSTATES = {SERIALIZATION_FAILURE, DEADLOCK_DETECTED}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    return isinstance(exc, DBAPIError) and get_sqlstate(exc) in RETRYABLE_SQLSTATES
+
+
+# Повторяет endpoint целиком при ошибках сериализации и взаимных блокировках.
+# Endpoint должен получать сессию как параметр `db` и пробрасывать такие ошибки
+# (см. is_retryable), а не превращать их в HTTPException.
+def retry_transaction(endpoint):
+    route = f"{endpoint.__module__.rsplit('.', 1)[-1]}.{endpoint.__name__}"
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        db = kwargs["db"]
+        attempt = 1
+        while True:
+            try:
+                return await endpoint(*args, **kwargs)
+            except DBAPIError as e:
+                if not is_retryable(e):
+                    raise
+                await db.rollback()
+                if attempt >= TRANSACTION_RETRY_ATTEMPTS:
+                    metrics.increment("transaction_retries_exhausted", route)
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="Произошла конфликтная операция. Попробуйте позже."
+                    )
+                metrics.increment("transaction_retries", route)
+                # Экспоненциальная задержка с полным джиттером
+                delay = min(TRANSACTION_RETRY_MAX_DELAY, TRANSACTION_RETRY_BASE_DELAY * 2 ** attempt)
+                await asyncio.sleep(random.uniform(0, delay))
+                attempt += 1
+
+    return wrapper
@@ -0,0 +1,123 @@
+# db/transactions.py
+from fastapi import Depends, Request
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .cancellation import cancel_on_disconnect
+from .session import engine, get_db
+
+
+class TransactionProfile(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    name: str
+    isolation_level: str = "READ COMMITTED"
+    read_only: bool = False
+    deferrable: bool = False
+    statement_timeout_ms: int = 5000
+    lock_timeout_ms: int = 2000
+    # Отменять запросы к БД, если клиент закрыл соединение
+    cancel_on_disconnect: bool = False
+
+
+# Короткие чтения: списки, справочники, карточки
+INTERACTIVE_READ = TransactionProfile(
+    name="interactive_read",
+    read_only=True,
+    statement_timeout_ms=5000,
+    lock_timeout_ms=1000,
+)
+# Обычные записи (справочники, банки, сотрудники)
+INTERACTIVE_WRITE = TransactionProfile(
+    name="interactive_write",
+    statement_timeout_ms=5000,
+    lock_timeout_ms=2000,
+)
+# Движение денег и бумаг: конфликты 40001 повторяет db.retry.retry_transaction
+MONEY_MOVEMENT = TransactionProfile(
+    name="money_movement",
+    isolation_level="SERIALIZABLE",
+    statement_timeout_ms=10000,
+    lock_timeout_ms=3000,
+)
+# Отчёты: согласованный снимок без блокировок, длинный таймаут
+REPORT = TransactionProfile(
+    name="report",
+    isolation_level="SERIALIZABLE",
+    read_only=True,
+    deferrable=True,
+    statement_timeout_ms=120000,
+    lock_timeout_ms=5000,
+    cancel_on_disconnect=True,
+)
+# Массовые загрузки: одна транзакция на файл, длинный таймаут
+BULK_WRITE = TransactionProfile(
+    name="bulk_write",
+    statement_timeout_ms=300000,
+    lock_timeout_ms=5000,
+)
+
+# Копии engine с опциями профиля (общий пул соединений)
+_profile_engines = {}
+
+
+def _get_profile_engine(profile: TransactionProfile):
+    if profile not in _profile_engines:
+        _profile_engines[profile] = engine.execution_options(
+            isolation_level=profile.isolation_level,
+            postgresql_readonly=profile.read_only,
+            postgresql_deferrable=profile.deferrable,
+        )
+    return _profile_engines[profile]
+
+
+@event.listens_for(Session, "after_begin")
+def _set_transaction_timeouts(session, transaction, connection):
+    profile = session.info.get("transaction_profile")
+    if profile is None:
+        return
+    connection.execute(
+        text("""
+            SELECT set_config('statement_timeout', :statement_timeout, true),
+                   set_config('lock_timeout', :lock_timeout, true)
+        """),
+        {
+            "statement_timeout": f"{profile.statement_timeout_ms}ms",
+            "lock_timeout": f"{profile.lock_timeout_ms}ms",
+        }
+    )
+
+
+def transaction_profile(profile: TransactionProfile):
+    def decorator(endpoint):
+        endpoint.transaction_profile = profile
+        return endpoint
+    return decorator
+
+
+async def apply_transaction_profile(db: AsyncSession, profile: TransactionProfile) -> None:
+    # Уровень изоляции и READ ONLY задаются только при открытии транзакции,
+    # поэтому профиль действует на все следующие транзакции этой сессии
+    if db.in_transaction():
+        await db.rollback()
+    db.sync_session.bind = _get_profile_engine(profile).sync_engine
+    db.info["transaction_profile"] = profile
+
+
+# Зависимость уровня роутера. Должна стоять первой в dependencies, чтобы
+# проверка токена уже выполнялась внутри транзакции с нужным профилем.
+# Подключается с Depends(..., scope="function"): выход из зависимости сразу
+# после endpoint'а, и отмена по отключению клиента не задевает отправку ответа.
+def use_transaction_profiles(default: TransactionProfile):
+    async def dependency(request: Request, db: AsyncSession = Depends(get_db)):
+        endpoint = request.scope.get("endpoint")
+        profile = getattr(endpoint, "transaction_profile", default)
+        await apply_transaction_profile(db, profile)
+        if not profile.cancel_on_disconnect:
+            yield
+            return
+        async with cancel_on_disconnect(request, db):
+            yield
+    return dependency
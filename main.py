@@ -1,18 +1,45 @@
 # main.py
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from core.config import *
+from core.responses import ORJSONResponse
+from db.cancellation import ClientDisconnected
+from db.jobs import job_runner
+from db.notifications import notification_listener
 from routers.admin_router import admin_router
 from routers.broker_router import broker_router
 from routers.charts_router import charts_router
 from routers.public_router import public_router
 from routers.staff_router import staff_router
+from routers.stream_router import stream_router
 from routers.user_router import user_router
 from routers.verifier_router import verifier_router
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # LISTEN на изменения данных и push-события - одно соединение на воркер
+    notification_listener.start()
+    # Воркеры фоновых задач (архивация): забирают задачи из общей таблицы
+    job_runner.start()
+    yield
+    await job_runner.stop()
+    await notification_listener.stop()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+
+# Клиент уже отключился, ответ никто не прочитает (499 - как в nginx)
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    return Response(status_code=499)
+
+
 app.include_router(user_router)
 app.include_router(charts_router)
 app.include_router(staff_router)
@@ -20,6 +47,7 @@ app.include_router(admin_router)
 app.include_router(broker_router)
 app.include_router(verifier_router)
 app.include_router(public_router)
+app.include_router(stream_router)
 
 # Разрешаем React dev сервер
 app.add_middleware(
@@ -3,17 +3,30 @@ from datetime import date
 from decimal import Decimal
 from typing import Optional, List
 
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from sqlalchemy import text, select
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from pydantic import BaseModel, Field, TypeAdapter, field_validator
+from sqlalchemy import text, select, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from core.config import MEGAADMIN_EMPLOYEE_ROLE, ADMIN_EMPLOYEE_ROLE
+from core import metrics, versions
+from core.config import MEGAADMIN_EMPLOYEE_ROLE, ADMIN_EMPLOYEE_ROLE, BULK_MAX_SECURITIES
+from core.admission import use_admission, admission_class, INTERACTIVE, BULK
+from core.responses import dumps
+from core.stale import serve_with_fallback
 from db.auth import get_current_user, get_password_hash
+from db.bulk import BulkRejects, upload_format
+from db.imports import IMPORTS, finish_import
+from db.errors import get_constraint_name
+from db.jobs import enqueue, get_job, list_jobs, retry_job
+from db.projections import select_columns, rows_as_dicts
 from db.models import Staff, UserRestrictionStatus, VerificationStatus, Bank, EmploymentStatus, AdminRightsLevel
+from db.retry import retry_transaction, is_retryable
 from db.session import get_db
+from db.transactions import (
+    use_transaction_profiles, transaction_profile, INTERACTIVE_READ, INTERACTIVE_WRITE, MONEY_MOVEMENT, BULK_WRITE
+)
 
 
 async def verify_admin_role(current_user: dict = Depends(get_current_user)):
@@ -27,7 +40,7 @@ async def verify_admin_role(current_user: dict = Depends(get_current_user)):
 admin_router = APIRouter(
     prefix="/api/admin",
     tags=["Admin API router"],
-    dependencies=[Depends(verify_admin_role)],
+    dependencies=[Depends(use_admission(INTERACTIVE)), Depends(use_transaction_profiles(INTERACTIVE_WRITE), scope="function"), Depends(verify_admin_role)],
 )
 
 class StaffCreate(BaseModel):
@@ -68,6 +81,13 @@ class CurrencyResponse(BaseModel):
     class Config:
         from_attributes = True
 
+_currencies_adapter = TypeAdapter(List[CurrencyResponse])
+
+# Тикер и ISIN хранятся в верхнем регистре - так их ищут пакетный листинг
+# и загрузка цен (db.imports)
+def _normalize_code(value: Optional[str]) -> Optional[str]:
+    return value.strip().upper() if value is not None else None
+
 
 class StockCreate(BaseModel):
     ticker: str
@@ -76,12 +96,22 @@ class StockCreate(BaseModel):
     price: Decimal
     currency_id: int
 
+    @field_validator("ticker", "isin")
+    @classmethod
+    def normalize_codes(cls, v):
+        return _normalize_code(v)
+
 class StockUpdateRequest(BaseModel):
     ticker: Optional[str] = None
     isin: Optional[str] = None
     lot_size: Optional[int] = None
     price: Optional[float] = None
 
+    @field_validator("ticker", "isin")
+    @classmethod
+    def normalize_codes(cls, v):
+        return _normalize_code(v)
+
 @admin_router.post("/banks", status_code=status.HTTP_201_CREATED)
 async def create_bank(
     bank_data: BankCreateRequest,
@@ -233,22 +263,32 @@ async def delete_bank(
         )
 
 @admin_router.get("/currencies", response_model=List[CurrencyResponse])
+@transaction_profile(INTERACTIVE_READ)
 async def get_currencies(
+    request: Request,
     db: AsyncSession = Depends(get_db),
 ):
-    query = text('SELECT * FROM get_currencies_info()')
-    result = await db.execute(query)
-    rows = result.fetchall()
-
-    currencies = [CurrencyResponse(
-        id=row[0],
-        code=row[1],
-        symbol=row[2],
-        archived=row[3],
-        rate_to_ruble=float(row[4]))
-        for row in rows
-    ]
-    return currencies
+    etag = versions.get_etag("currency", "currency_rate")
+    cached = versions.not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    async def load_currencies(session: AsyncSession) -> bytes:
+        query = text('SELECT * FROM get_currencies_info()')
+        result = await session.execute(query)
+        rows = result.fetchall()
+
+        currencies = [CurrencyResponse(
+            id=row[0],
+            code=row[1],
+            symbol=row[2],
+            archived=row[3],
+            rate_to_ruble=float(row[4]))
+            for row in rows
+        ]
+        return _currencies_adapter.dump_json(currencies)
+
+    return await serve_with_fallback("get_currencies", {}, load_currencies, db, etag)
 
 @admin_router.post("/currencies")
 async def add_currency(
@@ -306,6 +346,7 @@ async def add_currency(
 
 
 @admin_router.put("/currencies/{currency_id}")
+@retry_transaction
 async def update_currency(
     currency_id: int,
     body: dict,
@@ -359,13 +400,16 @@ async def update_currency(
         raise
     except Exception as e:
         await db.rollback()
+        if is_retryable(e):
+            raise
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка обновления валюты: {e}"
         )
 
 
-@admin_router.post("/archive_currency/{currency_id}")
+@admin_router.post("/archive_currency/{currency_id}", status_code=status.HTTP_202_ACCEPTED)
+@retry_transaction
 async def archive_currency(
     currency_id: int,
     db: AsyncSession = Depends(get_db),
@@ -394,15 +438,20 @@ async def archive_currency(
                 detail=error_message
             )
 
+        # Курсы удаляет фоновая задача порциями
+        job_id = await enqueue(db, "archive_currency", {"currency_id": currency_id}, current_user["id"])
         await db.commit()
         return {
-            "message": f"Валюта с ID {currency_id} успешно архивирована"
+            "message": f"Валюта с ID {currency_id} архивирована, удаление курсов поставлено в очередь",
+            "job_id": job_id
         }
 
     except HTTPException:
         raise
     except Exception as e:
         await db.rollback()
+        if is_retryable(e):
+            raise
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка архивации валюты: {e}"
@@ -473,7 +522,130 @@ async def create_stock(
         await db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Внутренняя ошибка сервера: {exc}")
 
+
+_stock_batch_cte = """
+    WITH batch AS (
+        SELECT *
+        FROM unnest(
+            CAST(:tickers AS text[]),
+            CAST(:isins AS text[]),
+            CAST(:lot_sizes AS numeric[]),
+            CAST(:prices AS numeric[]),
+            CAST(:currency_ids AS integer[])
+        ) WITH ORDINALITY AS b(ticker, isin, lot_size, price, currency_id, idx)
+    )
+"""
+
+# Те же правила, что у add_security и триггера trg_validate_security,
+# одной выборкой на весь пакет
+_validate_stocks_query = text(_stock_batch_cte + """
+    SELECT idx, error
+    FROM (
+        SELECT
+            b.idx,
+            CASE
+                WHEN NOT is_valid_isin(b.isin) THEN format('Некорректный формат ISIN: %s', b.isin)
+                WHEN b.ticker !~ '^[A-Z]+$' THEN 'Тикер должен содержать только латинские буквы'
+                WHEN b.lot_size <= 0 THEN 'Размер лота должен быть больше нуля'
+                WHEN b.price <= 0 THEN 'Цена должна быть больше нуля'
+                WHEN c."ID валюты" IS NULL THEN format('Валюта с ID %s не найдена', b.currency_id)
+                WHEN existing_isin.isin IS NOT NULL THEN format('Ценная бумага с ISIN %s уже существует', b.isin)
+                WHEN existing_ticker.ticker IS NOT NULL THEN format('Ценная бумага с тикером %s уже существует', b.ticker)
+                WHEN count(*) OVER (PARTITION BY b.isin) > 1 THEN 'ISIN повторяется в запросе'
+                WHEN count(*) OVER (PARTITION BY b.ticker) > 1 THEN 'Тикер повторяется в запросе'
+            END AS error
+        FROM batch b
+        LEFT JOIN "Список валют" c
+            ON c."ID валюты" = b.currency_id
+        LEFT JOIN (
+            SELECT DISTINCT "ISIN" AS isin FROM "Список ценных бумаг"
+        ) existing_isin ON existing_isin.isin = b.isin
+        LEFT JOIN (
+            SELECT DISTINCT "Наименование" AS ticker FROM "Список ценных бумаг" WHERE NOT "Статус архивации"
+        ) existing_ticker ON existing_ticker.ticker = b.ticker
+    ) checked
+    WHERE error IS NOT NULL
+    ORDER BY idx
+""")
+
+# Бумаги, начальные цены и нулевые балансы всех депозитарных счетов -
+# по одному INSERT на таблицу в одном операторе
+_insert_stocks_query = text(_stock_batch_cte + """
+    , inserted AS (
+        INSERT INTO "Список ценных бумаг" ("Наименование", "Размер лота", "ISIN", "ID валюты")
+        SELECT ticker, lot_size, isin, currency_id
+        FROM batch
+        ORDER BY idx
+        RETURNING "ID ценной бумаги" AS id, "ISIN" AS isin
+    ), prices AS (
+        INSERT INTO "История цены" ("Дата", "Цена", "ID ценной бумаги")
+        SELECT CURRENT_DATE, b.price, i.id
+        FROM inserted i
+        JOIN batch b ON b.isin = i.isin
+    ), balances AS (
+        INSERT INTO "Баланс депозитарного счёта" (
+            "Сумма", "ID депозитарного счёта", "ID пользователя", "ID ценной бумаги"
+        )
+        SELECT 0.00, d."ID депозитарного счёта", d."ID пользователя", i.id
+        FROM inserted i
+        CROSS JOIN "Депозитарный счёт" d
+    )
+    SELECT i.id, b.ticker, i.isin
+    FROM inserted i
+    JOIN batch b ON b.isin = i.isin
+    ORDER BY b.idx
+""")
+
+
+class StockBulkCreate(BaseModel):
+    stocks: List[StockCreate] = Field(..., min_length=1, max_length=BULK_MAX_SECURITIES)
+
+
+# Листинг пакета бумаг: всё или ничего. При ошибках - 400 со списком
+# ошибок по индексам в stocks, ничего не создаётся.
+@admin_router.post("/exchange/stocks/bulk", status_code=status.HTTP_201_CREATED)
+@admission_class(BULK)
+@transaction_profile(BULK_WRITE)
+@retry_transaction
+async def create_stocks_bulk(
+    data: StockBulkCreate,
+    db: AsyncSession = Depends(get_db),
+):
+    params = {
+        "tickers": [stock.ticker for stock in data.stocks],
+        "isins": [stock.isin for stock in data.stocks],
+        "lot_sizes": [Decimal(stock.lot_size) for stock in data.stocks],
+        "prices": [stock.price for stock in data.stocks],
+        "currency_ids": [stock.currency_id for stock in data.stocks],
+    }
+    try:
+        result = await db.execute(_validate_stocks_query, params)
+        errors = [{"index": idx - 1, "error": error} for idx, error in result]
+        if errors:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"message": "Пакет не создан: есть ошибки", "errors": errors}
+            )
+
+        result = await db.execute(_insert_stocks_query, params)
+        created = [{"id": id_, "ticker": ticker, "isin": isin} for id_, ticker, isin in result]
+        await db.commit()
+
+        return {"created": created}
+
+    except HTTPException:
+        raise
+    except Exception as exc:
+        await db.rollback()
+        if is_retryable(exc):
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Внутренняя ошибка сервера при создании бумаг: {exc}"
+        )
+
 @admin_router.put("/exchange/stocks/{stock_id}")
+@retry_transaction
 async def update_stock(
     stock_id: int,
     stock_data: StockUpdateRequest,
@@ -531,12 +703,16 @@ async def update_stock(
         raise
     except Exception as exc:
         await db.rollback()
+        if is_retryable(exc):
+            raise
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Внутренняя ошибка сервера при обновлении ценной бумаги: {exc}"
         )
 
-@admin_router.post("/exchange/stocks/{stock_id}/archive")
+@admin_router.post("/exchange/stocks/{stock_id}/archive", status_code=status.HTTP_202_ACCEPTED)
+@transaction_profile(MONEY_MOVEMENT)
+@retry_transaction
 async def archive_stock(
     stock_id: int,
     current_user: dict = Depends(get_current_user),
@@ -557,102 +733,153 @@ async def archive_stock(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=error_message
             )
+        # Бумага уже недоступна для торговли; предложения, балансы и историю
+        # цены обрабатывает фоновая задача порциями
+        job_id = await enqueue(
+            db, "archive_security", {"security_id": stock_id, "employee_id": current_user["id"]}, current_user["id"]
+        )
         await db.commit()
-        return {"message": "Ценная бумага успешно архивирована"}
+        return {
+            "message": "Ценная бумага архивирована, отклонение предложений и очистка поставлены в очередь",
+            "job_id": job_id
+        }
     except HTTPException:
         raise
     except Exception as e:
         await db.rollback()
+        if is_retryable(e):
+            raise
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка сервера при архивации: {e}"
         )
 
 
+# Загрузка файлом: CSV с заголовком или NDJSON (Content-Type text/csv или
+# application/x-ndjson). Повтор запроса не делаем: тело уже прочитано в COPY.
+async def _bulk_import(kind: str, request: Request, db: AsyncSession) -> dict:
+    load, table = IMPORTS[kind]
+    fmt = upload_format(request)
+    try:
+        report = await load(db, request.stream(), fmt, BulkRejects())
+        await db.commit()
+    except HTTPException:
+        raise
+    except Exception as exc:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка сервера при загрузке файла: {exc}"
+        )
+
+    await finish_import(table)
+    return report
+
+
+# История цен: isin,date,price
+@admin_router.post("/exchange/prices/bulk")
+@admission_class(BULK)
+@transaction_profile(BULK_WRITE)
+async def import_prices(
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    return await _bulk_import("prices", request, db)
+
+
+# Курсы к рублю: code,date,rate (то же можно загрузить командой
+# python -m db.imports rates <файл>)
+@admin_router.post("/currencies/rates/bulk")
+@admission_class(BULK)
+@transaction_profile(BULK_WRITE)
+async def import_currency_rates(
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    return await _bulk_import("rates", request, db)
+
+
+# Перенос клиентов из другой системы: login,email,password_hash[,registration_date],
+# пароль - готовый bcrypt-хеш. Коммит частями по BULK_USER_CHUNK_SIZE, ход
+# загрузки - метрика bulk_rows_imported{user} в /metrics. Файл отказов
+# целиком пишет командная строка: python -m db.imports users <файл> --rejects <csv>
+@admin_router.post("/users/bulk")
+@admission_class(BULK)
+@transaction_profile(BULK_WRITE)
+async def import_users(
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    return await _bulk_import("users", request, db)
+
 @admin_router.put("/staff/{staff_id}")
 async def update_staff(
         staff_id: int,
         data: StaffUpdate,
         db: AsyncSession = Depends(get_db)
 ):
-    # Получаем сотрудника
-    result = await db.execute(
-        select(Staff).where(Staff.id == staff_id)
-    )
-    staff = result.scalar_one_or_none()
-
-    if not staff:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Сотрудник не найден"
-        )
-    if data.login is not None and data.login != staff.login:
-        result_login = await db.execute(
-            select(Staff).where(Staff.login == data.login, Staff.id != staff_id)
-        )
-        if result_login.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Логин уже занят"
-            )
-    if data.contract_number is not None and data.contract_number != staff.contract_number:
-        result_contract = await db.execute(
-            select(Staff).where(
-                Staff.contract_number == data.contract_number,
-                Staff.id != staff_id
-            )
-        )
-        if result_contract.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Номер трудового договора '{data.contract_number}' уже используется другим сотрудником"
-            )
-
     try:
+        values = {}
         if data.login is not None:
-            staff.login = data.login
+            values["login"] = data.login
 
         if data.password is not None and data.password != "":
-            staff.password = get_password_hash(data.password)
+            values["password"] = get_password_hash(data.password)
 
         if data.contract_number is not None:
-            staff.contract_number = data.contract_number
+            values["contract_number"] = data.contract_number
 
         if data.rights_level is not None:
             # Обновляем ID уровня прав (целое число)
-            staff.rights_level_id = int(data.rights_level)
+            values["rights_level_id"] = int(data.rights_level)
 
         if data.employment_status_id is not None:
-            staff.employment_status_id = data.employment_status_id
+            values["employment_status_id"] = data.employment_status_id
+
+        if values:
+            result = await db.execute(
+                update(Staff)
+                .where(Staff.id == staff_id)
+                .values(**values)
+                .returning(Staff.id)
+                .execution_options(synchronize_session=False)
+            )
+        else:
+            result = await db.execute(select(Staff.id).where(Staff.id == staff_id))
+        updated_id = result.scalar_one_or_none()
+
+        if updated_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Сотрудник не найден"
+            )
 
         await db.commit()
-        await db.refresh(staff)
 
         return {
-            "id": staff.id,
+            "id": updated_id,
             "message": "Сотрудник успешно обновлён"
         }
 
-    except IntegrityError as e:
+    except HTTPException:
         await db.rollback()
+        raise
 
-        error_msg = str(e).lower()
+    except IntegrityError as e:
+        await db.rollback()
 
-        if "номер трудового договора" in error_msg or "персонал_номер трудового догово_key" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Номер трудового договора '{data.contract_number}' уже используется другим сотрудником"
-            )
-        elif "логин" in error_msg or "персонал_логин_key" in error_msg:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Логин '{data.login}' уже используется другим сотрудником"
-            )
+        constraint_name = get_constraint_name(e)
+        if constraint_name == "Персонал_Номер трудового догово_key":
+            detail = f"Номер трудового договора '{data.contract_number}' уже используется другим сотрудником"
+        elif constraint_name == "Персонал_Логин_key":
+            detail = "Логин уже занят"
+        elif constraint_name == "Relationship56":
+            detail = "Неверный уровень прав"
+        elif constraint_name == "Relationship34":
+            detail = "Неверный статус трудоустройства"
         else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Ошибка сохранения данных. Проверьте уникальность вводимых значений."
-            )
+            detail = "Ошибка сохранения данных. Проверьте уникальность вводимых значений."
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
 
     except Exception as e:
         await db.rollback()
@@ -727,42 +954,116 @@ async def register_staff(
         )
 
 @admin_router.get("/rights_levels")
+@transaction_profile(INTERACTIVE_READ)
 async def get_rights_levels(
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(select(AdminRightsLevel).order_by(AdminRightsLevel.id))
-    levels = result.scalars().all()
-    return levels
+    async def load(session: AsyncSession) -> bytes:
+        result = await session.execute(select_columns(AdminRightsLevel).order_by(AdminRightsLevel.id))
+        return dumps(rows_as_dicts(result))
+
+    return await serve_with_fallback("get_rights_levels", {}, load, db)
 
 
 @admin_router.get("/employment_statuses")
+@transaction_profile(INTERACTIVE_READ)
 async def get_employment_statuses(
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(select(EmploymentStatus).order_by(EmploymentStatus.id))
-    statuses = result.scalars().all()
-    return statuses
+    async def load(session: AsyncSession) -> bytes:
+        result = await session.execute(select_columns(EmploymentStatus).order_by(EmploymentStatus.id))
+        return dumps(rows_as_dicts(result))
+
+    return await serve_with_fallback("get_employment_statuses", {}, load, db)
 
 @admin_router.get("/verification_statuses")
+@transaction_profile(INTERACTIVE_READ)
 async def get_verification_statuses(
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(select(VerificationStatus).order_by(VerificationStatus.id))
-    statuses = result.scalars().all()
-    return statuses
+    async def load(session: AsyncSession) -> bytes:
+        result = await session.execute(select_columns(VerificationStatus).order_by(VerificationStatus.id))
+        return dumps(rows_as_dicts(result))
+
+    return await serve_with_fallback("get_verification_statuses", {}, load, db)
 
 @admin_router.get("/user_block_statuses")
+@transaction_profile(INTERACTIVE_READ)
 async def get_user_block_statuses(
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(select(UserRestrictionStatus).order_by(UserRestrictionStatus.id))
-    statuses = result.scalars().all()
-    return statuses
+    async def load(session: AsyncSession) -> bytes:
+        result = await session.execute(select_columns(UserRestrictionStatus).order_by(UserRestrictionStatus.id))
+        return dumps(rows_as_dicts(result))
+
+    return await serve_with_fallback("get_user_block_statuses", {}, load, db)
 
 @admin_router.get("/banks")
+@transaction_profile(INTERACTIVE_READ)
 async def get_banks(
+    request: Request,
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(select(Bank).order_by(Bank.id))
-    banks = result.scalars().all()
-    return banks
\ No newline at end of file
+    etag = versions.get_etag("bank")
+    cached = versions.not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    async def load_banks(session: AsyncSession) -> bytes:
+        result = await session.execute(select_columns(Bank).order_by(Bank.id))
+        return dumps(rows_as_dicts(result))
+
+    return await serve_with_fallback("get_banks", {}, load_banks, db, etag)
+
+@admin_router.get("/jobs")
+@transaction_profile(INTERACTIVE_READ)
+async def get_jobs(
+    status_filter: Optional[str] = Query(None, alias="status", pattern="^(queued|running|done|failed)$"),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    return await list_jobs(db, status_filter, limit)
+
+
+@admin_router.get("/jobs/{job_id}")
+@transaction_profile(INTERACTIVE_READ)
+async def get_job_status(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+):
+    job = await get_job(db, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Задача с ID {job_id} не найдена"
+        )
+    return job
+
+
+# Продолжает упавшую задачу с последней сохранённой порции
+@admin_router.post("/jobs/{job_id}/retry", status_code=status.HTTP_202_ACCEPTED)
+async def retry_failed_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+):
+    try:
+        if not await retry_job(db, job_id):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Задача с ID {job_id} не найдена или не завершилась ошибкой"
+            )
+        await db.commit()
+        return {"message": "Задача снова поставлена в очередь", "job_id": job_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка перезапуска задачи: {e}"
+        )
+
+@admin_router.get("/metrics")
+@transaction_profile(INTERACTIVE_READ)
+async def get_metrics():
+    return metrics.snapshot()
@@ -1,15 +1,21 @@
 # routers/broker_router.py
-from fastapi import APIRouter, Path, Depends, HTTPException
+from fastapi import APIRouter, Path, Depends, HTTPException, Query
 from pydantic import BaseModel
 from sqlalchemy import text, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from starlette import status
 
-from core.config import BROKER_EMPLOYEE_ROLE
+from core.config import BROKER_EMPLOYEE_ROLE, PROPOSAL_STATUS_ACTIVE_ID, PROPOSAL_CLAIM_LEASE, PROPOSAL_CLAIM_MAX
+from core.admission import use_admission, admission_class, TRADING, INTERACTIVE
+from core.responses import ORJSONResponse
 from db.auth import get_current_user
-from db.models import Proposal
+from db.models import Proposal, ProposalType, Security
+from db.retry import retry_transaction, is_retryable
 from db.session import get_db
+from db.transactions import (
+    use_transaction_profiles, transaction_profile, INTERACTIVE_READ, INTERACTIVE_WRITE, MONEY_MOVEMENT
+)
 
 async def verify_broker_role(current_user: dict = Depends(get_current_user)):
     if (current_user["type"] == "client") or (current_user["role"] != BROKER_EMPLOYEE_ROLE):
@@ -22,30 +28,53 @@ async def verify_broker_role(current_user: dict = Depends(get_current_user)):
 broker_router = APIRouter(
     prefix="/api/broker",
     tags=["Broker API router"],
-    dependencies=[Depends(verify_broker_role)]
+    dependencies=[Depends(use_admission(INTERACTIVE)), Depends(use_transaction_profiles(INTERACTIVE_READ), scope="function"), Depends(verify_broker_role)]
 )
 
 class ProcessProposalRequest(BaseModel):
     verify: bool
 
+def _staff_id(current_user: dict) -> int:
+    staff_id = current_user.get("payload", {}).get("staff_id")
+    if not staff_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Не удалось определить ID сотрудника из токена"
+        )
+    return staff_id
+
 @broker_router.patch("/proposal/{proposal_id}/process")
+@admission_class(TRADING)
+@transaction_profile(MONEY_MOVEMENT)
+@retry_transaction
 async def process_proposal(
     proposal_id: int = Path(..., gt=0, description="ID предложения"),
     request_data: ProcessProposalRequest | None = None,
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    payload = current_user.get("payload", {})
-    staff_id = payload.get("staff_id")
-    if not staff_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Не удалось определить ID сотрудника из токена"
-        )
-
+    staff_id = _staff_id(current_user)
     verify = request_data.verify if request_data else False
 
     try:
+        # Предложение в действующей аренде другого брокера не обрабатываем:
+        # он уже работает с ним (см. claim_proposals)
+        result = await db.execute(
+            text("""
+                SELECT "ID брокера"
+                FROM "Предложение"
+                WHERE "ID предложения" = :proposal_id
+                  AND "Аренда до" > now()
+                  AND "ID брокера" <> :staff_id
+            """),
+            {"proposal_id": proposal_id, "staff_id": staff_id}
+        )
+        if result.first() is not None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Заявка №{proposal_id} уже взята в работу другим брокером"
+            )
+
         result = await db.execute(
             text("""
                 SELECT public.process_proposal(
@@ -91,45 +120,174 @@ async def process_proposal(
         raise
     except Exception as e:
         await db.rollback()
+        if is_retryable(e):
+            raise
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Внутренняя ошибка сервера при обработке заявки: {e}"
         )
 
+# Очередь работы брокеров: каждый получает следующие свободные активные
+# предложения в аренду на PROPOSAL_CLAIM_LEASE секунд. SKIP LOCKED
+# пропускает строки, которые прямо сейчас захватывает другой брокер, - без
+# ожидания блокировок и без выдачи одного предложения двоим. Истёкшая аренда
+# свободна, свои предложения выдаются повторно с продлённой арендой.
+_claim_proposals_query = text("""
+    WITH claimable AS (
+        SELECT p."ID предложения", p."ID брокерского счёта"
+        FROM "Предложение" p
+        WHERE p."ID статуса предложения" = :active_status_id
+          AND (p."Аренда до" IS NULL OR p."Аренда до" <= now() OR p."ID брокера" = :staff_id)
+        ORDER BY p."ID предложения"
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ),
+    claimed AS (
+        UPDATE "Предложение" p
+        SET "ID брокера" = :staff_id,
+            "Аренда до" = now() + make_interval(secs => :lease)
+        FROM claimable c
+        WHERE p."ID предложения" = c."ID предложения"
+          AND p."ID брокерского счёта" = c."ID брокерского счёта"
+        RETURNING p.*
+    )
+    SELECT
+        c."ID предложения" AS id,
+        c."Сумма" AS amount,
+        t."ID типа предложения" AS type_id,
+        t."Тип" AS type_name,
+        s."ID ценной бумаги" AS security_id,
+        s."Наименование" AS security_name,
+        c."ID брокерского счёта" AS account_id,
+        c."Аренда до" AS lease_expires_at
+    FROM claimed c
+    JOIN "Тип предложения" t ON t."ID типа предложения" = c."ID типа предложения"
+    JOIN "Список ценных бумаг" s ON s."ID ценной бумаги" = c."ID ценной бумаги"
+    ORDER BY c."ID предложения"
+""")
+
+
+@broker_router.post("/proposal/claim")
+@admission_class(TRADING)
+@transaction_profile(INTERACTIVE_WRITE)
+async def claim_proposals(
+    limit: int = Query(10, ge=1, le=PROPOSAL_CLAIM_MAX),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    staff_id = _staff_id(current_user)
+    try:
+        result = await db.execute(
+            _claim_proposals_query,
+            {
+                "staff_id": staff_id,
+                "active_status_id": PROPOSAL_STATUS_ACTIVE_ID,
+                "limit": limit,
+                "lease": PROPOSAL_CLAIM_LEASE
+            }
+        )
+        rows = result.all()
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Внутренняя ошибка сервера при получении заявок: {e}"
+        )
+
+    return ORJSONResponse([
+        {
+            "id": row.id,
+            "amount": row.amount,
+            "proposal_type": {
+                "id": row.type_id,
+                "type": row.type_name
+            },
+            "security": {
+                "id": row.security_id,
+                "name": row.security_name
+            },
+            "account": row.account_id,
+            "lease_expires_at": row.lease_expires_at,
+        }
+        for row in rows
+    ])
+
+
+# Вернуть предложение в очередь до истечения аренды
+@broker_router.post("/proposal/{proposal_id}/release")
+@admission_class(TRADING)
+@transaction_profile(INTERACTIVE_WRITE)
+async def release_proposal(
+    proposal_id: int = Path(..., gt=0, description="ID предложения"),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    staff_id = _staff_id(current_user)
+    try:
+        result = await db.execute(
+            text("""
+                UPDATE "Предложение"
+                SET "ID брокера" = NULL, "Аренда до" = NULL
+                WHERE "ID предложения" = :proposal_id
+                  AND "ID брокера" = :staff_id
+                  AND "Аренда до" > now()
+            """),
+            {"proposal_id": proposal_id, "staff_id": staff_id}
+        )
+        if result.rowcount == 0:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Заявка №{proposal_id} не арендована вами"
+            )
+        await db.commit()
+        return {"message": f"Заявка №{proposal_id} возвращена в очередь", "proposal_id": proposal_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Внутренняя ошибка сервера при возврате заявки: {e}"
+        )
+
 @broker_router.get("/proposal")
 async def get_all_proposals(
         db: AsyncSession = Depends(get_db),
 ):
+    # Только нужные колонки кортежами: без сущностей и selectinload связей
     result = await db.execute(
-        select(Proposal)
-        .options(
-            selectinload(Proposal.security),
-            selectinload(Proposal.proposal_type)
+        select(
+            Proposal.id,
+            Proposal.amount,
+            ProposalType.id,
+            ProposalType.type,
+            Security.id,
+            Security.name,
+            Proposal.brokerage_account_id
         )
+        .join(ProposalType, ProposalType.id == Proposal.proposal_type_id)
+        .join(Security, Security.id == Proposal.security_id)
         .order_by(Proposal.id.desc())
     )
 
-    proposals = result.scalars().all()
-    if not proposals:
-        return []
-
-    return [
+    return ORJSONResponse([
         {
-            "id": proposal.id,
-            "amount": float(proposal.amount),
+            "id": proposal_id,
+            "amount": amount,
             "proposal_type": {
-                "id": proposal.proposal_type.id,
-                "type": proposal.proposal_type.type
+                "id": type_id,
+                "type": type_name
             },
 
             "security": {
-                "id": proposal.security.id,
-                "name": proposal.security.name
+                "id": security_id,
+                "name": security_name
             },
-            "account": proposal.brokerage_account_id,
+            "account": account_id,
         }
-        for proposal in proposals
-    ]
+        for proposal_id, amount, type_id, type_name, security_id, security_name, account_id in result
+    ])
 
 @broker_router.get("/proposal/{proposal_id}")
 async def get_proposal_detail(
@@ -149,9 +307,9 @@ async def get_proposal_detail(
     if not proposal:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Предложение не найдено")
 
-    return {
+    return ORJSONResponse({
         "id": proposal.id,
-        "amount": float(proposal.amount),
+        "amount": proposal.amount,
         "proposal_type": {
             "id": proposal.proposal_type.id,
             "type": proposal.proposal_type.type
@@ -162,4 +320,4 @@ async def get_proposal_detail(
             "name": proposal.security.name
         },
         "account": proposal.brokerage_account_id,
-    }
\ No newline at end of file
+    })
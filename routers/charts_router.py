@@ -2,16 +2,20 @@
 from decimal import Decimal
 
 from fastapi import APIRouter, Depends
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.admission import use_admission, REPORTING
+from core.responses import model_response
 from db.auth import get_current_user
 from db.session import get_db
+from db.transactions import use_transaction_profiles, REPORT
 
 charts_router = APIRouter(
     prefix='/charts',
-    tags=['Charts API router']
+    tags=['Charts API router'],
+    dependencies=[Depends(use_admission(REPORTING)), Depends(use_transaction_profiles(REPORT), scope="function")],
 )
 
 class DepositaryBalanceChartItem(BaseModel):
@@ -21,6 +25,8 @@ class DepositaryBalanceChartItem(BaseModel):
     class Config:
         from_attributes = True
 
+_balance_chart_adapter = TypeAdapter(list[DepositaryBalanceChartItem])
+
 @charts_router.get(
     "/depositary-balance",
     response_model=list[DepositaryBalanceChartItem]
@@ -46,10 +52,7 @@ async def get_depositary_balance_chart(
 
     result = await db.execute(query, {"user_id": user_id})
 
-    return [
-        DepositaryBalanceChartItem(**row)
-        for row in result.mappings().all()
-    ]
+    return model_response(_balance_chart_adapter, result.all())
 
 
 class DepositaryOperationsChartItem(BaseModel):
@@ -61,6 +64,8 @@ class DepositaryOperationsChartItem(BaseModel):
     class Config:
         from_attributes = True
 
+_operations_chart_adapter = TypeAdapter(list[DepositaryOperationsChartItem])
+
 
 @charts_router.get(
     "/depositary-operations",
@@ -90,7 +95,4 @@ async def get_depositary_operations_chart(
 
     result = await db.execute(query)
 
-    return [
-        dict(row._mapping)
-        for row in result.all()
-    ]
\ No newline at end of file
+    return model_response(_operations_chart_adapter, result.all())
\ No newline at end of file
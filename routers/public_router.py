@@ -2,19 +2,26 @@
 from decimal import Decimal
 from typing import List
 
-from fastapi import Depends, HTTPException, APIRouter
-from pydantic import BaseModel, EmailStr, field_validator
-from sqlalchemy import text, select
+from fastapi import Depends, HTTPException, APIRouter, Request
+from pydantic import BaseModel, EmailStr, TypeAdapter, field_validator
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 from core.config import EMPLOYMENT_STATUS_ID_BLOCKED, USER_BAN_STATUS_ID, TABLES
+from core import versions
+from core.admission import use_admission, admission_class, INTERACTIVE, HASHING, REPORTING
+from core.responses import dumps
+from core.stale import serve_with_fallback
 from db.auth import get_password_hash, authenticate_staff, create_access_token, authenticate_user, get_current_user
+from db.projections import select_columns, rows_as_dicts
 from db.session import get_db
+from db.transactions import use_transaction_profiles, transaction_profile, INTERACTIVE_READ, INTERACTIVE_WRITE, REPORT
 
 public_router = APIRouter(
     prefix="/api/public",
-    tags=["Public API router"]
+    tags=["Public API router"],
+    dependencies=[Depends(use_admission(INTERACTIVE)), Depends(use_transaction_profiles(INTERACTIVE_READ), scope="function")],
 )
 
 class UserRegisterRequest(BaseModel):
@@ -40,7 +47,8 @@ class UserRegisterRequest(BaseModel):
     status_code=status.HTTP_201_CREATED,
     summary="Регистрация пользователя"
 )
-
+@admission_class(HASHING)
+@transaction_profile(INTERACTIVE_WRITE)
 async def register_user(
     form_data: UserRegisterRequest,
     db: AsyncSession = Depends(get_db)
@@ -109,6 +117,7 @@ class LoginRequest(BaseModel):
     response_model=Token,
     summary="Вход пользователя"
 )
+@admission_class(HASHING)
 async def login_user(
         form_data: LoginRequest,
         db: AsyncSession = Depends(get_db)
@@ -148,6 +157,7 @@ async def login_user(
     response_model=Token,
     summary="Вход сотрудника"
 )
+@admission_class(HASHING)
 async def login_staff(
         form_data: LoginRequest,
         db: AsyncSession = Depends(get_db)
@@ -196,12 +206,15 @@ class StockInfoOut(BaseModel):
             Decimal: lambda v: float(v) if v is not None else None
         }
 
+_stocks_adapter = TypeAdapter(List[StockInfoOut])
+
 
 @public_router.get(
     "/exchange/stocks",
     response_model=List[StockInfoOut]
 )
 async def get_stocks(
+        request: Request,
         db: AsyncSession = Depends(get_db),
         current_user: dict = Depends(get_current_user),
 ):
@@ -215,24 +228,49 @@ async def get_stocks(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Доступ запрещён"
         )
-    result = await db.execute(query)
-    rows = result.fetchall()
-    return [dict(row._mapping) for row in rows]
+
+    # Котировки зависят от бумаг, истории цен и валют; сотрудники видят и
+    # архивные бумаги - вид ответа входит в ETag, кэши различают по токену
+    etag = versions.get_etag("security", "price_history", "currency", variant=user_type)
+    cached = versions.not_modified(request, etag)
+    if cached is not None:
+        cached.headers["Vary"] = "Authorization"
+        return cached
+
+    async def load_stocks(session: AsyncSession) -> bytes:
+        result = await session.execute(query)
+        rows = result.mappings().all()
+        return _stocks_adapter.dump_json(_stocks_adapter.validate_python(rows, from_attributes=True))
+
+    response = await serve_with_fallback("get_stocks", {"user_type": user_type}, load_stocks, db, etag)
+    response.headers["Vary"] = "Authorization"
+    return response
 
 
 @public_router.get("/{table_name}")
-async def get_table_data(table_name: str, db: AsyncSession = Depends(get_db)):
+@admission_class(REPORTING)
+@transaction_profile(REPORT)
+async def get_table_data(
+        table_name: str,
+        request: Request,
+        db: AsyncSession = Depends(get_db)
+):
     model = TABLES.get(table_name)
     if not model:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Table '{table_name}' not found in tables: {TABLES}"
         )
-    result = await db.execute(select(model).order_by(model.id))
-    rows = result.scalars().all()
-
-    data = [
-        {k: v for k, v in row.__dict__.items() if k != "_sa_instance_state"}
-        for row in rows
-    ]
-    return data
\ No newline at end of file
+
+    etag = None
+    if table_name in versions.VERSIONED_TABLES:
+        etag = versions.get_etag(table_name)
+        cached = versions.not_modified(request, etag)
+        if cached is not None:
+            return cached
+
+    async def load_table(session: AsyncSession) -> bytes:
+        result = await session.execute(select_columns(model).order_by(model.id))
+        return dumps(rows_as_dicts(result))
+
+    return await serve_with_fallback("get_table_data", {"table_name": table_name}, load_table, db, etag)
\ No newline at end of file
@@ -1,16 +1,30 @@
 # routers/staff_router.py
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import Depends, HTTPException, APIRouter
-from pydantic import field_validator, BaseModel, EmailStr
-from sqlalchemy import select
+from pydantic import field_validator, model_validator, BaseModel, EmailStr, Field
+from sqlalchemy import select, update, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
+from core import cache
+from core.admission import use_admission, INTERACTIVE
+from core.cache import Cache
+from core.config import BULK_MAX_USERS, LOOKUP_CACHE_TTL
 from db.auth import get_current_user, get_password_hash
-from db.models import Staff, UserRestrictionStatus, VerificationStatus, User
+from db.errors import get_constraint_name
+from db.models import Staff, User, VerificationStatus, UserRestrictionStatus
 from db.session import get_db
 
+# Имена ограничений таблицы "Пользователь" -> сообщения для клиента
+USER_CONSTRAINT_ERRORS = {
+    "Пользователь_Логин_key": "Логин уже занят",
+    "Пользователь_Электронная почта_key": "Email уже зарегистрирован",
+    "Relationship4": "Неверный статус верификации",
+    "Relationship55": "Неверный статус блокировки",
+}
+
 class UserUpdate(BaseModel):
     login: Optional[str] = None
     email: Optional[EmailStr] = None
@@ -37,7 +51,7 @@ async def verify_staff_role(current_user: dict = Depends(get_current_user)):
 staff_router = APIRouter(
     prefix="/api/staff",
     tags=["Staff API router"],
-    dependencies=[Depends(verify_staff_role)],
+    dependencies=[Depends(use_admission(INTERACTIVE)), Depends(verify_staff_role)],
 )
 
 @staff_router.get("/{staff_id}")
@@ -68,66 +82,63 @@ async def update_user(
         data: UserUpdate,
         db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Пользователь не найден"
-        )
-    if data.login is not None and data.login.strip() != "" and data.login != user.login:
-        existing_login = await db.execute(
-            select(User).where(User.login == data.login, User.id != user_id)
-        )
-        if existing_login.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Логин уже занят"
-            )
-    if data.email is not None and data.email.strip() != "" and data.email != user.email:
-        existing_email = await db.execute(
-            select(User).where(User.email == data.email, User.id != user_id)
-        )
-        if existing_email.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email уже зарегистрирован"
-            )
-    if data.verification_status_id is not None:
-        result = await db.execute(
-            select(VerificationStatus).where(VerificationStatus.id == data.verification_status_id))
-        if not result.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Неверный статус верификации"
-            )
-
-    if data.block_status_id is not None:
-        result = await db.execute(select(UserRestrictionStatus).where(UserRestrictionStatus.id == data.block_status_id))
-        if not result.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Неверный статус блокировки"
-            )
-
+    values = {}
     if data.login is not None and data.login.strip() != "":
-        user.login = data.login
+        values["login"] = data.login
 
     if data.email is not None and data.email.strip() != "":
-        user.email = data.email
+        values["email"] = data.email
 
     if data.password is not None and data.password.strip() != "":
-        user.password = get_password_hash(data.password)
+        values["password"] = get_password_hash(data.password)
 
     if data.verification_status_id is not None:
-        user.verification_status_id = data.verification_status_id
+        values["verification_status_id"] = data.verification_status_id
 
     if data.block_status_id is not None:
-        user.block_status_id = data.block_status_id
+        values["block_status_id"] = data.block_status_id
+
+    columns = (
+        User.id,
+        User.login,
+        User.email,
+        User.verification_status_id,
+        User.block_status_id,
+        User.registration_date,
+    )
+    try:
+        if values:
+            result = await db.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(**values)
+                .returning(*columns)
+                .execution_options(synchronize_session=False)
+            )
+        else:
+            result = await db.execute(select(*columns).where(User.id == user_id))
+        user = result.first()
+
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Пользователь не найден"
+            )
 
-    await db.commit()
-    await db.refresh(user)
+        await db.commit()
+
+    except HTTPException:
+        await db.rollback()
+        raise
+    except IntegrityError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=USER_CONSTRAINT_ERRORS.get(
+                get_constraint_name(e),
+                "Ошибка сохранения данных. Проверьте уникальность вводимых значений."
+            )
+        )
 
     return {
         "id": user.id,
@@ -137,4 +148,104 @@ async def update_user(
         "block_status_id": user.block_status_id,
         "registration_date": user.registration_date,
         "message": "Пользователь успешно обновлён"
-    }
\ No newline at end of file
+    }
+
+
+class UserBulkUpdate(BaseModel):
+    user_ids: List[int] = Field(..., min_length=1, max_length=BULK_MAX_USERS)
+    verification_status_id: Optional[int] = None
+    block_status_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def validate_change_set(self):
+        if self.verification_status_id is None and self.block_status_id is None:
+            raise ValueError("Нужно указать verification_status_id или block_status_id")
+        return self
+
+
+# Допустимые ID статусов: справочники почти не меняются, проверка
+# пакета не должна каждый раз обращаться к БД
+_lookups = Cache("lookups", ttl=LOOKUP_CACHE_TTL)
+
+
+async def _status_ids(db: AsyncSession, model, tag: str) -> set[int]:
+    async def load() -> list[int]:
+        return list(await db.scalars(select(model.id)))
+
+    return set(await _lookups.get_or_set(tag, load, tags=[tag]))
+
+
+# Одно изменение для всех пользователей одним UPDATE. Результат по каждому
+# ID: updated, unchanged (статусы уже такие) или not_found.
+_bulk_update_users_query = text("""
+    WITH requested AS (
+        SELECT DISTINCT unnest(CAST(:user_ids AS integer[])) AS id
+    ), updated AS (
+        UPDATE "Пользователь" u
+        SET "ID статуса верификации" = COALESCE(CAST(:verification_status_id AS integer), u."ID статуса верификации"),
+            "ID статуса блокировки" = COALESCE(CAST(:block_status_id AS integer), u."ID статуса блокировки")
+        FROM requested r
+        WHERE u."ID пользователя" = r.id
+          AND (
+              u."ID статуса верификации" IS DISTINCT FROM COALESCE(CAST(:verification_status_id AS integer), u."ID статуса верификации")
+              OR u."ID статуса блокировки" IS DISTINCT FROM COALESCE(CAST(:block_status_id AS integer), u."ID статуса блокировки")
+          )
+        RETURNING u."ID пользователя" AS id
+    )
+    SELECT
+        r.id,
+        CASE
+            WHEN upd.id IS NOT NULL THEN 'updated'
+            WHEN u."ID пользователя" IS NOT NULL THEN 'unchanged'
+            ELSE 'not_found'
+        END AS outcome
+    FROM requested r
+    LEFT JOIN updated upd ON upd.id = r.id
+    LEFT JOIN "Пользователь" u ON u."ID пользователя" = r.id
+    ORDER BY r.id
+""")
+
+
+@staff_router.post("/users/bulk")
+async def update_users_bulk(
+        data: UserBulkUpdate,
+        db: AsyncSession = Depends(get_db),
+):
+    if data.verification_status_id is not None and \
+            data.verification_status_id not in await _status_ids(db, VerificationStatus, "verification_status"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=USER_CONSTRAINT_ERRORS["Relationship4"]
+        )
+    if data.block_status_id is not None and \
+            data.block_status_id not in await _status_ids(db, UserRestrictionStatus, "user_restriction_status"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=USER_CONSTRAINT_ERRORS["Relationship55"]
+        )
+
+    try:
+        result = await db.execute(
+            _bulk_update_users_query,
+            {
+                "user_ids": data.user_ids,
+                "verification_status_id": data.verification_status_id,
+                "block_status_id": data.block_status_id,
+            }
+        )
+        outcomes = [{"id": user_id, "outcome": outcome} for user_id, outcome in result]
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка сервера при обновлении пользователей: {e}"
+        )
+
+    # Кэш проверки токенов (db.auth) сбрасывается один раз на весь пакет
+    await cache.invalidate("user")
+
+    return {
+        "updated": sum(1 for item in outcomes if item["outcome"] == "updated"),
+        "results": outcomes,
+    }
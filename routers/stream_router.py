@@ -0,0 +1,95 @@
+# routers/stream_router.py
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Query, WebSocket
+from fastapi.responses import StreamingResponse
+from starlette import status
+
+from core import metrics
+from core.config import PUSH_KEEPALIVE_INTERVAL
+from core.push import push_hub, PRICES_TOPIC, user_topic
+from db.auth import resolve_principal
+from db.session import AsyncSessionLocal
+
+# Поток событий вместо опроса /api/public/exchange/stocks и /api/user/offers:
+#   {"type": "price", "security_id", "price", "date"}
+#   {"type": "proposal_status", "proposal_id", "status_id", "status"} - только владельцу
+#   {"type": "resync"} - события пропущены, данные нужно перезапросить
+# Токен передаётся в query (?token=...), так как браузерные WebSocket
+# и EventSource не умеют задавать заголовок Authorization.
+stream_router = APIRouter(
+    prefix="/api/stream",
+    tags=["Stream API router"],
+)
+
+
+async def _authorize(token: str) -> dict:
+    # Короткая сессия только для проверки токена: поток не держит соединение с БД
+    async with AsyncSessionLocal() as db:
+        return await resolve_principal(token, db)
+
+
+def _topics(principal: dict) -> list[str]:
+    topics = [PRICES_TOPIC]
+    if principal["type"] == "client":
+        topics.append(user_topic(principal["id"]))
+    return topics
+
+
+@stream_router.websocket("/ws")
+async def stream_websocket(websocket: WebSocket, token: str = Query(...)):
+    try:
+        principal = await _authorize(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    subscription = push_hub.subscribe(_topics(principal))
+    metrics.increment("push_connections", "websocket")
+
+    async def send_events():
+        while True:
+            await websocket.send_text(await subscription.queue.get())
+
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    sender = asyncio.create_task(send_events())
+    receiver = asyncio.create_task(wait_disconnect())
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        await asyncio.gather(sender, receiver, return_exceptions=True)
+        push_hub.unsubscribe(subscription)
+        metrics.increment("push_connections", "websocket", -1)
+
+
+# Запасной вариант для клиентов без WebSocket (Server-Sent Events)
+@stream_router.get("/sse")
+async def stream_sse(token: str = Query(...)):
+    principal = await _authorize(token)
+    subscription = push_hub.subscribe(_topics(principal))
+    metrics.increment("push_connections", "sse")
+
+    async def events():
+        try:
+            while True:
+                message = await subscription.get(PUSH_KEEPALIVE_INTERVAL)
+                if message is None:
+                    # Комментарий SSE не даёт прокси закрыть простаивающее соединение
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"data: {message}\n\n"
+        finally:
+            push_hub.unsubscribe(subscription)
+            metrics.increment("push_connections", "sse", -1)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
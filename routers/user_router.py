@@ -1,19 +1,32 @@
 # routers/user_router.py
+import csv
+import io
 import re
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta
 from decimal import Decimal
-from typing import List
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, HTTPException, Depends, Path
-from pydantic import field_validator, Field, BaseModel, ConfigDict
+from fastapi import APIRouter, HTTPException, Depends, Path, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import field_validator, Field, BaseModel, ConfigDict, TypeAdapter
 from sqlalchemy import text, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from core.config import SYSTEM_STAFF_ID, USER_BAN_STATUS_ID, BALANCE_INCREASE_ID, BALANCE_DECREASE_ID
+from core.config import SYSTEM_STAFF_ID, USER_BAN_STATUS_ID, BALANCE_INCREASE_ID, BALANCE_DECREASE_ID, STATEMENT_BATCH_SIZE
+from core import versions
+from core.admission import use_admission, admission_class, TRADING, INTERACTIVE, REPORTING
+from core.responses import dumps, model_response
+from core.stale import serve_with_fallback
 from db.auth import get_current_user
 from db.models import Bank, Currency, Security, BrokerageAccount, User
-from db.session import get_db
+from db.projections import rows_as_dicts
+from db.retry import retry_transaction, is_retryable
+from db.session import get_db, AsyncSessionLocal
+from db.transactions import (
+    use_transaction_profiles, transaction_profile, apply_transaction_profile,
+    INTERACTIVE_READ, INTERACTIVE_WRITE, MONEY_MOVEMENT, REPORT
+)
 
 async def verify_user_role(current_user: dict = Depends(get_current_user)):
     if current_user["type"] != "client":
@@ -26,7 +39,7 @@ async def verify_user_role(current_user: dict = Depends(get_current_user)):
 user_router = APIRouter(
     prefix="/api/user",
     tags=["User API router"],
-    dependencies=[Depends(verify_user_role)],
+    dependencies=[Depends(use_admission(INTERACTIVE)), Depends(use_transaction_profiles(INTERACTIVE_READ), scope="function"), Depends(verify_user_role)],
 )
 
 class DepositaryOperation(BaseModel):
@@ -93,11 +106,15 @@ class SecuritiesResponse(BaseModel):
     class Config:
         from_attributes = True
 
+_portfolio_adapter = TypeAdapter(List[SecuritiesResponse])
+
 class OfferCreate(BaseModel):
     account_id: int
     security_id: int
     quantity: Decimal = Field(..., gt=0, decimal_places=2)
     proposal_type_id: int
+    # Лимитная заявка: исполняется брокером, когда цена дойдёт до лимита
+    limit_price: Optional[Decimal] = Field(None, gt=0, decimal_places=2)
 
 class OfferResponse(BaseModel):
     id: int
@@ -107,6 +124,8 @@ class OfferResponse(BaseModel):
     quantity: float
     proposal_status: int
 
+_offers_adapter = TypeAdapter(List[OfferResponse])
+
 class BrokerageAccountOut(BaseModel):
     account_id: int
     balance: float
@@ -150,6 +169,8 @@ class PassportCreateRequest(BaseModel):
         return v
 
 @user_router.get("/balance/{currency_id}")
+@admission_class(REPORTING)
+@transaction_profile(REPORT)
 async def get_user_balance(
         currency_id: int,
         current_user: dict = Depends(get_current_user),
@@ -176,6 +197,8 @@ async def get_user_balance(
         )
 
 @user_router.delete("/brokerage-accounts/{brokerage_account_id}")
+@transaction_profile(INTERACTIVE_WRITE)
+@retry_transaction
 async def delete_brokerage_account(
         brokerage_account_id: int,
         current_user: dict = Depends(get_current_user),
@@ -216,12 +239,15 @@ async def delete_brokerage_account(
         raise
     except Exception as e:
         await db.rollback()
+        if is_retryable(e):
+            raise
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Внутренняя ошибка сервера при удалении счёта: {e}"
         )
 
 @user_router.post("/brokerage-accounts")
+@transaction_profile(INTERACTIVE_WRITE)
 async def create_brokerage_account(
     account_data: BrokerageAccountCreateRequest,
     current_user: dict = Depends(get_current_user),
@@ -233,7 +259,8 @@ async def create_brokerage_account(
             text("""
                 CALL add_brokerage_account(
                     :user_id, :bank_id, :currency_id, :inn,
-                    :account_id, :error_message
+                    :account_id, :error_message,
+                    :bank_name, :bik, :currency_symbol
                 )
             """),
             {
@@ -242,7 +269,10 @@ async def create_brokerage_account(
                 "currency_id": account_data.currency_id,
                 "inn": inn,
                 "account_id": None,
-                "error_message": None
+                "error_message": None,
+                "bank_name": None,
+                "bik": None,
+                "currency_symbol": None
             }
         )
 
@@ -250,8 +280,11 @@ async def create_brokerage_account(
         if row is None:
             raise Exception("Процедура не вернула результат")
 
-        account_id    = row[0]
-        error_message = row[1]
+        account_id      = row[0]
+        error_message   = row[1]
+        bank_name       = row[2]
+        bik             = row[3]
+        currency_symbol = row[4]
 
         if error_message is not None:
             if "Банк с ID" in error_message:
@@ -273,22 +306,16 @@ async def create_brokerage_account(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=error_message
             )
-        bank_result = await db.execute(select(Bank).where(Bank.id == account_data.bank_id))
-        bank = bank_result.scalar_one()
-
-        currency_result = await db.execute(select(Currency).where(Currency.id == account_data.currency_id))
-        currency = currency_result.scalar_one()
-
         await db.commit()
 
         return {
             "account_id": account_id,
             "balance": 0.0,
-            "bank_id": bank.id,
-            "bank_name": bank.name,
-            "bik": bank.bik,
-            "currency_id": currency.id,
-            "currency_symbol": currency.symbol,
+            "bank_id": account_data.bank_id,
+            "bank_name": bank_name,
+            "bik": bik,
+            "currency_id": account_data.currency_id,
+            "currency_symbol": currency_symbol,
             "user_id": current_user["id"]
         }
 
@@ -302,6 +329,9 @@ async def create_brokerage_account(
         )
 
 @user_router.patch("/proposal/{proposal_id}/cancel")
+@admission_class(TRADING)
+@transaction_profile(MONEY_MOVEMENT)
+@retry_transaction
 async def cancel_proposal(
     proposal_id: int = Path(..., gt=0, description="ID предложения"),
     current_user: dict = Depends(get_current_user),
@@ -317,10 +347,9 @@ async def cancel_proposal(
     try:
         result = await db.execute(
             text("""
-                SELECT public.process_proposal(
+                SELECT public.cancel_proposal(
                     :staff_id,
-                    :proposal_id,
-                    false
+                    :proposal_id
                 )
             """),
             {
@@ -355,12 +384,15 @@ async def cancel_proposal(
         raise
     except Exception as e:
         await db.rollback()
+        if is_retryable(e):
+            raise
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка сервера при отмене заявки: {e}"
         )
 
 @user_router.post("/passport", status_code=status.HTTP_201_CREATED)
+@transaction_profile(INTERACTIVE_WRITE)
 async def create_passport(
     form_data: PassportCreateRequest,
     current_user: dict = Depends(get_current_user),
@@ -423,21 +455,21 @@ async def create_passport(
         ) from e
 
 @user_router.get("/securities")
-async def get_securities(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Security).where(Security.is_archived == False).order_by(Security.name)
-    )
-    securities = result.scalars().all()
+async def get_securities(request: Request, db: AsyncSession = Depends(get_db)):
+    etag = versions.get_etag("security")
+    cached = versions.not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    async def load_securities(session: AsyncSession) -> bytes:
+        result = await session.execute(
+            select(Security.id, Security.name, Security.isin, Security.lot_size)
+            .where(Security.is_archived == False)
+            .order_by(Security.name)
+        )
+        return dumps(rows_as_dicts(result))
 
-    return [
-        {
-            "id": s.id,
-            "name": s.name,
-            "isin": s.isin,
-            "lot_size": float(s.lot_size)
-        }
-        for s in securities
-    ]
+    return await serve_with_fallback("get_securities", {}, load_securities, db, etag)
 
 @user_router.get(
     "/brokerage-accounts",
@@ -468,6 +500,9 @@ async def get_user_brokerage_accounts(
     response_model=OfferResponse,
     status_code=status.HTTP_201_CREATED
 )
+@admission_class(TRADING)
+@transaction_profile(MONEY_MOVEMENT)
+@retry_transaction
 async def create_offer(
     data: OfferCreate,
     db: AsyncSession = Depends(get_db),
@@ -482,7 +517,14 @@ async def create_offer(
                 :account_id,
                 :proposal_type_id,
                 :lot_amount,
-                :error_message
+                :error_message,
+                :proposal_id,
+                :offer_type,
+                :security_name,
+                :security_isin,
+                :quantity,
+                :proposal_status,
+                :limit_price
             )
         """),
         {
@@ -491,7 +533,14 @@ async def create_offer(
             "account_id": data.account_id,
             "proposal_type_id": data.proposal_type_id,
             "lot_amount": data.quantity,
-            "error_message": None
+            "error_message": None,
+            "proposal_id": None,
+            "offer_type": None,
+            "security_name": None,
+            "security_isin": None,
+            "quantity": None,
+            "proposal_status": None,
+            "limit_price": data.limit_price
         }
     )
 
@@ -513,20 +562,22 @@ async def create_offer(
                 detail=error_message
             )
 
-    await db.commit()
-    result = await db.execute(
-        text("SELECT * from get_user_offers(:user_id) LIMIT 1"),
-        {"user_id": user_id}
-    )
-
-    row = result.fetchone()
-    if not row:
+    if row[1] is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Предложение создано, но не найдено"
         )
 
-    return OfferResponse(**row._mapping)
+    await db.commit()
+
+    return OfferResponse(
+        id=row[1],
+        offer_type=row[2],
+        security_name=row[3],
+        security_isin=row[4],
+        quantity=float(row[5]),
+        proposal_status=row[6]
+    )
 
 @user_router.get(
     "/offers",
@@ -543,10 +594,7 @@ async def get_user_offers(
         {"user_id": user_id}
     )
 
-    return [
-        OfferResponse(**row._mapping)
-        for row in result.fetchall()
-    ]
+    return model_response(_offers_adapter, result.all())
 
 @user_router.get(
     "/portfolio/securities",
@@ -560,41 +608,19 @@ async def get_portfolio_securities(
 
     query = text("SELECT * FROM get_user_securities(:user_id) WHERE amount > 0")
     result = await db.execute(query, {"user_id": user_id})
-    securities = result.fetchall()
-
-    return [
-        {
-            "security_name": row.security_name,
-            "lot_size": float(row.lot_size) if row.lot_size is not None else None,
-            "isin": row.isin,
-            "amount": float(row.amount) if row.amount is not None else None,
-            "currency_code": row.currency_code,
-            "currency_symbol": row.currency_symbol,
-        }
-        for row in securities
-    ]
+    return model_response(_portfolio_adapter, result.all())
 
 
 @user_router.post("/brokerage-accounts/{account_id}/balance-change-requests")
+@admission_class(TRADING)
+@transaction_profile(MONEY_MOVEMENT)
+@retry_transaction
 async def create_balance_change_request(
         account_id: int,
         data: BalanceChangeRequestCreate,
         db: AsyncSession = Depends(get_db),
         current_user=Depends(get_current_user),
 ):
-    account = await db.scalar(
-        select(BrokerageAccount)
-        .where(
-            BrokerageAccount.id == account_id,
-            BrokerageAccount.user_id == current_user["id"]
-        )
-    )
-    if not account:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Счёт не найден или не принадлежит вам"
-        )
-
     operation_type = BALANCE_INCREASE_ID if data.amount > 0 else BALANCE_DECREASE_ID
 
     try:
@@ -604,14 +630,16 @@ async def create_balance_change_request(
                     :account_id,
                     :amount,
                     :brokerage_operation_type,
-                    :staff_id
+                    :staff_id,
+                    :user_id
                 )
             """),
             {
                 "account_id": account_id,
                 "amount": data.amount,
                 "brokerage_operation_type": operation_type,
-                "staff_id": SYSTEM_STAFF_ID
+                "staff_id": SYSTEM_STAFF_ID,
+                "user_id": current_user["id"]
             }
         )
 
@@ -620,6 +648,7 @@ async def create_balance_change_request(
             raise Exception("Функция не вернула результат")
         operation_id  = row[0]
         error_message = row[1]
+        new_balance   = row[2]
 
         if error_message:
             error_lower = error_message.lower()
@@ -637,7 +666,7 @@ async def create_balance_change_request(
             elif "счёт" in error_lower and "не найден" in error_lower:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Счёт не найден"
+                    detail="Счёт не найден или не принадлежит вам"
                 )
             else:
                 raise HTTPException(
@@ -645,12 +674,11 @@ async def create_balance_change_request(
                     detail=error_message
                 )
         await db.commit()
-        await db.refresh(account)
 
         return {
             "status": "ok",
             "message": "Баланс успешно изменён",
-            "new_balance": float(account.balance),
+            "new_balance": float(new_balance),
             "operation_id": operation_id
         }
 
@@ -660,12 +688,8 @@ async def create_balance_change_request(
 
     except Exception as e:
         await db.rollback()
-
-        if "could not serialize access" in str(e).lower():
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Произошла конфликтная операция. Попробуйте позже."
-            )
+        if is_retryable(e):
+            raise
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -707,6 +731,8 @@ class DepositaryAccountResponse(BaseModel):
     balance: List[DepositaryBalance]
     operations: List[DepositaryOperation]
 
+_depositary_account_adapter = TypeAdapter(DepositaryAccountResponse)
+
 
 @user_router.get(
     "/depositary_account",
@@ -727,7 +753,7 @@ async def get_depositary_account(
     """)
 
     result = await db.execute(account_query, {"user_id": user_id})
-    account_row = result.mappings().first()
+    account_row = result.first()
 
     if not account_row:
         raise HTTPException(
@@ -735,7 +761,6 @@ async def get_depositary_account(
             detail="Депозитарный счёт не найден"
         )
 
-    account = DepositaryAccount(**account_row)
     balance_query = text("""
         SELECT
             ss."Наименование" AS security_name,
@@ -753,15 +778,12 @@ async def get_depositary_account(
     result_balance = await db.execute(
         balance_query,
         {
-            "account_id": account.id,
+            "account_id": account_row.id,
             "user_id": user_id
         }
     )
+    balance = result_balance.all()
 
-    balance = [
-        DepositaryBalance(**row)
-        for row in result_balance.mappings().all()
-    ]
     operations_query = text("""
         SELECT
             ho."ID операции деп. счёта" AS id,
@@ -784,20 +806,16 @@ async def get_depositary_account(
     result_ops = await db.execute(
         operations_query,
         {
-            "account_id": account.id,
+            "account_id": account_row.id,
             "user_id": user_id
         }
     )
 
-    operations = [
-        DepositaryOperation(**row)
-        for row in result_ops.mappings().all()
-    ]
-    return DepositaryAccountResponse(
-        account=account,
-        balance=balance,
-        operations=operations
-    )
+    return model_response(_depositary_account_adapter, {
+        "account": account_row,
+        "balance": balance,
+        "operations": result_ops.all(),
+    })
 
 class BanStatusOut(BaseModel):
     is_banned: bool
@@ -865,6 +883,145 @@ async def get_brokerage_account_operations(
     return [dict(row._mapping) for row in rows]
 
 
+STATEMENT_COLUMNS = ("section", "account_id", "time", "operation_type", "security", "currency", "amount", "balance")
+
+# Остаток считается оконной функцией по всей истории счёта, а период
+# отсекается снаружи: первая строка выписки уже с верным остатком
+_brokerage_statement_query = text("""
+    SELECT 'brokerage' AS section, account_id, time, operation_type,
+           NULL AS security, currency, amount, balance
+    FROM (
+        SELECT
+            h."ID брокерского счёта"  AS account_id,
+            h."ID операции бр. счёта" AS operation_id,
+            h."Время"                 AS time,
+            t."Тип"                   AS operation_type,
+            c."Символ"                AS currency,
+            h."Сумма операции"        AS amount,
+            SUM(h."Сумма операции") OVER (
+                PARTITION BY h."ID брокерского счёта"
+                ORDER BY h."Время", h."ID операции бр. счёта"
+            ) AS balance
+        FROM "История операций бр. счёта" h
+        JOIN "Брокерский счёт" b
+            ON b."ID брокерского счёта" = h."ID брокерского счёта"
+        JOIN "Тип операции брокерского счёта" t
+            ON t."ID типа операции бр. счёта" = h."ID типа операции бр. счёта"
+        JOIN "Список валют" c
+            ON c."ID валюты" = b."ID валюты"
+        WHERE b."ID пользователя" = :user_id
+    ) ops
+    WHERE time >= :time_from AND time < :time_to
+      AND operation_type != 'Empty'
+    ORDER BY account_id, time, operation_id
+""")
+
+# Сумма операции депозитарного счёта всегда положительна, направление
+# задаёт тип: продажа и заморозка уменьшают свободный остаток бумаги
+_depositary_statement_query = text("""
+    SELECT 'depositary' AS section, account_id, time, operation_type,
+           security, NULL AS currency, amount, balance
+    FROM (
+        SELECT
+            h."ID депозитарного счёта"  AS account_id,
+            h."ID операции деп. счёта" AS operation_id,
+            h."Время"                  AS time,
+            t."Тип"                    AS operation_type,
+            s."Наименование"           AS security,
+            h."Сумма операции"         AS amount,
+            SUM(
+                CASE WHEN t."Тип" IN ('Продажа', 'Заморозка ЦБ')
+                     THEN -h."Сумма операции"
+                     ELSE h."Сумма операции"
+                END
+            ) OVER (
+                PARTITION BY h."ID ценной бумаги"
+                ORDER BY h."Время", h."ID операции деп. счёта"
+            ) AS balance
+        FROM "История операций деп. счёта" h
+        JOIN "Тип операции депозитарного счёта" t
+            ON t."ID типа операции деп. счёта" = h."ID типа операции деп. счёта"
+        JOIN "Список ценных бумаг" s
+            ON s."ID ценной бумаги" = h."ID ценной бумаги"
+        WHERE h."ID пользователя" = :user_id
+    ) ops
+    WHERE time >= :time_from AND time < :time_to
+    ORDER BY security, time, operation_id
+""")
+
+
+def _csv_chunk(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in row
+        )
+    return buffer.getvalue().encode("utf-8")
+
+
+def _ndjson_chunk(rows) -> bytes:
+    return b"".join(dumps(dict(zip(STATEMENT_COLUMNS, row))) + b"\n" for row in rows)
+
+
+async def _stream_statement(user_id: int, params: dict, fmt: str):
+    encode = _csv_chunk if fmt == "csv" else _ndjson_chunk
+    if fmt == "csv":
+        yield _csv_chunk([STATEMENT_COLUMNS])
+
+    # Своя сессия: соединение запроса к этому моменту уже возвращено в пул.
+    # Обе выборки идут в одной транзакции REPORT (SERIALIZABLE READ ONLY
+    # DEFERRABLE) - брокерская и депозитарная части из одного снимка.
+    async with AsyncSessionLocal() as session:
+        await apply_transaction_profile(session, REPORT)
+        async with session.begin():
+            for query in (_brokerage_statement_query, _depositary_statement_query):
+                # Серверный курсор: в памяти не больше одной пачки строк
+                result = await session.stream(
+                    query,
+                    {"user_id": user_id, **params},
+                    execution_options={"yield_per": STATEMENT_BATCH_SIZE}
+                )
+                async for rows in result.partitions():
+                    yield encode(rows)
+
+
+@user_router.get("/statements")
+@admission_class(REPORTING)
+async def get_statement(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    fmt: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    date_from = date_from or date.min
+    date_to = date_to or date.today()
+    if date_from > date_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Дата начала периода позже даты окончания"
+        )
+
+    # Проверка токена уже открыла транзакцию в сессии запроса - закрываем её,
+    # чтобы не держать второе соединение, пока выписка передаётся клиенту
+    await db.rollback()
+
+    params = {
+        "time_from": datetime.combine(date_from, time.min),
+        # Следующего дня после date.max нет - верхняя граница не ограничена
+        "time_to": datetime.max if date_to == date.max else datetime.combine(date_to + timedelta(days=1), time.min),
+    }
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"statement_{date_from.isoformat()}_{date_to.isoformat()}.{fmt}"
+    return StreamingResponse(
+        _stream_statement(current_user["id"], params, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @user_router.get("/brokerage-accounts/{account_id}")
 async def get_brokerage_account(
     account_id: int,
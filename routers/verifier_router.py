@@ -1,11 +1,20 @@
 # routers/verifier_router.py
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
 from sqlalchemy import text, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 from starlette.responses import Response
 
-from core.config import VERIFIER_EMPLOYEE_ROLE
+from core import cache
+from core.config import (
+    VERIFIER_EMPLOYEE_ROLE, VERIFICATION_STATUS_PENDING_ID, PASSPORT_CLAIM_LEASE, PASSPORT_CLAIM_MAX,
+    PASSPORT_QUEUE_PAGE_SIZE, BULK_MAX_PASSPORTS
+)
+from core.admission import use_admission, INTERACTIVE
+from core.responses import ORJSONResponse
 from db.auth import get_current_user
 from db.models import Passport, User
 from db.session import get_db
@@ -21,12 +30,13 @@ async def verify_verifier_role(current_user: dict = Depends(get_current_user)):
 verifier_router = APIRouter(
     prefix="/api/verifier",
     tags=["Verifier API router"],
-    dependencies=[Depends(verify_verifier_role)],
+    dependencies=[Depends(use_admission(INTERACTIVE)), Depends(verify_verifier_role)],
 )
 
 @verifier_router.post("/{user_id}/verify_passport")
 async def call_verify_user_passport(
     user_id: int,
+    current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     passport_result = await db.execute(
@@ -42,13 +52,18 @@ async def call_verify_user_passport(
     passport_id = passport_row[0]
     try:
         result = await db.execute(
-            text("SELECT public.verify_user_passport(:passport_id)"),
-            {"passport_id": passport_id}
+            text("SELECT public.verify_user_passport(:passport_id, :staff_id)"),
+            {"passport_id": passport_id, "staff_id": current_user["id"]}
         )
 
         error_message = result.scalar()
 
         if error_message:
+            if "другим верификатором" in error_message:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=error_message
+                )
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=error_message
@@ -131,4 +146,150 @@ async def get_user_passport(
         "issued_by": passport.issued_by,
         "issue_date": passport.issue_date,
         "registration_place": passport.registration_place,
-    }
\ No newline at end of file
+    }
+
+
+# Очередь паспортов, ожидающих верификации, постранично по ID паспорта
+# (after_id - последний ID предыдущей страницы). Действующая аренда видна,
+# чтобы не открывать паспорта, которые уже проверяет другой верификатор.
+@verifier_router.get("/passports/pending")
+async def get_pending_passports(
+        after_id: int = Query(0, ge=0),
+        limit: int = Query(PASSPORT_QUEUE_PAGE_SIZE, ge=1, le=PASSPORT_QUEUE_PAGE_SIZE),
+        db: AsyncSession = Depends(get_db),
+):
+    result = await db.execute(
+        text("""
+            SELECT
+                ps."ID паспорта" AS id,
+                ps."ID пользователя" AS user_id,
+                ps."Фамилия" AS last_name,
+                ps."Имя" AS first_name,
+                ps."Отчество" AS patronymic,
+                CASE WHEN ps."Аренда до" > now() THEN ps."ID верификатора" END AS claimed_by,
+                CASE WHEN ps."Аренда до" > now() THEN ps."Аренда до" END AS lease_expires_at
+            FROM "Паспорт" ps
+            JOIN "Пользователь" u ON u."ID пользователя" = ps."ID пользователя"
+            WHERE u."ID статуса верификации" = :pending_status_id
+              AND ps."ID паспорта" > :after_id
+            ORDER BY ps."ID паспорта"
+            LIMIT :limit
+        """),
+        {"pending_status_id": VERIFICATION_STATUS_PENDING_ID, "after_id": after_id, "limit": limit}
+    )
+    items = [dict(row._mapping) for row in result]
+
+    return ORJSONResponse({
+        "items": items,
+        "next_after_id": items[-1]["id"] if len(items) == limit else None,
+    })
+
+
+# Следующие свободные паспорта в аренду на PASSPORT_CLAIM_LEASE секунд:
+# SKIP LOCKED не ждёт строк, которые прямо сейчас захватывает другой
+# верификатор; истёкшая аренда свободна, свои паспорта выдаются повторно
+_claim_passports_query = text("""
+    WITH claimable AS (
+        SELECT ps."ID паспорта", ps."ID пользователя"
+        FROM "Паспорт" ps
+        JOIN "Пользователь" u ON u."ID пользователя" = ps."ID пользователя"
+        WHERE u."ID статуса верификации" = :pending_status_id
+          AND (ps."Аренда до" IS NULL OR ps."Аренда до" <= now() OR ps."ID верификатора" = :staff_id)
+        ORDER BY ps."ID паспорта"
+        LIMIT :limit
+        FOR UPDATE OF ps SKIP LOCKED
+    )
+    UPDATE "Паспорт" ps
+    SET "ID верификатора" = :staff_id,
+        "Аренда до" = now() + make_interval(secs => :lease)
+    FROM claimable c
+    WHERE ps."ID паспорта" = c."ID паспорта"
+      AND ps."ID пользователя" = c."ID пользователя"
+    RETURNING
+        ps."ID паспорта" AS id,
+        ps."ID пользователя" AS user_id,
+        ps."Фамилия" AS last_name,
+        ps."Имя" AS first_name,
+        ps."Отчество" AS patronymic,
+        ps."Пол" AS gender,
+        ps."Дата рождения" AS birth_date,
+        ps."Место рождения" AS birth_place,
+        ps."Серия" AS series,
+        ps."Номер" AS number,
+        ps."Кем выдан" AS issued_by,
+        ps."Дата выдачи" AS issue_date,
+        ps."Место прописки" AS registration_place,
+        ps."Аренда до" AS lease_expires_at
+""")
+
+
+@verifier_router.post("/passports/claim")
+async def claim_passports(
+        limit: int = Query(10, ge=1, le=PASSPORT_CLAIM_MAX),
+        current_user: dict = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db),
+):
+    try:
+        result = await db.execute(
+            _claim_passports_query,
+            {
+                "staff_id": current_user["id"],
+                "pending_status_id": VERIFICATION_STATUS_PENDING_ID,
+                "limit": limit,
+                "lease": PASSPORT_CLAIM_LEASE
+            }
+        )
+        passports = sorted((dict(row._mapping) for row in result), key=lambda item: item["id"])
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка сервера при получении паспортов: {e}"
+        )
+
+    return ORJSONResponse(passports)
+
+
+class PassportBulkVerify(BaseModel):
+    passport_ids: List[int] = Field(..., min_length=1, max_length=BULK_MAX_PASSPORTS)
+
+
+# Пакет верифицируется одной транзакцией (verify_user_passports в
+# DB_SCRIPT.sql): отказ по отдельному паспорту не мешает остальным
+@verifier_router.post("/passports/verify")
+async def verify_passports_bulk(
+        data: PassportBulkVerify,
+        current_user: dict = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db),
+):
+    try:
+        result = await db.execute(
+            text("""
+                SELECT passport_id, user_id, error_message
+                FROM public.verify_user_passports(CAST(:passport_ids AS integer[]), :staff_id)
+            """),
+            {"passport_ids": data.passport_ids, "staff_id": current_user["id"]}
+        )
+        results = [
+            {"passport_id": passport_id, "user_id": user_id, "error": error_message}
+            for passport_id, user_id, error_message in result
+        ]
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка сервера при верификации паспортов: {e}"
+        )
+
+    verified = sum(1 for item in results if item["error"] is None)
+    if verified:
+        # Статус верификации пользователей - один сброс на весь пакет
+        await cache.invalidate("user")
+
+    return {
+        "verified": verified,
+        "rejected": len(results) - verified,
+        "results": results,
+    }